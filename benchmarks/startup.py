@@ -0,0 +1,55 @@
+"""
+measure the cold start of the bot, every run is a fresh interpreter that imports the bot
+and creates it with all cogs, without connecting to discord or the database.
+
+    python benchmarks/startup.py --runs 10
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from typing import Tuple
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# runs inside the fresh interpreter, prints the seconds for the import and for creating the bot
+measure = '''
+import time
+start = time.perf_counter()
+import bot
+imported = time.perf_counter()
+from util.config import load_config
+from util.permission import load_permissions
+load_config()
+load_permissions()
+bot.create_bot(*bot.create_services())
+created = time.perf_counter()
+print(imported - start, created - imported)
+'''
+
+
+def run_once() -> Tuple[float, float, float]:
+    """
+    start one interpreter and measure it
+    :return: seconds for the whole process, the import and the bot creation
+    """
+    result = subprocess.run([sys.executable, '-c', measure], cwd=root, check=True,
+                            stdout=subprocess.PIPE, env=dict(os.environ, PYTHONPATH=root))
+    imported, created = (float(value) for value in result.stdout.split())
+    return imported + created, imported, created
+
+
+def main():
+    parser = argparse.ArgumentParser(description='measure the cold start of the bot')
+    parser.add_argument('--runs', type=int, default=10, help='amount of fresh interpreters to start')
+    args = parser.parse_args()
+    samples = [run_once() for _ in range(args.runs)]
+    for index, name in enumerate(['total', 'import', 'create_bot']):
+        values = [sample[index] * 1000 for sample in samples]
+        print(f'{name:<12} min {min(values):8.1f} ms  median {statistics.median(values):8.1f} ms  '
+              f'max {max(values):8.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+compare the storage engines on the same workload: karma gains spread over members and channels,
+leaderboard and profile reads, followed by removing the karma of messages.
+mongo runs against mongomock unless --mongo is set, so it measures the code path and not a server.
+
+    python benchmarks/storage.py --gains 5000 --reads 500
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+from typing import Dict
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+from core.model.member import KarmaMember  # noqa: E402
+from core.service.memory_service import MemoryKarmaStore, MemoryKarmaMemberService, \
+    MemoryKarmaChannelService  # noqa: E402
+from core.service.mongo_service import KarmaMemberService, KarmaChannelService  # noqa: E402
+from core.service.sqlite_service import connect, SqliteKarmaMemberService, SqliteKarmaChannelService  # noqa: E402
+from util.config import load_config  # noqa: E402
+
+
+def create_engine(name: str, use_server: bool):
+    """
+    create the karma and channel service of an engine on an empty database
+    :param name: mongo, memory or sqlite
+    :param use_server: if mongo should use the configured server instead of mongomock
+    :return: karma service and channel service
+    """
+    if name == 'memory':
+        store = MemoryKarmaStore()
+        return MemoryKarmaMemberService(store), MemoryKarmaChannelService(store)
+    if name == 'sqlite':
+        connection, lock = connect(':memory:'), threading.RLock()
+        return SqliteKarmaMemberService(connection, lock), SqliteKarmaChannelService(connection, lock)
+    if use_server:
+        from core import datasource
+        database = datasource.client().get_database('aura_benchmark')
+    else:
+        import mongomock
+        database = mongomock.MongoClient().aura_benchmark
+    for collection in [database.karma, database.karma_totals, database.karma_daily]:
+        collection.drop()
+    return (KarmaMemberService(database.karma, database.karma_totals, database.karma_daily),
+            KarmaChannelService(database.karma, database.karma_totals, database.karma_daily))
+
+
+def run(name: str, gains: int, reads: int, use_server: bool) -> Dict[str, float]:
+    """
+    run the workload on an engine
+    :return: phase to milliseconds per operation
+    """
+    karma_service, channel_service = create_engine(name, use_server)
+    generator = random.Random(1)
+    members = [KarmaMember('1', generator.randrange(200), generator.randrange(10), message_id)
+               for message_id in range(gains)]
+    timings = {}
+
+    start = time.perf_counter()
+    for member in members:
+        karma_service.upsert_karma_member(member)
+    timings['gain'] = (time.perf_counter() - start) / gains
+
+    start = time.perf_counter()
+    for index in range(reads):
+        list(karma_service.aggregate_top_karma_members('1', time_span=7 if index % 2 else 0))
+        karma_service.aggregate_member_profile(members[index % gains])
+        list(karma_service.aggregate_karma_page('1', after=(2, '100')))
+        list(channel_service.aggregate_top_karma_channels('1'))
+    timings['read'] = (time.perf_counter() - start) / reads
+
+    start = time.perf_counter()
+    for member in members[:reads]:
+        karma_service.delete_message_karma('1', member.message_id)
+    timings['remove'] = (time.perf_counter() - start) / reads
+    return {phase: seconds * 1000 for phase, seconds in timings.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='compare the storage engines on the same workload')
+    parser.add_argument('--gains', type=int, default=5000, help='amount of karma gains')
+    parser.add_argument('--reads', type=int, default=500, help='amount of leaderboard and profile reads')
+    parser.add_argument('--engines', nargs='+', default=['memory', 'sqlite', 'mongo'],
+                        choices=['memory', 'sqlite', 'mongo'], help='engines to compare')
+    parser.add_argument('--mongo', action='store_true', help='use the configured mongodb instead of mongomock')
+    args = parser.parse_args()
+    load_config()
+    for name in args.engines:
+        timings = run(name, args.gains, min(args.reads, args.gains), args.mongo)
+        print(f'{name:<8} ' + '  '.join(f'{phase} {value:8.3f} ms/op' for phase, value in timings.items()))
+
+
+if __name__ == '__main__':
+    main()
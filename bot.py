@@ -1,5 +1,7 @@
 import logging
 import sys
+import threading
+import time
 
 from discord.ext import commands
 from discord.ext.commands import when_mentioned_or
@@ -9,51 +11,234 @@ from cogs.general.help import Help, KarmaTutor
 from cogs.general.module import ModuleManager
 from cogs.general.permission import PermissionManager
 from cogs.general.settings import SettingsManager
+from cogs.general.stats import Statistics
 from cogs.karma.leaderboard import KarmaLeaderboard
 from cogs.karma.producer import KarmaProducer
 from cogs.karma.profile import KarmaProfile
 from cogs.karma.reduce import KarmaReducer, KarmaBlocker
-from util.config import config
+from cogs.karma.transfer import KarmaTransfer
+from core import datasource
+from core.cooldown import KarmaCooldowns
+from core.index import ensure_indexes
+from core.service.async_service import executor, AsyncService, AsyncKarmaMemberService, AsyncBlockerService, \
+    AsyncKarmaChannelService
+from core.service.channel_cache import KarmaChannelCache
+from core.service.cooldown_store import CooldownStore
+from core.service.memory_service import MemoryKarmaStore, MemoryKarmaMemberService, MemoryKarmaChannelService, \
+    MemoryBlockerService
+from core.service.message_filter import KarmaMessageFilter
+from core.service.mongo_service import KarmaMemberService, BlockerService, KarmaChannelService
+from core.service.retention import KarmaRetention
+from core.service.sqlite_service import connect, SqliteKarmaMemberService, SqliteKarmaChannelService, \
+    SqliteBlockerService
+from core.service.transfer_service import TransferService
+from core.service.write_buffer import KarmaWriteBuffer
+from util.config import config, load_config
 from util.constants import cog_map
+from util.permission import load_permissions
 
-logging.basicConfig(level=config['logging'],
-                    format='%(asctime)s,%(msecs)d %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s',
-                    datefmt='%Y-%m-%d:%H:%M:%S',
-                    stream=sys.stdout)
+log = logging.getLogger(__name__)
 
-if __name__ == '__main__':
-    client = commands.Bot(command_prefix=when_mentioned_or(config['prefix']))
+
+class AuraBot(commands.Bot):
+    # the bot, runs the close hooks while the connection to discord still exists
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.close_hooks = []  # coroutine functions awaited on close, e.g. to send what is still buffered
+
+    async def close(self) -> None:
+        for hook in self.close_hooks:
+            try:
+                await hook()
+            except Exception as e:
+                log.error(f'Close hook {hook} failed: {e}')
+        await super().close()
+
+
+def setup_logging() -> None:
+    logging.basicConfig(level=config['logging'],
+                        format='%(asctime)s,%(msecs)d %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s',
+                        datefmt='%Y-%m-%d:%H:%M:%S',
+                        stream=sys.stdout)
+
+
+def prepare_database() -> None:
+    """
+    make sure the database can serve the bot, creates missing indexes and the pre-aggregated karma.
+    exits if the expected indexes can't be created.
+    :return: None
+    """
+    # every collection is served by the one shared mongo client
+    karma, karma_totals, karma_daily = datasource.karma(), datasource.karma_totals(), datasource.karma_daily()
+
+    collections = [karma, karma_totals, karma_daily, datasource.blacklist()]
+    if cooldown_store_enabled():
+        collections.append(datasource.cooldowns())
+    # refuse to start without the indexes, every karma query would be a collection scan otherwise
+    if len(ensure_indexes(*collections)) != 0:
+        log.critical('Refusing to start, expected database indexes are missing')
+        sys.exit(1)
+
+    # karma given before the totals and daily buckets existed has to be summed up once
+    startup_karma_service = KarmaMemberService(karma, karma_totals, karma_daily)
+    if karma.estimated_document_count() != 0:
+        if karma_totals.estimated_document_count() == 0:
+            startup_karma_service.rebuild_karma_totals()
+        if karma_daily.estimated_document_count() == 0:
+            startup_karma_service.rebuild_daily_karma()
+
+
+def database_engine() -> str:
+    """
+    the configured storage engine, mongo if none is configured
+    :return: mongo, memory or sqlite
+    """
+    return str(config['database'].get('engine') or 'mongo').lower()
+
+
+def create_services():
+    """
+    create the services shared by all cogs on the configured storage engine,
+    no connection to mongodb is opened until the first query.
+    :return: karma service, blocker service and channel service
+    """
+    # top channels are cached per guild until they expire or karma of the guild changes
+    channel_cache = KarmaChannelCache(int(config['database'].get('channel_cache', {}).get('ttl', 60)))
+    engine = database_engine()
+    if engine == 'memory':
+        store = MemoryKarmaStore()
+        return (AsyncKarmaMemberService(MemoryKarmaMemberService(store, channel_cache)),
+                AsyncBlockerService(MemoryBlockerService(store)),
+                AsyncKarmaChannelService(MemoryKarmaChannelService(store, channel_cache)))
+    if engine == 'sqlite':
+        connection, lock = connect(config['database']['sqlite']['path']), threading.RLock()
+        return (AsyncKarmaMemberService(SqliteKarmaMemberService(connection, lock, channel_cache)),
+                AsyncBlockerService(SqliteBlockerService(connection, lock)),
+                AsyncKarmaChannelService(SqliteKarmaChannelService(connection, lock, channel_cache)))
+    if engine != 'mongo':
+        raise ValueError(f'Unknown database engine {engine}, expected mongo, memory or sqlite')
+
+    karma, karma_totals, karma_daily = datasource.karma(), datasource.karma_totals(), datasource.karma_daily()
+    # karma gains are optionally written behind in batches
+    write_buffer = None
+    write_behind = config['database'].get('write_behind', {})
+    if str(write_behind.get('enabled')).lower() == 'true':
+        write_buffer = KarmaWriteBuffer(karma, karma_totals, karma_daily,
+                                        int(write_behind['operations']), int(write_behind['interval']) / 1000)
+    # reactions and deletions of messages that never gave out karma are answered without a query
+    message_filter = None
+    filter_config = config['database'].get('message_filter', {})
+    if str(filter_config.get('enabled')).lower() == 'true':
+        message_filter = KarmaMessageFilter(int(filter_config['capacity']), float(filter_config['error_rate']))
+    # karma older than the retention period is optionally compacted into daily summaries
+    retention = None
+    retention_config = config['database'].get('retention', {})
+    if str(retention_config.get('enabled')).lower() == 'true':
+        retention = KarmaRetention(karma, int(retention_config['days']), int(retention_config['batch_size']),
+                                   int(retention_config['batches']), int(retention_config['interval']),
+                                   message_filter)
+    # every cog shares the service, so reads see the gains pending in the write buffer
+    karma_service = AsyncKarmaMemberService(KarmaMemberService(karma, karma_totals, karma_daily, write_buffer,
+                                                               message_filter, retention, channel_cache))
+    # the blacklist cache is only coherent if the producer and the blocker share the service
+    blocker_service = AsyncBlockerService(BlockerService(datasource.blacklist()))
+    channel_service = AsyncKarmaChannelService(KarmaChannelService(karma, karma_totals, karma_daily, write_buffer,
+                                                                   channel_cache))
+    return karma_service, blocker_service, channel_service
+
+
+def cooldown_store_enabled() -> bool:
+    """
+    if cooldowns are persisted in mongodb, only available on the mongo engine
+    :return: True if the cooldown store is configured
+    """
+    enabled = str(config['database'].get('cooldowns', {}).get('enabled')).lower() == 'true'
+    return enabled and database_engine() == 'mongo'
+
+
+def create_cooldowns() -> KarmaCooldowns:
+    """
+    create the cooldown registry of the producer, backed by the cooldown store if it is configured.
+    :return: KarmaCooldowns
+    """
+    if not cooldown_store_enabled():
+        return KarmaCooldowns()
+    cooldown_config = config['database']['cooldowns']
+    return KarmaCooldowns(store=AsyncService(CooldownStore(datasource.cooldowns())),
+                          refresh_interval=float(cooldown_config.get('refresh_interval', 5)))
+
+
+def create_bot(karma_service, blocker_service, channel_service) -> commands.Bot:
+    """
+    create the bot with all cogs, the services are injected into the cogs that need the database.
+    :param karma_service: AsyncKarmaMemberService shared by the karma cogs
+    :param blocker_service: AsyncBlockerService shared by the producer and the blocker
+    :param channel_service: AsyncKarmaChannelService of the channel leaderboard
+    :return: the bot, not yet connected
+    """
+    client = AuraBot(command_prefix=when_mentioned_or(config['prefix']))
     client.remove_command('help')
-    module_manager = ModuleManager(client)
-    karma_producer = KarmaProducer(client)
-    karma_blocker = KarmaBlocker(client)
-    karma_reducer = KarmaReducer(client)
-    karma_profile = KarmaProfile(client)
-    karma_leaderboard = KarmaLeaderboard(client)
+    producer = KarmaProducer(client, karma_service, blocker_service, create_cooldowns())
+    # reactions, replies and log lines still queued on shutdown are sent before disconnecting
+    client.close_hooks += [producer.stop_throttle_notices, producer.outbound.close, producer.log_digest.close]
     settings_manager = SettingsManager(client)
-    help_cog = Help(client)
-    karma_tutor = KarmaTutor(client)
-
-    client.add_cog(module_manager)
-    client.add_cog(karma_producer)
-    client.add_cog(karma_blocker)
-    client.add_cog(karma_reducer)
-    client.add_cog(karma_profile)
-    client.add_cog(karma_leaderboard)
-    client.add_cog(settings_manager)
-    client.add_cog(CommandErrorHandler(client))
-    client.add_cog(help_cog)
-    client.add_cog(karma_tutor)
-    client.add_cog(PermissionManager(client))
-
-    cog_map['ModuleManager'] = module_manager
-    cog_map['KarmaProducer'] = karma_producer
-    cog_map['KarmaBlocker'] = karma_blocker
-    cog_map['KarmaReducer'] = karma_reducer
-    cog_map['KarmaProfile'] = karma_profile
-    cog_map['KarmaLeaderboard'] = karma_leaderboard
-    cog_map['SettingsManager'] = settings_manager
-    cog_map['Help'] = help_cog
-    cog_map['KarmaTutor'] = karma_tutor
+    client.close_hooks.append(settings_manager.config_watcher.stop)
+    cogs = [ModuleManager(client),
+            producer,
+            KarmaBlocker(client, blocker_service),
+            KarmaReducer(client, karma_service),
+            KarmaProfile(client, karma_service),
+            KarmaLeaderboard(client, karma_service, channel_service),
+            settings_manager,
+            CommandErrorHandler(client),
+            Help(client),
+            KarmaTutor(client),
+            PermissionManager(client),
+            Statistics(client),
+            KarmaTransfer(client, AsyncService(TransferService(karma_service.service, blocker_service.service)))]
+    for cog in cogs:
+        client.add_cog(cog)
+        # the module manager can't enable or disable the error handler and the permission manager
+        if not isinstance(cog, (CommandErrorHandler, PermissionManager)):
+            cog_map[type(cog).__name__] = cog
+    return client
 
+
+def flush_on_shutdown(karma_service, attempts: int = 5, delay: float = 2) -> None:
+    """
+    write the buffered karma gains before exiting, a failed flush keeps them buffered and is retried.
+    :param karma_service: karma storage whose write buffer is flushed
+    :param attempts: flushes to try before giving up
+    :param delay: seconds between two attempts
+    :return: None
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            karma_service.flush()
+            return
+        except Exception as e:
+            log.error(f'Flushing buffered karma on shutdown failed, attempt {attempt} of {attempts}: {e}')
+            if attempt < attempts:
+                time.sleep(delay)
+    log.critical(f'Lost {len(karma_service.write_buffer)} buffered karma gains on shutdown')
+
+
+def main() -> None:
+    load_config()
+    load_permissions()
+    setup_logging()
+    # the memory and sqlite engines create their tables on their own
+    if database_engine() == 'mongo':
+        prepare_database()
+    karma_service, blocker_service, channel_service = create_services()
+    client = create_bot(karma_service, blocker_service, channel_service)
     client.run(config['token'])
+    # wait for database calls that are still running after the bot has been closed
+    executor.shutdown(wait=True)
+    # buffered karma gains must not get lost on shutdown
+    flush_on_shutdown(karma_service.service)
+    datasource.close()
+
+
+if __name__ == '__main__':
+    main()
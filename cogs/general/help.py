@@ -51,7 +51,7 @@ class Help(commands.Cog):
 
     @guild_only()
     @commands.command(brief='show all commands or show help text of a single command',
-                      usage='{}help\n{}help (command)'.format(config['prefix'], config['prefix']))
+                      usage='{prefix}help\n{prefix}help (command)')
     async def help(self, ctx, *, params: str = ""):
         """
         return the helpMenu or help information of the command provided to params.
@@ -141,7 +141,7 @@ class Help(commands.Cog):
 
         embed.title = command.name
         embed.description = command.brief
-        embed.add_field(name='**' + 'Structure' + '**', value=command.usage)
+        embed.add_field(name='**' + 'Structure' + '**', value=command.usage.format(prefix=config['prefix']))
         return embed
 
 
@@ -153,7 +153,7 @@ class KarmaTutor(commands.Cog):
     @guild_only()
     @has_required_role(command_name='explain')
     @commands.command(brief='explain the karma system to the caller based on the current configuration',
-                      usage='{}explain'.format(config['prefix']))
+                      usage='{prefix}explain')
     async def explain(self, ctx) -> None:
         """
         Build embed to explain the karma system to the member.
@@ -187,7 +187,7 @@ class KarmaTutor(commands.Cog):
     @guild_only()
     @has_required_role(command_name='reactions')
     @commands.command(brief='shows the ways aura reacts based on the current configuration',
-                      usage='{}reactions'.format(config['prefix']))
+                      usage='{prefix}reactions')
     async def reactions(self, ctx) -> None:
         """
         Shorthand of explain, only adding the reactions/feedback block to the embed.
@@ -239,7 +239,7 @@ class KarmaTutor(commands.Cog):
                           'Aura will contact you privately, if you are blacklisted.\n',
                           feedback)
 
-        feedback = update(blacklist()['edit'],
+        feedback = update(karma()['edit'],
                           'Aura will add karma, if message was not a valid karma message before editing it.\n' +
                           'Aura will remove karma, if message is not a valid karma message after editing it.',
                           feedback)
@@ -3,7 +3,6 @@ import logging
 from discord.ext import commands
 
 from core.decorator import has_required_role
-from util.config import config
 from util.constants import cog_map
 
 log = logging.getLogger(__name__)
@@ -17,7 +16,7 @@ class ModuleManager(commands.Cog):
 
     @has_required_role(command_name='load')
     @commands.command(brief='load a module, module names are listed in the help menu overview',
-                      usage='{}load'.format(config['prefix']))
+                      usage='{prefix}load')
     async def load(self, ctx, *, module: str) -> None:
         """
         the module to load, classes with commands.Cog
@@ -38,7 +37,7 @@ class ModuleManager(commands.Cog):
 
     @has_required_role(command_name='unload')
     @commands.command(brief='unload a module, module names are listed in the help menu overview',
-                      usage='{}unload'.format(config['prefix']))
+                      usage='{prefix}unload')
     async def unload(self, ctx, *, module: str) -> None:
         """
         the module to unload, classes with commands.Cog
@@ -59,7 +58,7 @@ class ModuleManager(commands.Cog):
 
     @has_required_role(command_name='reload')
     @commands.command(name='reload', brief='reload a module, module names are listed in the help menu overview',
-                      usage='{}reload'.format(config['prefix']))
+                      usage='{prefix}reload')
     async def _reload(self, ctx, *, module: str) -> None:
         """
         the module to reload, classes with commands.Cog
@@ -6,7 +6,6 @@ from discord.ext import commands
 from discord.ext.commands import guild_only
 
 from core.decorator import has_required_role
-from util.config import config
 from util.constants import aura_permissions, embed_color, bold_field
 from util.embedutil import add_filler_fields
 from util.permission import permission_map, write_permissions
@@ -22,7 +21,7 @@ class PermissionManager(commands.Cog):
     @has_required_role(command_name='getpermission')
     @commands.command(name='getpermission',
                       brief='get the permission of the provided command',
-                      usage='{}getpermission (Command)'.format(config['prefix']))
+                      usage='{prefix}getpermission (Command)')
     async def get_permission(self, ctx, *, command_name: str):
         permission = permission_map[command_name]
         if permission is None:
@@ -34,7 +33,7 @@ class PermissionManager(commands.Cog):
     @has_required_role(command_name='setpermission')
     @commands.command(name='setpermission',
                       brief='set the permission of the provided command, help permission is unmodifiable',
-                      usage='{}setpermission [command] [permission]'.format(config['prefix']))
+                      usage='{prefix}setpermission [command] [permission]')
     async def set_permission(self, ctx, command_name: str, permission: str):
         if command_name not in permission_map.keys():
             await ctx.channel.send(f'The command {command_name} does not exist.')
@@ -57,7 +56,7 @@ class PermissionManager(commands.Cog):
     @has_required_role(command_name='showpermission')
     @commands.command(name='showpermission',
                       brief='shows all commands with their currently set permissions.',
-                      usage='{}showpermission'.format(config['prefix']))
+                      usage='{prefix}showpermission')
     async def show_permission(self, ctx):
         embed: discord.Embed = Embed(color=embed_color, title='Permission Overview',
                                      description='shows all commands with their currently set permissions.')
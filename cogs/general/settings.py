@@ -1,12 +1,14 @@
 import logging
-from collections import Mapping
+from collections.abc import Mapping
+from copy import deepcopy
 
 from discord import Embed
 from discord.ext import commands
 from discord.ext.commands import guild_only
 
+from core.config_watcher import ConfigWatcher
 from core.decorator import has_required_role
-from util.config import config, write_config, descriptions
+from util.config import config, write_config, descriptions, apply_config
 from util.constants import embed_color, hidden_config
 from util.embedutil import add_filler_fields
 
@@ -15,16 +17,25 @@ log = logging.getLogger(__name__)
 
 class SettingsManager(commands.Cog):
 
-    def __init__(self, bot):
+    def __init__(self, bot, config_watcher: ConfigWatcher = None):
         self.bot = bot
+        # changes made to config.yaml while aura is running are applied without a restart
+        self.config_watcher = config_watcher if config_watcher is not None else ConfigWatcher()
+
+    @commands.Cog.listener()
+    async def on_ready(self) -> None:
+        """
+        start watching config.yaml for changes
+        :return: None
+        """
+        await self.config_watcher.start()
 
     # edit config defined in config.yaml, return messages if incorrect args are provided.
     # no checks on non existing configuration
     @guild_only()
     @has_required_role(command_name='config')
     @commands.command(brief='configuration menu or configuration modification',
-                      usage='{}config\n{}config [keys] [new_value]\n{}config help [keys]'
-                      .format(config['prefix'], config['prefix'], config['prefix']))
+                      usage='{prefix}config\n{prefix}config [keys] [new_value]\n{prefix}config help [keys]')
     async def config(self, ctx, *, params: str = ""):
         args = params.split()
         if len(args) >= 2 and args[0] == 'karma' and args[1] == 'keywords':
@@ -53,20 +64,25 @@ class SettingsManager(commands.Cog):
             await ctx.channel.send('Configuration key does not exist.')
             return
 
+        # the change is made on a copy, the running configuration is only replaced if the copy is valid
+        new_config = deepcopy(config)
         if len(args) == 3:
             if args[1] not in config[args[0]].keys():
                 await ctx.channel.send('Configuration key does not exist.')
                 return
 
-            config[args[0]][args[1]] = args[2]
-            write_config()
-            await ctx.channel.send('Configuration parameter {} {} has been changed to {}'
-                                   .format(args[0], args[1], args[2]))
-            return
+            new_config[args[0]][args[1]] = args[2]
+        else:
+            new_config[args[0]] = args[1]
 
-        config[args[0]] = args[1]
+        try:
+            apply_config(new_config)
+        except ValueError as e:
+            await ctx.channel.send(f'Configuration parameter {" ".join(args[:-1])} was not changed: {e}')
+            return
         write_config()
-        await ctx.channel.send('Configuration parameter {} has been changed to {}'.format(args[0], args[1]))
+        await ctx.channel.send('Configuration parameter {} has been changed to {}'
+                               .format(' '.join(args[:-1]), args[-1]))
 
     def build_config_embed(self) -> Embed:
         """
@@ -0,0 +1,39 @@
+import logging
+
+from discord import Embed
+from discord.ext import commands
+from discord.ext.commands import guild_only
+
+from core.decorator import has_required_role
+from core.metrics import registry
+from util.constants import embed_color, bold_field
+
+log = logging.getLogger(__name__)
+
+
+class Statistics(commands.Cog):
+    # Class showing the internal metrics of aura, e.g. write buffer flushes
+    def __init__(self, bot):
+        self.bot = bot
+
+    @guild_only()
+    @has_required_role(command_name='stats')
+    @commands.command(brief='show internal metrics of aura',
+                      usage='{prefix}stats')
+    async def stats(self, ctx) -> None:
+        """
+        show the counters and timings of every component that records metrics.
+        :param ctx: context of the invocation
+        :return: None
+        """
+        embed = Embed(colour=embed_color, title='Aura Statistics')
+        for name in sorted(registry.keys()):
+            snapshot = registry[name].snapshot()
+            if len(snapshot) == 0:
+                continue
+            value = '\n'.join(f'{key}: {snapshot[key]}' for key in sorted(snapshot.keys()))
+            embed.add_field(name=bold_field.format(name), value=f'```fix\n{value}```', inline=False)
+
+        if len(embed.fields) == 0:
+            embed.description = 'No metrics recorded yet.'
+        await ctx.channel.send(embed=embed)
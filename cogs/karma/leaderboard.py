@@ -1,49 +1,69 @@
 import logging
+import time
+from collections import defaultdict
+from typing import Optional
 
 import discord
 from discord.ext import commands
 from discord.ext.commands import guild_only, TextChannelConverter, CommandError
 
-from core import datasource
 from core.decorator import has_required_role
-from core.service.mongo_service import KarmaMemberService
-from util.config import config
+from core.model.member import KarmaMember
+from util.config import config, settings
 from util.constants import embed_color, bold_field, leaderboard_usage
+from util.conversion import convert_content_to_member_set
 
 log = logging.getLogger(__name__)
 
+page_anchor_ttl = 300  # seconds a known page start is reused, karma changes move members between pages
+
 
 class KarmaLeaderboard(commands.Cog):
     # Karma Leaderboard classes
-    def __init__(self, bot, karma_service=KarmaMemberService(datasource.karma)):
+    def __init__(self, bot, karma_service, channel_service):
         self.bot = bot
         self.karma_service = karma_service
+        self.channel_service = channel_service
+        # (guild_id, channel_id, page size) -> page -> start of the page, so following pages continue from there
+        self._page_anchors = defaultdict(dict)
 
     @guild_only()
     @has_required_role(command_name='leaderboard')
     @commands.command(brief='get a global karma leaderboard or a channel leaderboard, '
-                            + 'optionally you can provide days as an argument',
-                      usage=leaderboard_usage
-                      .format(config['prefix'], config['prefix'], config['prefix'], config['prefix']))
-    async def leaderboard(self, ctx, channel_mention="", time_span: int = 0) -> None:
+                            + 'optionally you can provide days or a page as an argument',
+                      usage=leaderboard_usage)
+    async def leaderboard(self, ctx, *args) -> None:
         """
-        Leaderboard showing the top x users globally, channel specific and optionally of the last x days.
+        Leaderboard showing the top x users globally, channel specific and optionally of the last x days
+        or a later page of the all time leaderboard.
         :param ctx: context of the invocation
-        :param channel_mention: optional channel mention for channel leaderboard
-        :param time_span: time_span in days for the last x days leaderboard
+        :param args: optional channel mention or global, followed by optional days or page and page number
         :return: None
         """
         embed = discord.Embed(colour=embed_color)
         guild = ctx.message.guild
-        limit = config['leaderboard']
+        limit = settings().leaderboard
+
+        args = list(args)
+        channel_mention = ''
+        if len(args) > 0 and args[0] != 'page' and not args[0].isdigit():
+            channel_mention = args.pop(0)
+        page, time_span = 0, 0
+        if len(args) == 2 and args[0] == 'page' and args[1].isdigit() and int(args[1]) > 0:
+            page = int(args[1])
+        elif len(args) == 1 and args[0].isdigit():
+            time_span = int(args[0])
+        elif len(args) != 0:
+            await ctx.channel.send(f'Usage: {ctx.command.usage.format(prefix=config["prefix"])}')
+            return
 
-        def send_leaderboard(lb, title=f'Top {limit} most helpful people'):
+        async def send_leaderboard(lb, title=f'Top {limit} most helpful people', start=1):
             embed.title = title
             if len(lb) == 0:
                 await ctx.channel.send('No leaderboard exists for this timeframe')
                 return
 
-            count: int = 1
+            count: int = start
             for document in lb:
                 member = self.bot.get_user(int(document['_id']['member_id']))
                 karma = document['karma']
@@ -57,36 +77,155 @@ class KarmaLeaderboard(commands.Cog):
 
             await ctx.channel.send(embed=embed)
 
-        if channel_mention == '' or channel_mention == 'global':
-            if time_span == 0:
-                leaderboard = list(self.karma_service.aggregate_top_karma_members(str(guild.id)))
-                send_leaderboard(leaderboard)
-            else:
-                leaderboard = list(self.karma_service.aggregate_top_karma_members(guild_id=str(guild.id),
-                                                                                  time_span=time_span))
-                send_leaderboard(leaderboard)
-            return
-
         input_channel = None
         input_channel_name = ''
-        try:
-            input_channel = await TextChannelConverter().convert(ctx=ctx, argument=channel_mention)
-            input_channel_name = input_channel.name
-        except CommandError as e:
-            log.error(e)
-        if input_channel is None:
-            await ctx.channel.send('Channel does not exist or lacking permissions to view it.')
+        if channel_mention != '' and channel_mention != 'global':
+            try:
+                input_channel = await TextChannelConverter().convert(ctx=ctx, argument=channel_mention)
+                input_channel_name = input_channel.name
+            except CommandError as e:
+                log.error(e)
+            if input_channel is None:
+                await ctx.channel.send('Channel does not exist or lacking permissions to view it.')
+                return
+
+            if not ctx.message.author.permissions_in(input_channel).view_channel:
+                await ctx.channel.send('Channel does not exist or lacking permissions to view it.')
+                return
+        channel_id = '' if input_channel is None else str(input_channel.id)
+
+        if page > 0:
+            leaderboard = await self.leaderboard_page(str(guild.id), channel_id, page, limit)
+            if leaderboard is None:
+                reachable = self.reachable_page(str(guild.id), channel_id, page, limit)
+                await ctx.channel.send(f'Page {page} has to be reached page by page, '
+                                       f'the next page that can be shown is page {reachable}.')
+                return
+            title = f'Most helpful people, page {page}' if input_channel is None \
+                else f'Most helpful people in {input_channel_name}, page {page}'
+            await send_leaderboard(leaderboard, title=title, start=(page - 1) * limit + 1)
             return
 
-        if not ctx.message.author.permissions_in(input_channel).view_channel:
-            await ctx.channel.send('Channel does not exist or lacking permissions to view it.')
+        if input_channel is None:
+            if time_span == 0:
+                leaderboard = await self.karma_service.aggregate_top_karma_members(str(guild.id))
+                await send_leaderboard(leaderboard)
+            else:
+                leaderboard = await self.karma_service.aggregate_top_karma_members(guild_id=str(guild.id),
+                                                                                   time_span=time_span)
+                await send_leaderboard(leaderboard)
             return
 
         if time_span == 0:
-            leaderboard = list(self.karma_service.aggregate_top_karma_members(str(guild.id), str(input_channel.id)))
-            send_leaderboard(leaderboard)
+            leaderboard = await self.karma_service.aggregate_top_karma_members(str(guild.id), channel_id)
+            await send_leaderboard(leaderboard)
         else:
-            leaderboard = list(self.karma_service.aggregate_top_karma_members(guild_id=str(guild.id),
-                                                                              time_span=time_span))
-            send_leaderboard(leaderboard, title=f'Top {limit} most helpful people in {input_channel_name} ' \
-                                                f'of the last {time_span} days')
+            leaderboard = await self.karma_service.aggregate_top_karma_members(guild_id=str(guild.id),
+                                                                               channel_id=channel_id,
+                                                                               time_span=time_span)
+            await send_leaderboard(leaderboard, title=f'Top {limit} most helpful people in {input_channel_name} '
+                                                      f'of the last {time_span} days')
+
+    def _anchors(self, guild_id: str, channel_id: str, size: int) -> dict:
+        """
+        get the known page starts of a leaderboard, dropping the ones that are too old to be reused.
+        :param guild_id: guild of the leaderboard
+        :param channel_id: channel of the leaderboard, '' for the global leaderboard
+        :param size: members per page
+        :return: page -> (karma and member_id of the last member of the previous page, time it was read)
+        """
+        now = time.monotonic()
+        anchors = self._page_anchors[(guild_id, channel_id, size)]
+        for expired in [key for key, (_, created) in anchors.items() if now - created > page_anchor_ttl]:
+            del anchors[expired]
+        return anchors
+
+    def reachable_page(self, guild_id: str, channel_id: str, page: int, size: int) -> int:
+        """
+        get the closest page before the given page that can be read, page 1 or a page whose start is known.
+        :param guild_id: guild of the leaderboard
+        :param channel_id: channel of the leaderboard, '' for the global leaderboard
+        :param page: page that was requested
+        :param size: members per page
+        :return: the page to continue from
+        """
+        return max([known for known in self._anchors(guild_id, channel_id, size) if known <= page], default=1)
+
+    async def leaderboard_page(self, guild_id: str, channel_id: str, page: int, size: int) -> Optional[list]:
+        """
+        read a page of the all time leaderboard with a single query that continues after the last member
+        of the previous page. only page 1 and pages following a recently read page can be read,
+        deeper pages would need the members before them to be counted.
+        :param guild_id: guild of the leaderboard
+        :param channel_id: channel of the leaderboard, '' for the global leaderboard
+        :param page: page to read, starting with 1
+        :param size: members per page
+        :return: the members of the page, None if the start of the page isn't known
+        """
+        anchors = self._anchors(guild_id, channel_id, size)
+        if page != 1 and page not in anchors:
+            return None
+        after = anchors[page][0] if page in anchors else None
+        documents = list(await self.karma_service.aggregate_karma_page(guild_id, channel_id, after, size))
+        if len(documents) == size:
+            anchors[page + 1] = ((documents[-1]['karma'], documents[-1]['_id']['member_id']), time.monotonic())
+        return documents
+
+    @guild_only()
+    @has_required_role(command_name='channels')
+    @commands.command(brief='get the channels in which the most karma was given, optionally of the last days',
+                      usage='{prefix}channels\n{prefix}channels (days)')
+    async def channels(self, ctx, time_span: int = 0) -> None:
+        """
+        Leaderboard showing the top x channels by karma gained in them, optionally of the last x days.
+        :param ctx: context of the invocation
+        :param time_span: time_span in days for the last x days leaderboard
+        :return: None
+        """
+        limit = settings().leaderboard
+        channels = await self.channel_service.aggregate_top_karma_channels(str(ctx.guild.id), time_span)
+        if len(channels) == 0:
+            await ctx.channel.send('No leaderboard exists for this timeframe')
+            return
+
+        embed = discord.Embed(colour=embed_color)
+        embed.title = f'Top {limit} most helpful channels' if time_span == 0 \
+            else f'Top {limit} most helpful channels of the last {time_span} days'
+        count: int = 1
+        for document in channels:
+            channel = ctx.guild.get_channel(int(document['_id']['channel_id']))
+            # channels the author can't see are left out, like in the channel leaderboard
+            if channel is not None and not ctx.message.author.permissions_in(channel).view_channel:
+                continue
+            name = 'deleted channel' if channel is None else channel.name
+            embed.add_field(name=f'{count}) ' + bold_field.format(name), value=f'{document["karma"]} karma',
+                            inline=False)
+            count += 1
+
+        await ctx.channel.send(embed=embed)
+
+    @guild_only()
+    @has_required_role(command_name='rank')
+    @commands.command(brief='get the position of a member or yourself in the karma leaderboard',
+                      usage='{prefix}rank\n{prefix}rank <@!member_id>')
+    async def rank(self, ctx, *, args='') -> None:
+        """
+        Return the leaderboard position of a member or self if no arguments.
+        :param ctx: context of the invocation
+        :param args: member to rank, only the first one is used
+        :return: None
+        """
+        member = ctx.message.author
+        if len(args) != 0:
+            member_set = await convert_content_to_member_set(ctx, args.split()[:1])
+            if len(member_set) == 0:
+                return
+            member = member_set.pop()
+
+        rank = await self.karma_service.member_rank(KarmaMember(ctx.guild.id, member.id))
+        name = member.name + '#' + member.discriminator
+        if rank is None:
+            await ctx.channel.send(f'{name} has not earned any karma yet')
+            return
+        position, karma = rank
+        await ctx.channel.send(f'{name} is rank {position} with {karma} karma')
@@ -1,16 +1,17 @@
 import logging
-from collections import defaultdict
 
 import discord
 from discord.ext import commands
 from discord.ext.commands import guild_only
 
-from core import datasource
+from core.cooldown import KarmaCooldowns
+from core.log_digest import KarmaLogDigest
 from core.model.member import KarmaMember, Member
-from core.service.mongo_service import KarmaMemberService, BlockerService
+from core.outbound import OutboundQueue
 from core.service.validation_service import validate_message
-from core.timer import KarmaSingleActionTimer
-from util.config import config, karma, reaction_emoji
+from core.throttle import KarmaThrottle
+from core.timer import PeriodicTimer
+from util.config import Settings, settings
 from util.constants import revoke_message
 from util.util import clear_reaction
 
@@ -20,15 +21,37 @@ log = logging.getLogger(__name__)
 class KarmaProducer(commands.Cog):
     # Class that gives positive karma and negative karma on message deletion (take back last action)
 
-    def __init__(self, bot, karma_service=KarmaMemberService(datasource.karma),
-                 blocker_service=BlockerService(datasource.blacklist)):
+    def __init__(self, bot, karma_service, blocker_service, cooldowns: KarmaCooldowns = None,
+                 log_digest: KarmaLogDigest = None, outbound: OutboundQueue = None):
         self.bot = bot
         self.karma_service = karma_service
         self.blocker_service = blocker_service
-        # this creates a dictionary where each value is a dictionary whose values are a list
-        # with lambda this automatically creates an empty list on non existing keys
-        self._members_on_cooldown = defaultdict(lambda: defaultdict(list))
-        self._running_timers = defaultdict(lambda: defaultdict(lambda: defaultdict()))
+        # giver-receiver pairs on cooldown, expired by one sweeper instead of a timer per pair
+        self.cooldowns = cooldowns if cooldowns is not None else KarmaCooldowns()
+        # flood protection of karma messages per guild and per giver
+        self.throttle = KarmaThrottle()
+        # guild_id -> channel of the last throttled karma message, where the pending notice is sent
+        self._notice_channels = {}
+        self._notice_timer = None
+        # karma gains and removals are posted to the log channel in batches
+        self.log_digest = log_digest if log_digest is not None else KarmaLogDigest(bot)
+        # reactions and replies are sent by per channel workers, karma bookkeeping doesn't wait for them
+        self.outbound = outbound if outbound is not None else OutboundQueue()
+
+    @commands.Cog.listener()
+    async def on_ready(self) -> None:
+        """
+        start writing buffered karma gains periodically, if write-behind is configured,
+        start compacting old karma, if retention is configured and seed the karma message filter, if there is one.
+        also starts sweeping expired cooldowns and sending the log digest.
+        :return: None
+        """
+        await self.cooldowns.start_sweeper()
+        await self.log_digest.start()
+        await self.start_throttle_notices()
+        await self.karma_service.start_write_behind()
+        await self.karma_service.start_retention()
+        await self.karma_service.seed_message_filter()
 
     @guild_only()
     @commands.Cog.listener()
@@ -45,14 +68,24 @@ class KarmaProducer(commands.Cog):
         if not await validate_message(message):
             return
 
+        # one snapshot for the whole message, a config change in between doesn't mix old and new values
+        current = settings()
+        # raids and giveaway spam are dropped before they cost any query or discord request
+        if not self.allow_karma_message(message):
+            self._notice_channels[guild_id] = message.channel
+            dropped = self.throttle.notice(guild_id, current.throttle.notice)
+            if dropped != 0:
+                self.send_throttle_notice(guild_id, dropped)
+            return
+
         # check if member is blacklisted
-        if self.blocker_service.find_member(Member(str(guild_id), message.author.id)) is not None:
-            if str(config['blacklist']['dm']).lower() == 'true':
+        if await self.blocker_service.find_member(Member(str(guild_id), message.author.id)) is not None:
+            if current.blacklist.dm:
                 log.info(f'Sending Blacklist dm to {message.author.id} in guild {guild_id}')
                 await message.author.send(f'You have been blacklisted from giving out karma, if you believe this ' +
-                                          f'to be an error, contact {config["blacklist"]["contact"]}')
-            if str(config['blacklist']['emote']).lower() == 'true':
-                await message.add_reaction(reaction_emoji()['karma_blacklist'])
+                                          f'to be an error, contact {current.blacklist.contact}')
+            if current.blacklist.emote:
+                self.outbound.add_reaction(message, current.emoji.karma_blacklist)
             return
 
         await self.give_karma(message, message.guild)
@@ -67,7 +100,7 @@ class KarmaProducer(commands.Cog):
         :return: None
         """
 
-        if str(karma()['edit']).lower() != 'true':
+        if not settings().karma.edit:
             return
 
         before_valid = await validate_message(before)
@@ -96,7 +129,7 @@ class KarmaProducer(commands.Cog):
         :param message: message which was deleted
         :return: None
         """
-        if self.karma_service.find_message(str(message.id)) is not None:
+        if await self.karma_service.find_message(str(message.id)) is not None:
             await self.remove_karma(message, message.guild, 'message delete')
 
     @guild_only()
@@ -109,11 +142,11 @@ class KarmaProducer(commands.Cog):
         :return: None
         """
         # if aura made this reaction then it was very clearly a karma message
-        if user.id != self.bot.user.id and reaction.emoji != reaction_emoji()['karma_gain']:
+        if user.id != self.bot.user.id and reaction.emoji != settings().emoji.karma_gain:
             return
 
         message = reaction.message
-        if self.karma_service.find_message(str(message.id)) is not None:
+        if await self.karma_service.find_message(str(message.id)) is not None:
             await self.remove_karma(message, message.guild, 'reaction remove')
 
     @guild_only()
@@ -126,8 +159,9 @@ class KarmaProducer(commands.Cog):
         :param reactions:
         :return:
         """
+        karma_gain = settings().emoji.karma_gain
         for reaction in reactions:
-            if reaction.emoji != reaction_emoji()['karma_gain']:
+            if reaction.emoji != karma_gain:
                 continue
 
             # reaction me is very much the same as checking the user id
@@ -135,7 +169,7 @@ class KarmaProducer(commands.Cog):
             if not reaction.me:
                 continue
 
-            if self.karma_service.find_message(str(message.id)) is not None:
+            if await self.karma_service.find_message(str(message.id)) is not None:
                 await self.remove_karma(message, message.guild, 'reaction clear')
 
     @guild_only()
@@ -148,13 +182,14 @@ class KarmaProducer(commands.Cog):
         :param user: user who added the reaction
         :return: None
         """
-        if self.karma_service.find_message(str(reaction.message.id)) is None or \
+        if await self.karma_service.find_message(str(reaction.message.id)) is None or \
                 reaction.message.author.id != user.id or \
                 not reaction.me:
             return
 
-        if reaction.emoji == reaction_emoji()['karma_delete']:
-            if str(karma()['self_delete']).lower() != 'true':
+        current = settings()
+        if reaction.emoji == current.emoji.karma_delete:
+            if not current.karma.self_delete:
                 return
 
             log.info('Removing karma because the karma_delete emoji was clicked by author')
@@ -169,6 +204,59 @@ class KarmaProducer(commands.Cog):
             if reaction is not other_reaction:
                 await clear_reaction(other_reaction)
 
+    def send_throttle_notice(self, guild_id: int, dropped: int) -> None:
+        """
+        tell the channel of the last throttled karma message of a guild how many karma messages were ignored
+        :param guild_id: id of the guild
+        :param dropped: amount of karma messages dropped since the last notice
+        :return: None
+        """
+        channel = self._notice_channels.pop(guild_id, None)
+        if channel is None:
+            return
+        log.info(f'Throttled {dropped} karma messages in guild {guild_id}')
+        self.outbound.send(channel, f'Karma is given out too fast right now, {dropped} karma '
+                                    f'message{"s were" if dropped > 1 else " was"} ignored.')
+
+    async def send_throttle_notices(self) -> None:
+        """
+        send the notices of guilds whose last throttled messages weren't reported yet, called periodically
+        :return: None
+        """
+        for guild_id, dropped in self.throttle.due_notices(settings().throttle.notice):
+            self.send_throttle_notice(guild_id, dropped)
+
+    async def start_throttle_notices(self, interval: float = 5) -> None:
+        """
+        start sending pending throttle notices periodically
+        :param interval: seconds between two checks for pending notices
+        :return: None
+        """
+        if self._notice_timer is not None:
+            return
+        self._notice_timer = PeriodicTimer(self.send_throttle_notices, interval)
+        await self._notice_timer.start()
+
+    async def stop_throttle_notices(self) -> None:
+        """
+        stop sending pending throttle notices, the last ones are queued before the outbound queue is closed
+        :return: None
+        """
+        if self._notice_timer is not None:
+            await self._notice_timer.stop()
+            self._notice_timer = None
+        await self.send_throttle_notices()
+
+    def allow_karma_message(self, message: discord.Message) -> bool:
+        """
+        take a token of the guild and of the author of a karma message, configured through throttle.
+        :param message: karma message
+        :return: True if the message can give out karma, False if it has to be dropped
+        """
+        limits = settings().throttle
+        return self.throttle.allow(message.guild.id, message.author.id, limits.guild_rate, limits.guild_burst,
+                                   limits.giver_rate, limits.giver_burst)
+
     async def give_karma(self, message: discord.Message, guild: discord.Guild) -> None:
         """
         give karma to all the users in the message except the author, other bots or aura itself
@@ -176,6 +264,7 @@ class KarmaProducer(commands.Cog):
         :param guild: guild of the karma message
         :return: None
         """
+        current = settings()
         # walk through the mention list which contains discord: Members
         for member in set(message.mentions):
             # filter out message author, aura and other bots
@@ -185,122 +274,98 @@ class KarmaProducer(commands.Cog):
                 continue
 
             # check if giver-receiver combo on cooldown
-            if m_id in self._members_on_cooldown[guild.id][a_id]:
+            if await self.cooldowns.check(guild.id, a_id, m_id):
                 log.info(f'Sending configured cooldown response to {a_id} in guild {guild.id}')
-                if str(config['karma']['time-emote']).lower() == "true":
-                    await message.add_reaction(reaction_emoji()['karma_cooldown'])
+                if current.karma.time_emote:
+                    self.outbound.add_reaction(message, current.emoji.karma_cooldown)
 
-                if str(config['karma']['time-message']).lower() == "true":
-                    await self.bot.get_channel(message.channel.id) \
-                        .send(f'Sorry {message.author.mention}, your karma for {member.name} needs time to recharge')
+                if current.karma.time_message:
+                    self.outbound.send(message.channel, f'Sorry {message.author.mention}, your karma for '
+                                                        f'{member.name} needs time to recharge')
                 continue
 
             karma_member = KarmaMember(guild.id, member.id, message.channel.id, message.id)
-            self.karma_service.upsert_karma_member(karma_member)
-            await self.cooldown_user(guild.id, message.author.id, member.id)
-            await self.notify_member_gain(message, member)
+            await self.karma_service.upsert_karma_member(karma_member)
+            await self.cooldown_user(guild.id, message.author.id, member.id, current.cooldown)
+            await self.notify_member_gain(message, member, current)
             log.info(f'{a_id} gave karma to {m_id} in guild {guild.id}')
 
     async def remove_karma(self, message: discord.Message, guild: discord.Guild, reason: str) -> None:
         """
-        remove karma from everyone that is in the set of mentions of the message,
-        providing a reason for the deletion.
+        remove all karma that was given out by the message, providing a reason for the deletion.
         :param message: message to remove karma from
         :param guild: guild of the message
         :param reason: reason for deleting the karma (event_type)
         :return: None
         """
-        # walk through the mention list which contains discord: Members
-        for mention in set(message.mentions):
-            member = mention
-            karma_member = KarmaMember(guild.id, member.id, message.channel.id, message.id, 1)
-            deletion_result = self.karma_service.delete_single_karma(karma_member)
-            await self.log_karma_removal(message, member, reason)
-            if deletion_result.deleted_count == 1:
-                continue
-
-            single_action_timer: KarmaSingleActionTimer \
-                = self._running_timers[guild.id][message.author.id][member.id]
-            if single_action_timer is None or not single_action_timer.is_started:
-                continue
-
-            await single_action_timer.stop()
-            del self._running_timers[guild.id][message.author.id][member.id]
-            self._members_on_cooldown[guild.id][message.author.id].remove(member.id)
-
-    async def notify_member_gain(self, message: discord.Message, member: discord.Member) -> None:
+        # the deleted karma decides who is affected, the mentions of a cached message can be incomplete
+        member_ids = await self.karma_service.delete_message_karma(str(guild.id), str(message.id))
+        for member_id in member_ids:
+            await self.log_karma_removal(message, guild.get_member(int(member_id)), member_id, reason)
+            # removed karma doesn't keep the giver on cooldown
+            await self.cooldowns.end(guild.id, message.author.id, int(member_id))
+
+    async def notify_member_gain(self, message: discord.Message, member: discord.Member,
+                                 current: Settings = None) -> None:
         """
         notify the member that he gained karma, configureable through configuration.
         :param message: the discord message, used to link to the message.
         :param member: the member to notify, if applicable.
+        :param current: configuration snapshot of the karma message, the current one if None
         :return: None
         """
-        if str(karma()['log']).lower() == 'true':
+        current = current if current is not None else settings()
+        if current.karma.log:
             log_message = '{}{} earned karma in {}. {}'.format(
                 member.name + '#' + member.discriminator,
-                f' ({member.nick})' if member.Nick is not None else '',
+                f' ({member.nick})' if member.nick is not None else '',
                 message.channel.mention,
                 message.jump_url)
+            self.log_digest.add(log_message)
 
-            log_channel = self.bot.get_channel(int(config['channel']['log']))
-            log_channel.send(log_message)
-
-        if str(karma()['message']).lower() == 'true':
-            result = f'Congratulations {member.mention}, you have earned karma from {member.author.mention}. '
+        if current.karma.message:
+            result = f'Congratulations {member.mention}, you have earned karma from {message.author.mention}. '
 
-            if str(karma()['self_delete']).lower() == 'true':
-                result += revoke_message.format(message.author.mention)
+            if current.karma.self_delete:
+                result += revoke_message.format(message.author.mention, current.emoji.karma_delete)
 
-            message_channel = self.bot.get_channel(message.channel.id)
-            await message_channel.send(result)
+            self.outbound.send(message.channel, result)
 
-        if str(karma()['emote']).lower() == 'true':
-            await message.add_reaction(reaction_emoji()['karma_gain'])
-            if str(karma()['self_delete']).lower() == 'true':
-                await message.add_reaction(reaction_emoji()['karma_delete'])
+        # queued once per message, no matter how many members gained karma through it
+        if current.karma.emote:
+            self.outbound.add_reaction(message, current.emoji.karma_gain)
+            if current.karma.self_delete:
+                self.outbound.add_reaction(message, current.emoji.karma_delete)
 
-    async def log_karma_removal(self, message: discord.Message, member: discord.Member,
+    async def log_karma_removal(self, message: discord.Message, member: discord.Member, member_id: str,
                                 event_type: str) -> None:  # TODO change event_type to enum
         """
         log the karma removal of a user in a channel.
         :param message: the discord message which triggered the removal, can be None.
-        :param member: the discord member whose removal is to be logged.
+        :param member: the discord member whose removal is to be logged, None if he isn't cached.
+        :param member_id: id of the member, logged if the member isn't cached
         :param event_type: the reason for the deletion
         :return: None
         """
-        if not karma()['log']:
+        if not settings().karma.log:
             return
 
-        result = f'karma for {member.name + "#" + member.discriminator} was removed through event: ' + \
+        name = member.name + "#" + member.discriminator if member is not None else member_id
+        result = f'karma for {name} was removed through event: ' + \
                  f'{event_type} "" in {message.channel.mention}'
-        if event_type == 'message delete':
-            await self.bot.get_channel(int(config['channel']['log'])).send(result)
-            return
-
-        result += f" :: {message.jump_url}"
-        await self.bot.get_channel(int(config['channel']['log'])).send(result)
+        # the link of a deleted message leads nowhere
+        if event_type != 'message delete':
+            result += f" :: {message.jump_url}"
+        self.log_digest.add(result)
 
-    async def cooldown_user(self, guild_id: int, giver_id: int, receiver_id: int) -> None:
+    async def cooldown_user(self, guild_id: int, giver_id: int, receiver_id: int, cooldown: int = None) -> None:
         """
-        Put giver-receiver pairs on a cooldown and start a SingleActionTimer which removes them from the cooldown dict.
+        Put giver-receiver pairs on the configured cooldown, the pair expires on its own.
         :param guild_id: id of the guild the cooldown is applied to.
         :param giver_id: id of the giver who thanked the receiver.
         :param receiver_id: id of the receiver who was thanked by the receiver.
+        :param cooldown: seconds of the cooldown, the configured cooldown if None
         :return: None
         """
-        self._members_on_cooldown[guild_id][giver_id].append(receiver_id)
-        single_action_timer = KarmaSingleActionTimer(self.remove_from_cooldown, int(config['cooldown']),
-                                                     guild_id, giver_id, receiver_id)
-        self._running_timers[guild_id][giver_id][receiver_id] = single_action_timer
-        await single_action_timer.start()
-
-    async def remove_from_cooldown(self, guild_id: int, giver_id: int, receiver_id: int) -> None:
-        """
-        Method that is used in the SingleAction timer to remove the giver-receiver pair from the cooldown dict.
-        :param guild_id: id of the guild
-        :param giver_id:  id of the giver who thanked the receiver.
-        :param receiver_id: id of the receiver who was thanked by the receiver
-        :return:
-        """
-        self._members_on_cooldown[guild_id][giver_id].remove(receiver_id)
-        del self._running_timers[guild_id][giver_id][receiver_id]
+        cooldown = cooldown if cooldown is not None else settings().cooldown
+        await self.cooldowns.start(guild_id, giver_id, receiver_id, cooldown)
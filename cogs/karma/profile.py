@@ -4,11 +4,9 @@ import discord
 from discord.ext import commands
 from discord.ext.commands import guild_only
 
-from core import datasource
 from core.decorator import has_required_role
 from core.model.member import KarmaMember
-from core.service.mongo_service import KarmaMemberService
-from util.config import profile, config
+from util.config import profile
 from util.constants import embed_color, bold_field
 from util.conversion import convert_content_to_member_set
 from util.embedutil import add_filler_fields
@@ -20,15 +18,14 @@ class KarmaProfile(commands.Cog):
     # Karma Profile Class, users other than moderators and admins can only see their own karma or profile.
     # Moderators and Admin Role Users can get the karma by issuing the command with the user id.
 
-    def __init__(self, bot, karma_service=KarmaMemberService(datasource.karma)):
+    def __init__(self, bot, karma_service):
         self.bot = bot
         self.karma_service = karma_service
 
     @guild_only()
     @has_required_role(command_name='karma')
     @commands.command(brief='get karma of a user, of several users or yourself',
-                      usage='{}karma\n{}karma <@!member_id> [...]'
-                      .format(config['prefix'], config['prefix']))
+                      usage='{prefix}karma\n{prefix}karma <@!member_id> [...]')
     async def karma(self, ctx, *, args='') -> None:
         """
         Return the karma of all members provided to the karma command or self if no arguments.
@@ -37,16 +34,17 @@ class KarmaProfile(commands.Cog):
         :return: None
         """
         result = ''
-        members = [KarmaMember(ctx.guild.id, ctx.message.author.id)]
+        members = [ctx.message.author]
         if len(args) != 0:
             members = await convert_content_to_member_set(ctx, args.split())
 
+        # one query for all mentioned members
+        karma = await self.karma_service.aggregate_members_by_karma(str(ctx.guild.id),
+                                                                    [member.id for member in members])
         for member in members:
-            karma_member = KarmaMember(ctx.guild.id, member.id)
-            karma = self.karma_service.aggregate_member_by_karma(karma_member)
             result += '{} has earned a total of {} karma\n'.format(
                 member.name + '#' + member.discriminator,
-                0 if karma is None else karma
+                karma[str(member.id)]
             )
 
         await ctx.channel.send(result)
@@ -54,8 +52,7 @@ class KarmaProfile(commands.Cog):
     @guild_only()
     @has_required_role(command_name='profile')
     @commands.command(brief='get karma profile of a user or yourself',
-                      usage='{}profile\n{}profile <@!member_id>'
-                      .format(config['prefix'], config['prefix']))
+                      usage='{prefix}profile\n{prefix}profile <@!member_id>')
     async def profile(self, ctx, *, args='') -> None:
         """
         Return the karma profile of a member or self if no arguments.
@@ -87,11 +84,11 @@ class KarmaProfile(commands.Cog):
         :param guild: the discord guild
         :return: discord.Embed
         """
-        channel_cursor = self.karma_service.aggregate_member_by_channels(karma_member)
+        member_profile = await self.karma_service.aggregate_member_profile(karma_member)
+        channel_list = member_profile['channels']
+        total_karma = member_profile['karma']
         embed: discord.Embed = discord.Embed(colour=embed_color)
         embed.description = 'Karma Profile with breakdown of top {} channels'.format(profile()['channels'])
-        channel_list = list(channel_cursor)
-        total_karma = self.karma_service.aggregate_member_by_karma(karma_member)
         if len(channel_list) == 0:
             embed.add_field(name="**total**", value='', inline=False)
             return embed
@@ -3,13 +3,11 @@ from io import BytesIO
 
 from discord import File
 from discord.ext import commands
-from discord.ext.commands import has_any_role, guild_only
+from discord.ext.commands import guild_only
 
-from core import datasource
 from core.decorator import has_required_role
 from core.model.member import KarmaMember, Member
-from core.service.mongo_service import KarmaMemberService, BlockerService
-from util.config import roles, config, max_message_length
+from util.config import roles, max_message_length, settings
 from util.conversion import convert_content_to_member_set
 from util.util import member_has_role
 
@@ -18,15 +16,14 @@ log = logging.getLogger(__name__)
 
 class KarmaReducer(commands.Cog):
     # Class all about reducing the Karma of a Member
-    def __init__(self, bot, karma_service=KarmaMemberService(datasource.karma)):
+    def __init__(self, bot, karma_service):
         self.bot = bot
         self.karma_service = karma_service
 
     @guild_only()
-    @has_any_role(roles()['admin'], roles()['moderator'])
+    @has_required_role(command_name='reset')
     @commands.command(brief='Reset all karma of a member in the guild',
-                      usage='{}reset member_id\n{}reset <@!member_id>'
-                      .format(config['prefix'], config['prefix']))
+                      usage='{prefix}reset member_id\n{prefix}reset <@!member_id>')
     async def reset(self, ctx, *, args: str) -> None:
         """
         reset karma of the users provided to the command, both mentions and ids are valid.
@@ -37,7 +34,7 @@ class KarmaReducer(commands.Cog):
         # convert args to discord.Member
         member_set = await convert_content_to_member_set(ctx, args.split())
         for member in member_set:
-            if member_has_role(member, roles()['admin']) and ctx.message.author.id != int(config['owner']):
+            if member_has_role(member, roles()['admin']) and ctx.message.author.id != settings().owner:
                 await ctx.channel.send(f'Skipping {member.display_name}, You cannot reset the karma of an admin.')
                 continue
 
@@ -47,21 +44,20 @@ class KarmaReducer(commands.Cog):
                                        'Only admins can reset the karma of an moderator.')
                 continue
 
-            self.karma_service.delete_all_karma(KarmaMember(ctx.guild.id, member.id))
+            await self.karma_service.delete_all_karma(KarmaMember(ctx.guild.id, member.id))
             await ctx.channel.send(f'Removed all Karma for {member.mention}')
 
 
 class KarmaBlocker(commands.Cog):
     # Class about blocking and unblocking members from giving karma
-    def __init__(self, bot):
+    def __init__(self, bot, blocker_service):
         self.bot = bot
-        self.blocker_service = BlockerService(datasource.blacklist)
+        self.blocker_service = blocker_service
 
     @guild_only()
     @has_required_role(command_name='blacklist')
     @commands.command(brief='blacklists a member from giving karma',
-                      usage='{}blacklist member_id\n{}blacklist <@!member_id>'
-                      .format(config['prefix'], config['prefix']))
+                      usage='{prefix}blacklist member_id\n{prefix}blacklist <@!member_id>')
     async def blacklist(self, ctx, *, args: str) -> None:
         """
         blacklist the users provided to the command, both mentions and ids are valid.
@@ -71,7 +67,7 @@ class KarmaBlocker(commands.Cog):
         """
         member_set = await convert_content_to_member_set(ctx, args.split())
         for member in member_set:
-            if member_has_role(member, roles()['admin']) and ctx.message.author.id != int(config['owner']):
+            if member_has_role(member, roles()['admin']) and ctx.message.author.id != settings().owner:
                 await ctx.channel.send(f'Skipping {member.display_name}, You cannot blacklist an admin.')
                 continue
 
@@ -80,14 +76,13 @@ class KarmaBlocker(commands.Cog):
                 await ctx.channel.send(f'Skipping {member.display_name}, Only admins can blacklist an moderator.')
                 continue
 
-            self.blocker_service.blacklist(Member(ctx.guild.id, member.id))
+            await self.blocker_service.blacklist(Member(ctx.guild.id, member.id))
             await ctx.channel.send(f'Blacklisted {member.mention} from giving karma.')
 
     @guild_only()
     @has_required_role(command_name='whitelist')
     @commands.command(brief='removes existing blacklist of the guild member',
-                      usage='{}whitelist member_id\n{}whitelist <@!member_id>'
-                      .format(config['prefix'], config['prefix']))
+                      usage='{prefix}whitelist member_id\n{prefix}whitelist <@!member_id>')
     async def whitelist(self, ctx, *, args: str) -> None:
         """
         whitelist the users provided to the command, both mentions and ids are valid.
@@ -97,7 +92,7 @@ class KarmaBlocker(commands.Cog):
         """
         member_set = await convert_content_to_member_set(ctx, args.split())
         for member in member_set:
-            if member_has_role(member, roles()['admin']) and ctx.message.author.id != int(config['owner']):
+            if member_has_role(member, roles()['admin']) and ctx.message.author.id != settings().owner:
                 await ctx.channel.send(f'Skipping {member.display_name}, You cannot whitelist an admin.')
                 continue
 
@@ -105,15 +100,14 @@ class KarmaBlocker(commands.Cog):
                     and not member_has_role(ctx.message.author, roles()['admin']):
                 await ctx.channel.send(f'Skipping {member.display_name}, Only admins can whitelist an moderator.')
 
-            self.blocker_service.whitelist(Member(ctx.guild.id, member.id))
+            await self.blocker_service.whitelist(Member(ctx.guild.id, member.id))
             await ctx.channel.send(f'Whitelisted {member.mention}')
 
     @guild_only()
     @has_required_role(command_name='showblacklist')
     @commands.command(name='showblacklist',
                       brief='list all blacklisted members in the guild the command was invoked in',
-                      usage='{}showblackist'
-                      .format(config['prefix'], config['prefix']))
+                      usage='{prefix}showblackist')
     async def show_blacklist(self, ctx) -> None:
         """
         prints out the blacklist in the channel, if message is over a certain max size the blacklist is embedded
@@ -121,13 +115,13 @@ class KarmaBlocker(commands.Cog):
         :param ctx: context of the invocation
         :return: None
         """
-        blacklist = list(self.blocker_service.find_all_blacklisted(str(ctx.guild.id)))
+        blacklist = await self.blocker_service.find_all_blacklisted(str(ctx.guild.id))
         return_message = ''
         for blacklisted in blacklist:
             member = ctx.guild.get_member(int(blacklisted['member_id']))
             if member is not None:
                 return_message += member.name + '#' + member.discriminator + ' :: '
-            return_message += member.id + '\n'
+            return_message += blacklisted['member_id'] + '\n'
 
         if len(return_message) == 0:
             await ctx.channel.send('Blacklist is empty')
@@ -0,0 +1,100 @@
+import asyncio
+import io
+import logging
+import tempfile
+import time
+
+from discord import File
+from discord.ext import commands
+from discord.ext.commands import guild_only
+
+from core.decorator import has_required_role
+from core.service.transfer_service import file_formats
+
+log = logging.getLogger(__name__)
+
+progress_interval = 2  # seconds between two edits of the import progress message
+
+
+class KarmaTransfer(commands.Cog):
+    # Export the karma and blacklist of a guild into a file and import it again, e.g. to move to another database
+    def __init__(self, bot, transfer_service):
+        self.bot = bot
+        self.transfer_service = transfer_service
+
+    @guild_only()
+    @has_required_role(command_name='export')
+    @commands.command(brief='export the karma and blacklist of the guild as ndjson or csv file',
+                      usage='{prefix}export\n{prefix}export csv')
+    async def export(self, ctx, file_format: str = 'ndjson') -> None:
+        """
+        export the karma and blacklist of the guild into a file that is sent to the channel.
+        :param ctx: context of the invocation
+        :param file_format: ndjson or csv
+        :return: None
+        """
+        if file_format not in file_formats:
+            await ctx.channel.send(f'Unknown format {file_format}, use one of {", ".join(file_formats)}')
+            return
+
+        # the export is written to disk, not memory
+        with tempfile.TemporaryFile() as export_file:
+            stream = io.TextIOWrapper(export_file, encoding='utf-8', newline='')
+            counts = await self.transfer_service.export_guild(str(ctx.guild.id), stream, file_format)
+            stream.flush()
+            stream.detach()
+            if export_file.tell() > ctx.guild.filesize_limit:
+                await ctx.channel.send('The export is too large to be uploaded, use the transfer.py command line '
+                                       'instead')
+                return
+            export_file.seek(0)
+            await ctx.channel.send(f'Exported {counts["karma"]} karma and {counts["blacklist"]} blacklisted members',
+                                   file=File(fp=export_file, filename=f'aura-{ctx.guild.id}.{file_format}'))
+
+    @guild_only()
+    @has_required_role(command_name='import')
+    @commands.command(name='import', brief='import karma and blacklist of an export attached to the message',
+                      usage='{prefix}import (attached export)\n{prefix}import csv (attached export)')
+    async def import_guild(self, ctx, file_format: str = '') -> None:
+        """
+        import an export of this or another guild into this guild, the export is attached to the message.
+        :param ctx: context of the invocation
+        :param file_format: ndjson or csv, by default the extension of the attachment
+        :return: None
+        """
+        if len(ctx.message.attachments) == 0:
+            await ctx.channel.send('Attach the export to the import command')
+            return
+        attachment = ctx.message.attachments[0]
+        if file_format == '':
+            file_format = attachment.filename.rsplit('.', 1)[-1].lower()
+        if file_format not in file_formats:
+            await ctx.channel.send(f'Unknown format {file_format}, use one of {", ".join(file_formats)}')
+            return
+
+        status = await ctx.channel.send('Importing...')
+        loop = asyncio.get_event_loop()
+        last_update = [time.monotonic()]
+
+        def progress(counts) -> None:
+            # called on the database executor, the message is edited on the event loop
+            if time.monotonic() - last_update[0] < progress_interval:
+                return
+            last_update[0] = time.monotonic()
+            asyncio.run_coroutine_threadsafe(
+                status.edit(content=f'Importing... {counts["karma"]} karma and {counts["blacklist"]} '
+                                    f'blacklisted members so far'), loop)
+
+        with tempfile.TemporaryFile() as import_file:
+            await attachment.save(import_file)
+            import_file.seek(0)
+            stream = io.TextIOWrapper(import_file, encoding='utf-8', newline='')
+            try:
+                counts = await self.transfer_service.import_guild(stream, file_format, str(ctx.guild.id), progress)
+            except (ValueError, KeyError) as e:
+                log.error(f'Import into guild {ctx.guild.id} failed: {e}')
+                await status.edit(content=f'Import failed, the export is invalid: {e}')
+                return
+            finally:
+                stream.detach()
+        await status.edit(content=f'Imported {counts["karma"]} karma and {counts["blacklist"]} blacklisted members')
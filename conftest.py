@@ -0,0 +1,6 @@
+from util.config import load_config
+from util.permission import load_permissions
+
+# modules don't read configuration on import anymore, the tests expect it loaded like bot.main does
+load_config()
+load_permissions()
@@ -0,0 +1,70 @@
+import logging
+import os
+from typing import Optional
+
+import yaml
+
+from core.metrics import metrics
+from core.timer import PeriodicTimer
+from util.config import apply_config, read_config
+
+log = logging.getLogger(__name__)
+
+
+class ConfigWatcher:
+    # reloads config.yaml when the file changes, the new configuration replaces the snapshot as a whole.
+    # an invalid file is logged and ignored, aura keeps running with the last valid configuration.
+    def __init__(self, path: str = 'config.yaml', interval: float = 5):
+        self.path = path
+        self.interval = interval
+        self._mtime: Optional[float] = None
+        self._timer = None
+        self.metrics = metrics('config')
+
+    def _modified(self) -> Optional[float]:
+        try:
+            return os.stat(self.path).st_mtime
+        except OSError:
+            return None
+
+    def check(self) -> bool:
+        """
+        reload the configuration, if the file was modified since the last check
+        :return: True if a new configuration was applied
+        """
+        modified = self._modified()
+        if modified is None or modified == self._mtime:
+            return False
+        self._mtime = modified
+        try:
+            apply_config(read_config(self.path))
+        except (OSError, yaml.YAMLError, KeyError, TypeError, ValueError) as e:
+            log.error(f'Keeping the current configuration, {self.path} is invalid: {e}')
+            self.metrics.incr('rejected')
+            return False
+        log.info(f'Reloaded configuration from {self.path}')
+        self.metrics.incr('reloaded')
+        return True
+
+    async def start(self) -> None:
+        """
+        start checking the file for changes, the file as it is now counts as loaded
+        :return: None
+        """
+        if self._timer is not None:
+            return
+        self._mtime = self._modified()
+        self._timer = PeriodicTimer(self._periodic_check, self.interval)
+        await self._timer.start()
+
+    async def stop(self) -> None:
+        """
+        stop checking the file for changes
+        :return: None
+        """
+        if self._timer is not None:
+            await self._timer.stop()
+            self._timer = None
+
+    async def _periodic_check(self) -> None:
+        self.check()
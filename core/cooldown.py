@@ -0,0 +1,226 @@
+import datetime
+import heapq
+import logging
+import time
+from typing import Dict, List, Tuple, Set, Optional
+
+from pymongo.errors import PyMongoError
+
+from core.metrics import metrics
+from core.timer import PeriodicTimer
+
+log = logging.getLogger(__name__)
+
+refresh_tolerance = 0.5  # seconds a stored expiry has to exceed the local one to replace it
+clock_skew = 2  # seconds the clocks of the processes sharing the store may differ, refreshes read that far back
+
+
+class KarmaCooldowns:
+    # giver-receiver pairs on cooldown, stored as expiry timestamps instead of one timer task per pair.
+    # an expired pair is removed when it is looked up, a single sweeper removes the pairs nobody looks up again.
+    # with a store the cooldowns are also persisted, the dicts then act as cache in front of it. the running
+    # cooldowns of a guild are loaded on its first karma message and refreshed periodically, so checks never
+    # wait for the store afterwards.
+    # only used from the event loop, so there is no lock.
+    def __init__(self, sweep_interval: float = 10, store=None, refresh_interval: float = 5):
+        self.sweep_interval = sweep_interval
+        self.store = store  # optional AsyncService of a CooldownStore
+        # a cooldown started by another process is seen at most refresh_interval seconds late,
+        # a cooldown ended early by another process runs out here
+        self.refresh_interval = refresh_interval
+        self._loaded: Set[int] = set()  # guilds whose running cooldowns were read from the store
+        self._refreshed_at: Optional[datetime.datetime] = None  # utc start of the last successful refresh
+        self._refresher = None
+        # guild_id -> giver_id -> receiver_id -> expiry, empty maps are pruned
+        self._expiries: Dict[int, Dict[int, Dict[int, float]]] = {}
+        # (expiry, guild_id, giver_id, receiver_id), entries of cancelled or renewed pairs are skipped by the sweep
+        self._heap: List[Tuple[float, int, int, int]] = []
+        self._sweeper = None
+        self.metrics = metrics('cooldowns')
+
+    def __len__(self) -> int:
+        return sum(len(receivers) for givers in self._expiries.values() for receivers in givers.values())
+
+    def is_on_cooldown(self, guild_id: int, giver_id: int, receiver_id: int) -> bool:
+        """
+        check if a giver-receiver pair is on cooldown, an expired pair is removed on the way.
+        :param guild_id: id of the guild
+        :param giver_id: id of the giver who thanked the receiver.
+        :param receiver_id: id of the receiver who was thanked by the giver.
+        :return: True if the giver can't give the receiver karma yet
+        """
+        expiry = self._expiries.get(guild_id, {}).get(giver_id, {}).get(receiver_id)
+        if expiry is None:
+            return False
+        if expiry > time.monotonic():
+            return True
+        self._remove(guild_id, giver_id, receiver_id)
+        self.metrics.incr('expired')
+        return False
+
+    def put(self, guild_id: int, giver_id: int, receiver_id: int, seconds: float) -> None:
+        """
+        put a giver-receiver pair on cooldown, a running cooldown of the pair is renewed.
+        :param guild_id: id of the guild the cooldown is applied to.
+        :param giver_id: id of the giver who thanked the receiver.
+        :param receiver_id: id of the receiver who was thanked by the giver.
+        :param seconds: duration of the cooldown
+        :return: None
+        """
+        self._set(guild_id, giver_id, receiver_id, time.monotonic() + seconds)
+        self.metrics.incr('started')
+
+    def _set(self, guild_id: int, giver_id: int, receiver_id: int, expiry: float) -> None:
+        self._expiries.setdefault(guild_id, {}).setdefault(giver_id, {})[receiver_id] = expiry
+        heapq.heappush(self._heap, (expiry, guild_id, giver_id, receiver_id))
+
+    def cancel(self, guild_id: int, giver_id: int, receiver_id: int) -> bool:
+        """
+        end the cooldown of a giver-receiver pair early, e.g. because the karma was removed.
+        :param guild_id: id of the guild
+        :param giver_id: id of the giver who thanked the receiver.
+        :param receiver_id: id of the receiver who was thanked by the giver.
+        :return: True if the pair was on cooldown
+        """
+        if self._expiries.get(guild_id, {}).get(giver_id, {}).get(receiver_id) is None:
+            return False
+        self._remove(guild_id, giver_id, receiver_id)
+        self.metrics.incr('cancelled')
+        return True
+
+    def _remove(self, guild_id: int, giver_id: int, receiver_id: int) -> None:
+        givers = self._expiries[guild_id]
+        receivers = givers[giver_id]
+        del receivers[receiver_id]
+        if len(receivers) == 0:
+            del givers[giver_id]
+            if len(givers) == 0:
+                del self._expiries[guild_id]
+
+    def sweep(self) -> int:
+        """
+        remove every pair whose cooldown expired, in order of expiry.
+        :return: amount of pairs removed
+        """
+        now = time.monotonic()
+        removed = 0
+        while len(self._heap) != 0 and self._heap[0][0] <= now:
+            expiry, guild_id, giver_id, receiver_id = heapq.heappop(self._heap)
+            # the pair was cancelled or renewed after this entry was pushed
+            if self._expiries.get(guild_id, {}).get(giver_id, {}).get(receiver_id) != expiry:
+                continue
+            self._remove(guild_id, giver_id, receiver_id)
+            removed += 1
+        self.metrics.incr('expired', removed)
+        self.metrics.set('pending', len(self._heap))
+        return removed
+
+    async def check(self, guild_id: int, giver_id: int, receiver_id: int) -> bool:
+        """
+        check if a giver-receiver pair is on cooldown in this or, with a store, any other process.
+        only the first check of a guild reads the store, it loads every running cooldown of the guild.
+        :param guild_id: id of the guild
+        :param giver_id: id of the giver who thanked the receiver.
+        :param receiver_id: id of the receiver who was thanked by the giver.
+        :return: True if the giver can't give the receiver karma yet
+        """
+        if self.store is not None and guild_id not in self._loaded:
+            # a failed load isn't repeated per message, the periodic refresh reads the guild again
+            self._loaded.add(guild_id)
+            await self.refresh([guild_id])
+        return self.is_on_cooldown(guild_id, giver_id, receiver_id)
+
+    async def refresh(self, guild_ids: List[int] = None) -> int:
+        """
+        read cooldowns of guilds from the store with one query, pairs already cooling down here only get longer.
+        loading guilds reads all of their running cooldowns, the periodic refresh of every loaded guild
+        only reads the cooldowns put since the previous refresh.
+        :param guild_ids: guilds to load, every loaded guild is refreshed if None
+        :return: amount of running cooldowns read
+        """
+        periodic = guild_ids is None
+        guild_ids = list(self._loaded) if periodic else guild_ids
+        if self.store is None or len(guild_ids) == 0:
+            return 0
+        since = None
+        if periodic and self._refreshed_at is not None:
+            since = self._refreshed_at - datetime.timedelta(seconds=clock_skew)
+        started = datetime.datetime.utcnow()
+        self.metrics.incr('store_reads')
+        try:
+            cooldowns = await self.store.find_guilds(guild_ids, since)
+        except PyMongoError as e:
+            # karma keeps working on the local cooldowns while the store is unavailable,
+            # the next refresh reads everything put since the last successful one
+            log.warning(f'Could not read the cooldowns of {len(guild_ids)} guilds: {e}')
+            return 0
+        if periodic:
+            self._refreshed_at = started
+        now, monotonic = datetime.datetime.utcnow(), time.monotonic()
+        for guild_id, giver_id, receiver_id, expires in cooldowns:
+            expiry = monotonic + (expires - now).total_seconds()
+            current = self._expiries.get(guild_id, {}).get(giver_id, {}).get(receiver_id)
+            # the same cooldown read again only differs by the time passed between the clocks, not set again
+            if current is None or expiry - current > refresh_tolerance:
+                self._set(guild_id, giver_id, receiver_id, expiry)
+        return len(cooldowns)
+
+    async def start(self, guild_id: int, giver_id: int, receiver_id: int, seconds: float) -> None:
+        """
+        put a giver-receiver pair on cooldown here and, with a store, for every other process.
+        :param guild_id: id of the guild the cooldown is applied to.
+        :param giver_id: id of the giver who thanked the receiver.
+        :param receiver_id: id of the receiver who was thanked by the giver.
+        :param seconds: duration of the cooldown
+        :return: None
+        """
+        self.put(guild_id, giver_id, receiver_id, seconds)
+        if self.store is None:
+            return
+        try:
+            await self.store.put(guild_id, giver_id, receiver_id, seconds)
+        except PyMongoError as e:
+            log.warning(f'Could not store the cooldown of {giver_id} and {receiver_id} in guild {guild_id}: {e}')
+
+    async def end(self, guild_id: int, giver_id: int, receiver_id: int) -> None:
+        """
+        end the cooldown of a giver-receiver pair early here and, with a store, for every other process.
+        :param guild_id: id of the guild
+        :param giver_id: id of the giver who thanked the receiver.
+        :param receiver_id: id of the receiver who was thanked by the giver.
+        :return: None
+        """
+        self.cancel(guild_id, giver_id, receiver_id)
+        if self.store is None:
+            return
+        try:
+            await self.store.cancel(guild_id, giver_id, receiver_id)
+        except PyMongoError as e:
+            log.warning(f'Could not end the cooldown of {giver_id} and {receiver_id} in guild {guild_id}: {e}')
+
+    async def start_sweeper(self) -> None:
+        """
+        start sweeping expired pairs periodically, once for all pairs.
+        with a store, the cooldowns of the loaded guilds are refreshed periodically as well.
+        :return: None
+        """
+        if self._sweeper is not None:
+            return
+        self._sweeper = PeriodicTimer(self._periodic_sweep, self.sweep_interval)
+        await self._sweeper.start()
+        if self.store is not None:
+            self._refresher = PeriodicTimer(self.refresh, self.refresh_interval)
+            await self._refresher.start()
+
+    async def stop_sweeper(self) -> None:
+        if self._sweeper is not None:
+            await self._sweeper.stop()
+            self._sweeper = None
+        if self._refresher is not None:
+            await self._refresher.stop()
+            self._refresher = None
+
+    async def _periodic_sweep(self) -> None:
+        removed = self.sweep()
+        if removed != 0:
+            log.debug(f'Swept {removed} expired karma cooldowns')
@@ -1,14 +1,91 @@
+import logging
+import threading
+
 from pymongo import MongoClient
 
 from util.config import config
 
+log = logging.getLogger(__name__)
 
-def datasource():
+# pool configuration key -> MongoClient option
+pool_options = {
+    'max_size': 'maxPoolSize',
+    'min_size': 'minPoolSize',
+    'max_idle_time': 'maxIdleTimeMS',
+    'connect_timeout': 'connectTimeoutMS',
+    'socket_timeout': 'socketTimeoutMS',
+    'server_selection_timeout': 'serverSelectionTimeoutMS',
+    'wait_queue_timeout': 'waitQueueTimeoutMS',
+    'compressors': 'compressors',
+}
+
+_client = None
+_lock = threading.Lock()
+
+
+def client_options(database_config: dict) -> dict:
+    """
+    build the MongoClient options out of the database configuration
+    :param database_config: config['database']
+    :return: keyword arguments for the MongoClient
+    """
     # unpack dictionary values
-    client = MongoClient(**config['database']['connection'])
-    return client.get_database(config['database']['name'])
+    options = dict(database_config['connection'])
+    pool = database_config.get('pool') or {}
+    for key, option in pool_options.items():
+        if pool.get(key) is not None:
+            options[option] = pool[key]
+    return options
+
+
+def client() -> MongoClient:
+    """
+    the mongo client shared by all services, created on first use, so importing modules doesn't connect.
+    :return: MongoClient
+    """
+    global _client
+    with _lock:
+        if _client is None:
+            _client = MongoClient(**client_options(config['database']))
+            log.info('Created mongo client')
+        return _client
+
+
+def datasource():
+    return client().get_database(config['database']['name'])
+
+
+def close() -> None:
+    """
+    close the shared mongo client and its connection pool, the next use creates a new one.
+    :return: None
+    """
+    global _client
+    with _lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+            log.info('Closed mongo client')
+
+
+# collections used in the application
+def blacklist():
+    return datasource().blacklist
+
+
+def karma():
+    return datasource().karma
+
+
+# pre-aggregated karma, see KarmaMemberService
+def karma_totals():
+    return datasource().karma_totals
+
+
+def karma_daily():
+    return datasource().karma_daily
 
 
-# create two global variables for mongodb collections used in the application
-blacklist = datasource().blacklist
-karma = datasource().karma
+# optional, see CooldownStore
+def cooldowns():
+    return datasource().cooldowns
@@ -2,7 +2,7 @@ import logging
 
 from discord.ext.commands import check
 
-from util.config import config, roles
+from util.config import roles, settings
 from util.permission import permission_map
 from util.util import member_has_role
 
@@ -23,16 +23,16 @@ def has_required_role(command_name):
         if role.lower() == 'everyone':
             return True
         elif role.lower() == 'owner':
-            if caller.id == int(config['owner']):
+            if caller.id == settings().owner:
                 return True
         elif role.lower() == 'moderator':
             if member_has_role(caller, roles()['moderator']) \
                     or member_has_role(caller, roles()['admin']) \
-                    or caller.id == int(config['owner']):
+                    or caller.id == settings().owner:
                 return True
         elif role.lower() == 'admin':
             if member_has_role(caller, roles()['admin']) \
-                    or caller.id == int(config['owner']):
+                    or caller.id == settings().owner:
                 return True
         return False
     return check(predicate)
@@ -0,0 +1,114 @@
+import logging
+import time
+from typing import List
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import PyMongoError
+
+log = logging.getLogger(__name__)
+
+# indexes aura expects on its collections, collection name -> index name -> index keys
+expected_indexes = {
+    'karma': {
+        'guild_member': [('guild_id', ASCENDING), ('member_id', ASCENDING)],
+        'guild_channel_created': [('guild_id', ASCENDING), ('channel_id', ASCENDING), ('created_date', ASCENDING)],
+        'message': [('message_id', ASCENDING)],
+        # compaction of karma older than the retention period
+        'created': [('created_date', ASCENDING)],
+        'compaction': [('compaction', ASCENDING)],
+    },
+    'karma_totals': {
+        'guild_member_channel': [('guild_id', ASCENDING), ('member_id', ASCENDING), ('channel_id', ASCENDING)],
+        # leaderboard order, member_id breaks ties so pages can continue after the last shown member
+        'guild_channel_karma_member': [('guild_id', ASCENDING), ('channel_id', ASCENDING), ('karma', DESCENDING),
+                                       ('member_id', ASCENDING)],
+    },
+    'karma_daily': {
+        'guild_channel_member_day': [('guild_id', ASCENDING), ('channel_id', ASCENDING), ('member_id', ASCENDING),
+                                     ('day', ASCENDING)],
+        'guild_channel_day': [('guild_id', ASCENDING), ('channel_id', ASCENDING), ('day', ASCENDING)],
+        'guild_day': [('guild_id', ASCENDING), ('day', ASCENDING)],
+    },
+    'blacklist': {
+        'guild_member': [('guild_id', ASCENDING), ('member_id', ASCENDING)],
+    },
+    # expires lets mongodb delete expired cooldowns, guild_expires loads the running cooldowns of guilds
+    # and guild_updated the cooldowns put since their last refresh
+    'cooldowns': {
+        'expires': [('expires', ASCENDING)],
+        'guild_expires': [('guild_id', ASCENDING), ('expires', ASCENDING)],
+        'guild_updated': [('guild_id', ASCENDING), ('updated', ASCENDING)],
+    },
+}
+
+# indexes that additionally enforce uniqueness, a member only has one total and one bucket per channel and day
+unique_indexes = {
+    'karma_totals': ['guild_member_channel'],
+    'karma_daily': ['guild_channel_member_day'],
+}
+
+# sparse indexes, only documents with the indexed field are part of the index
+sparse_indexes = {
+    'karma': ['compaction'],
+}
+
+# ttl indexes, index name -> seconds after the indexed date at which mongodb deletes the document
+ttl_indexes = {
+    'cooldowns': {'expires': 0},
+}
+
+
+def _index_keys(collection) -> List[list]:
+    """
+    the key specifications of all indexes that exist on the collection
+    :param collection: mongodb collection
+    :return: list of key lists, e.g. [[('guild_id', 1), ('member_id', 1)]]
+    """
+    return [[(field, direction) for field, direction in info['key']]
+            for info in collection.index_information().values()]
+
+
+def missing_indexes(*collections) -> List[str]:
+    """
+    compare the existing indexes of the collections with the expected ones.
+    indexes are compared by their keys, so an index created under another name still counts.
+    :param collections: mongodb collections to verify
+    :return: names of missing indexes formatted as collection.index
+    """
+    missing = []
+    for collection in collections:
+        existing = _index_keys(collection)
+        for name, keys in expected_indexes.get(collection.name, {}).items():
+            if keys not in existing:
+                missing.append(f'{collection.name}.{name}')
+    return missing
+
+
+def ensure_indexes(*collections) -> List[str]:
+    """
+    create every expected index that does not exist yet and log how long each build took.
+    :param collections: mongodb collections to create the indexes on
+    :return: names of indexes that are still missing afterwards, formatted as collection.index
+    """
+    for collection in collections:
+        existing = _index_keys(collection)
+        for name, keys in expected_indexes.get(collection.name, {}).items():
+            if keys in existing:
+                continue
+            start = time.perf_counter()
+            options = dict(unique=name in unique_indexes.get(collection.name, []))
+            if name in sparse_indexes.get(collection.name, []):
+                options['sparse'] = True
+            if name in ttl_indexes.get(collection.name, {}):
+                options['expireAfterSeconds'] = ttl_indexes[collection.name][name]
+            try:
+                collection.create_index(keys, name=name, **options)
+            except PyMongoError as e:
+                log.error(f'Could not create index {name} on {collection.name}: {e}')
+                continue
+            log.info(f'Created index {name} on {collection.name} in {time.perf_counter() - start:.3f}s')
+
+    missing = missing_indexes(*collections)
+    for index in missing:
+        log.critical(f'Expected index {index} is missing, queries on it will scan the whole collection')
+    return missing
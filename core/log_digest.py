@@ -0,0 +1,125 @@
+import asyncio
+import logging
+from typing import List
+
+import discord
+
+from core.metrics import metrics
+from core.timer import PeriodicTimer
+from util.config import settings
+
+log = logging.getLogger(__name__)
+
+# discord rejects messages longer than this
+message_limit = 2000
+
+
+def digest_messages(lines: List[str], limit: int = message_limit) -> List[str]:
+    """
+    join log lines into as few messages as possible, a line longer than a message is cut.
+    :param lines: log lines in the order they happened
+    :param limit: maximum length of a message
+    :return: messages to send
+    """
+    messages = []
+    current = ''
+    for line in lines:
+        line = line if len(line) <= limit else line[:limit - 3] + '...'
+        if current == '':
+            current = line
+        elif len(current) + 1 + len(line) <= limit:
+            current += '\n' + line
+        else:
+            messages.append(current)
+            current = line
+    if current != '':
+        messages.append(current)
+    return messages
+
+
+class KarmaLogDigest:
+    # buffers the lines for the log channel and sends them as digest messages, every interval seconds or
+    # as soon as a message is almost full. one message per karma event runs into the rate limit of the channel.
+    def __init__(self, bot, interval: float = 5, flush_at: int = 1800):
+        self.bot = bot
+        self.interval = interval
+        self.flush_at = flush_at
+        self._lines: List[str] = []
+        self._length = 0
+        # flushes are sent one after another, so the log keeps the order of the events.
+        # created on first use, the lock has to belong to the loop of the bot
+        self._flush_lock = None
+        self._scheduled = None  # flush scheduled because the buffer is almost a full message
+        self._timer = None
+        self.metrics = metrics('log_digest')
+
+    def __len__(self) -> int:
+        return len(self._lines)
+
+    def add(self, line: str) -> None:
+        """
+        buffer a line for the log channel, a buffer that is almost a full message is flushed right away.
+        :param line: line to log
+        :return: None
+        """
+        self._lines.append(line)
+        self._length += len(line) + 1
+        self.metrics.incr('lines')
+        if self._length >= self.flush_at and self._scheduled is None:
+            self._scheduled = asyncio.ensure_future(self.flush())
+
+    async def flush(self) -> int:
+        """
+        send the buffered lines to the configured log channel
+        :return: amount of messages sent
+        """
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            lines, self._lines, self._length = self._lines, [], 0
+            self._scheduled = None
+            if len(lines) == 0:
+                return 0
+            channel_id = settings().log_channel
+            channel = self.bot.get_channel(channel_id) if channel_id is not None else None
+            if channel is None:
+                log.warning(f'Dropping {len(lines)} log lines, the log channel {channel_id} is not available')
+                self.metrics.incr('dropped', len(lines))
+                return 0
+            sent = 0
+            for content in digest_messages(lines):
+                try:
+                    await channel.send(content)
+                    sent += 1
+                except discord.HTTPException as e:
+                    log.error(f'Could not send log digest to channel {channel_id}: {e}')
+                    self.metrics.incr('failed')
+            self.metrics.incr('messages', sent)
+            return sent
+
+    async def start(self) -> None:
+        """
+        start flushing the buffered lines periodically
+        :return: None
+        """
+        if self._timer is not None:
+            return
+        self._timer = PeriodicTimer(self._periodic_flush, self.interval)
+        await self._timer.start()
+
+    async def close(self) -> None:
+        """
+        stop the periodic flushing and send what is still buffered, called before the bot disconnects.
+        :return: None
+        """
+        if self._timer is not None:
+            await self._timer.stop()
+            self._timer = None
+        await self.flush()
+
+    async def _periodic_flush(self) -> None:
+        # a failed flush must not stop the timer
+        try:
+            await self.flush()
+        except Exception as e:
+            log.error(f'Periodic flush of the log digest failed: {e}')
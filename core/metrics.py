@@ -0,0 +1,78 @@
+import threading
+from collections import defaultdict
+from typing import Dict
+
+
+class Metrics:
+    # counters and timings of a single component, e.g. the write buffer.
+    # components update them from the event loop and from executor threads, so updates are locked.
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._counters = defaultdict(int)
+        # timing name -> [count, total, max]
+        self._timings = defaultdict(lambda: [0, 0.0, 0.0])
+
+    def incr(self, key: str, amount: int = 1) -> None:
+        """
+        increment a counter
+        :param key: name of the counter
+        :param amount: amount to add
+        :return: None
+        """
+        with self._lock:
+            self._counters[key] += amount
+
+    def set(self, key: str, value: int) -> None:
+        """
+        set a gauge, e.g. the current size of a queue
+        :param key: name of the gauge
+        :param value: current value
+        :return: None
+        """
+        with self._lock:
+            self._counters[key] = value
+
+    def observe(self, key: str, value: float) -> None:
+        """
+        record a sample of a timing or size
+        :param key: name of the timing
+        :param value: the sample
+        :return: None
+        """
+        with self._lock:
+            timing = self._timings[key]
+            timing[0] += 1
+            timing[1] += value
+            timing[2] = max(timing[2], value)
+
+    def counter(self, key: str) -> int:
+        with self._lock:
+            return self._counters[key]
+
+    def snapshot(self) -> Dict[str, float]:
+        """
+        the current values of all counters and the count, average and max of every timing
+        :return: metric name to value
+        """
+        with self._lock:
+            result = dict(self._counters)
+            for key, (count, total, maximum) in self._timings.items():
+                result[f'{key}_count'] = count
+                result[f'{key}_avg'] = round(total / count, 3) if count > 0 else 0
+                result[f'{key}_max'] = round(maximum, 3)
+            return result
+
+
+registry: Dict[str, Metrics] = {}  # component name to its metrics
+
+
+def metrics(name: str) -> Metrics:
+    """
+    get the metrics of a component, they are created on first use
+    :param name: name of the component
+    :return: Metrics
+    """
+    if name not in registry:
+        registry[name] = Metrics(name)
+    return registry[name]
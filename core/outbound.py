@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Set, Tuple
+
+import discord
+
+from core.metrics import metrics
+from core.throttle import TokenBucket
+
+log = logging.getLogger(__name__)
+
+# discord's per channel rate limit buckets, route -> (requests per second, burst)
+default_routes = {
+    'reaction': (4, 1),
+    'message': (1, 5),
+}
+
+
+class OutboundQueue:
+    # reactions and replies of aura, sent by one worker per channel, so karma bookkeeping never waits on discord.
+    # each worker paces its routes to stay within the rate limits of the channel instead of running into 429s.
+    # a reaction that is already queued for a message isn't queued again.
+    def __init__(self, routes: Dict[str, Tuple[float, float]] = None, idle_timeout: float = 60):
+        self.routes = routes if routes is not None else default_routes
+        self.idle_timeout = idle_timeout  # seconds a worker waits for work before it stops
+        self._queues: Dict[int, asyncio.Queue] = {}
+        self._workers: Dict[int, asyncio.Task] = {}
+        self._pending_reactions: Set[Tuple[int, str]] = set()  # (message id, emoji) of queued reactions
+        self.metrics = metrics('outbound')
+
+    def __len__(self) -> int:
+        return sum(queue.qsize() for queue in self._queues.values())
+
+    def add_reaction(self, message: discord.Message, emoji) -> None:
+        """
+        queue a reaction of aura on a message
+        :param message: message to react on
+        :param emoji: emoji of the reaction
+        :return: None
+        """
+        key = (message.id, str(emoji))
+        if key in self._pending_reactions:
+            self.metrics.incr('reaction_deduplicated')
+            return
+        self._pending_reactions.add(key)
+        self._enqueue(message.channel.id, 'reaction', key, lambda: message.add_reaction(emoji))
+
+    def send(self, channel: discord.abc.Messageable, content: str) -> None:
+        """
+        queue a message
+        :param channel: channel to send the message to
+        :param content: content of the message
+        :return: None
+        """
+        self._enqueue(channel.id, 'message', None, lambda: channel.send(content))
+
+    def _enqueue(self, channel_id: int, route: str, key, action) -> None:
+        queue = self._queues.get(channel_id)
+        if queue is None:
+            queue = self._queues[channel_id] = asyncio.Queue()
+            self._workers[channel_id] = asyncio.ensure_future(self._work(channel_id, queue))
+        queue.put_nowait((route, key, action, time.perf_counter()))
+        self.metrics.set('depth', len(self))
+
+    async def _work(self, channel_id: int, queue: asyncio.Queue) -> None:
+        buckets: Dict[str, TokenBucket] = {}
+        while True:
+            try:
+                route, key, action, queued = await asyncio.wait_for(queue.get(), self.idle_timeout)
+            except asyncio.TimeoutError:
+                # nothing was queued while waiting, the next action starts a new worker
+                del self._queues[channel_id]
+                del self._workers[channel_id]
+                return
+            try:
+                await self._pace(buckets, route)
+                self.metrics.observe(f'{route}_wait_ms', (time.perf_counter() - queued) * 1000)
+                start = time.perf_counter()
+                try:
+                    await action()
+                except Exception as e:
+                    # a failed action must not stop the worker, the queue of the channel would stall
+                    log.warning(f'Outbound {route} in channel {channel_id} failed: {e}')
+                    self.metrics.incr(f'{route}_failed')
+                self.metrics.observe(f'{route}_latency_ms', (time.perf_counter() - start) * 1000)
+            finally:
+                if key is not None:
+                    self._pending_reactions.discard(key)
+                queue.task_done()
+                self.metrics.set('depth', len(self))
+
+    async def _pace(self, buckets: Dict[str, TokenBucket], route: str) -> None:
+        """
+        wait until the rate limit bucket of the route has a request left
+        :param buckets: route -> bucket of the channel
+        :param route: route of the next request
+        :return: None
+        """
+        rate, burst = self.routes[route]
+        now = time.monotonic()
+        bucket = buckets.get(route)
+        if bucket is None:
+            bucket = buckets[route] = TokenBucket(burst, now)
+        if bucket.refill(rate, burst, now) < 1:
+            await asyncio.sleep((1 - bucket.tokens) / rate)
+            bucket.refill(rate, burst, time.monotonic())
+        bucket.tokens -= 1
+
+    async def join(self) -> None:
+        """
+        wait until every queued action was sent
+        :return: None
+        """
+        await asyncio.gather(*[queue.join() for queue in list(self._queues.values())])
+
+    async def close(self, timeout: float = 10) -> None:
+        """
+        send what is still queued, at most for timeout seconds, and stop the workers.
+        :param timeout: seconds to wait for the queues to drain
+        :return: None
+        """
+        try:
+            await asyncio.wait_for(self.join(), timeout)
+        except asyncio.TimeoutError:
+            log.warning(f'Dropping {len(self)} outbound actions that could not be sent on shutdown')
+        for worker in list(self._workers.values()):
+            worker.cancel()
+        self._queues.clear()
+        self._workers.clear()
+        self._pending_reactions.clear()
@@ -0,0 +1,158 @@
+import asyncio
+import functools
+import logging
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+
+from core.timer import PeriodicTimer
+
+log = logging.getLogger(__name__)
+
+# blocking pymongo calls run on these threads, so a slow query never stalls the discord.py event loop
+executor = ThreadPoolExecutor(thread_name_prefix='aura-db')
+
+
+def _call(func, *args, **kwargs):
+    """
+    call the blocking service method, cursors are read completely while still on the executor thread,
+    iterating them on the event loop would do the network round trips there.
+    :param func: blocking service method
+    :return: result of the method, a list for cursors
+    """
+    result = func(*args, **kwargs)
+    if isinstance(result, Iterator):
+        return list(result)
+    return result
+
+
+class AsyncService:
+    # awaitable variant of a synchronous database service, every public method of the wrapped service
+    # is available as coroutine with the same arguments and runs on the database executor.
+
+    def __init__(self, service, service_executor: ThreadPoolExecutor = executor):
+        self.service = service
+        self._executor = service_executor
+
+    def __getattr__(self, name):
+        attribute = getattr(self.service, name)
+        if name.startswith('_') or not callable(attribute):
+            return attribute
+
+        async def call(*args, **kwargs):
+            return await self.run(attribute, *args, **kwargs)
+
+        return call
+
+    async def run(self, func, *args, **kwargs):
+        """
+        run a blocking function on the database executor
+        :param func: function to run
+        :return: result of the function, cursors are returned as list
+        """
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(_call, func, *args, **kwargs))
+
+
+class AsyncKarmaMemberService(AsyncService):
+    # awaitable KarmaMemberService, used by the cogs
+    def __init__(self, service, service_executor: ThreadPoolExecutor = executor):
+        super().__init__(service, service_executor)
+        self._flush_timer = None
+        self._retention_timer = None
+
+    async def start_write_behind(self) -> None:
+        """
+        start flushing the write buffer of the service periodically, if it has one.
+        :return: None
+        """
+        write_buffer = self.service.write_buffer
+        if write_buffer is None or self._flush_timer is not None:
+            return
+        self._flush_timer = PeriodicTimer(self._periodic_flush, write_buffer.interval)
+        await self._flush_timer.start()
+
+    async def stop_write_behind(self) -> None:
+        """
+        stop the periodic flushing and write everything that is still pending.
+        :return: None
+        """
+        if self._flush_timer is not None:
+            await self._flush_timer.stop()
+            self._flush_timer = None
+        await self.flush()
+
+    async def start_retention(self) -> None:
+        """
+        start compacting old karma periodically, if the service has a retention.
+        :return: None
+        """
+        retention = self.service.retention
+        if retention is None or self._retention_timer is not None:
+            return
+        self._retention_timer = PeriodicTimer(self._periodic_compaction, retention.interval)
+        await self._retention_timer.start()
+
+    async def stop_retention(self) -> None:
+        """
+        stop the periodic compaction, a running batch is finished on the executor.
+        :return: None
+        """
+        if self._retention_timer is not None:
+            await self._retention_timer.stop()
+            self._retention_timer = None
+
+    async def find_message(self, message_id: str):
+        """
+        find a message by its id, messages the message filter rules out are answered without the executor.
+        :param message_id: id of the message to find
+        :return: karma member whose message id is equal to the parameter message id
+        """
+        message_filter = self.service.message_filter
+        if message_filter is not None and not message_filter.might_contain(message_id):
+            return None
+        return await self.run(self.service.find_message, message_id)
+
+    async def _periodic_flush(self) -> None:
+        # a failed flush is logged by the buffer, the timer has to keep running for the next one
+        try:
+            await self.flush()
+        except Exception as e:
+            log.error(f'Periodic flush of the write buffer failed: {e}')
+
+    async def _periodic_compaction(self) -> None:
+        # a failed run is retried by the next one, the timer has to keep running
+        try:
+            await self.run(self.service.retention.compact)
+        except Exception as e:
+            log.error(f'Periodic compaction of old karma failed: {e}')
+
+
+class AsyncKarmaChannelService(AsyncService):
+    # awaitable KarmaChannelService, used by the cogs
+    async def aggregate_top_karma_channels(self, guild_id: str, time_span: int = 0) -> list:
+        """
+        aggregate the top karma channels of a guild, cached channels are answered without the executor.
+        :param guild_id: guild to aggregate top channels for
+        :param time_span: time span in days, 0 for all time
+        :return: list containing channel information and karma
+        """
+        channel_cache = self.service.channel_cache
+        if channel_cache is not None:
+            channels = channel_cache.get(guild_id, time_span)
+            if channels is not None:
+                return channels
+        return await self.run(self.service.refresh_top_karma_channels, guild_id, time_span)
+
+
+class AsyncBlockerService(AsyncService):
+    # awaitable BlockerService, used by the cogs
+    async def find_member(self, member):
+        """
+        looks for a member inside the blacklist, once the blacklist of the guild is cached
+        this is a set lookup that doesn't need the executor.
+        :param member: member to check if is inside the blacklist
+        :return: the member if he exists or None
+        """
+        if self.service.is_loaded(member.guild_id):
+            return self.service.find_member(member)
+        return await self.run(self.service.find_member, member)
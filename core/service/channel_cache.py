@@ -0,0 +1,57 @@
+import threading
+import time
+from typing import Optional
+
+from core.metrics import metrics
+
+
+class KarmaChannelCache:
+    # per guild cache of the top karma channels. an entry is served until it is older than ttl seconds or
+    # karma of the guild changes, so repeated channel leaderboards don't group the whole guild again.
+    def __init__(self, ttl: float = 60):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}  # guild_id -> time_span -> (time the aggregation started, top channels)
+        self._changed = {}  # guild_id -> time of the last karma change
+        self.metrics = metrics('channel_cache')
+
+    def get(self, guild_id: str, time_span: int) -> Optional[list]:
+        """
+        the cached top channels of a guild
+        :param guild_id: guild of the channels
+        :param time_span: time span of the leaderboard, 0 for all time
+        :return: the top channels or None if they aren't cached or expired
+        """
+        with self._lock:
+            entry = self._entries.get(guild_id, {}).get(time_span)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                self.metrics.incr('misses')
+                return None
+            self.metrics.incr('hits')
+            return entry[1]
+
+    def put(self, guild_id: str, time_span: int, channels: list, started: float) -> None:
+        """
+        cache the top channels of a guild
+        :param guild_id: guild of the channels
+        :param time_span: time span of the leaderboard, 0 for all time
+        :param channels: the top channels
+        :param started: time.monotonic() before the aggregation started
+        :return: None
+        """
+        with self._lock:
+            # karma changed while aggregating, the result might not contain the change
+            if started < self._changed.get(guild_id, 0):
+                return
+            self._entries.setdefault(guild_id, {})[time_span] = (started, channels)
+
+    def invalidate(self, guild_id: str) -> None:
+        """
+        drop the cached top channels of a guild, called on every karma gain and removal.
+        :param guild_id: guild whose karma changed
+        :return: None
+        """
+        with self._lock:
+            self._changed[guild_id] = time.monotonic()
+            if self._entries.pop(guild_id, None) is not None:
+                self.metrics.incr('invalidations')
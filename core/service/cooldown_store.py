@@ -0,0 +1,73 @@
+import datetime
+import logging
+from typing import Optional, List, Tuple
+
+from pymongo.results import UpdateResult, DeleteResult
+
+log = logging.getLogger(__name__)
+
+
+def cooldown_id(guild_id: int, giver_id: int, receiver_id: int) -> str:
+    """
+    the _id of the cooldown document of a giver-receiver pair, lookups go through the _id index
+    :param guild_id: id of the guild
+    :param giver_id: id of the giver
+    :param receiver_id: id of the receiver
+    :return: document id
+    """
+    return f'{guild_id}:{giver_id}:{receiver_id}'
+
+
+class CooldownStore:
+    # cooldowns of giver-receiver pairs in a mongodb collection, so they survive restarts and are shared
+    # by every shard process. the ttl index on expires lets mongodb delete expired cooldowns, since its
+    # ttl monitor only runs every minute, reads check the expiry themselves. updated is the time a cooldown
+    # was last put, so periodic reads only return the cooldowns started or renewed since the previous read.
+    def __init__(self, ds_collection):
+        self._cooldowns = ds_collection
+
+    def find_guilds(self, guild_ids: List[int], since: Optional[datetime.datetime] = None) \
+            -> List[Tuple[int, int, int, datetime.datetime]]:
+        """
+        the running cooldowns of the guilds, read with one query through the guild_id and expires index,
+        or the guild_id and updated index if only recent cooldowns are read.
+        :param guild_ids: ids of the guilds
+        :param since: utc datetime, only cooldowns put after it are read, every running cooldown if None
+        :return: guild_id, giver_id, receiver_id and the utc datetime the cooldown ends, of every pair on cooldown
+        """
+        if len(guild_ids) == 0:
+            return []
+        query = {'guild_id': {'$in': [str(guild_id) for guild_id in guild_ids]},
+                 'expires': {'$gt': datetime.datetime.utcnow()}}
+        if since is not None:
+            query['updated'] = {'$gt': since}
+        cooldowns = []
+        for document in self._cooldowns.find(query):
+            guild_id, giver_id, receiver_id = document['_id'].split(':')
+            cooldowns.append((int(guild_id), int(giver_id), int(receiver_id), document['expires']))
+        return cooldowns
+
+    def put(self, guild_id: int, giver_id: int, receiver_id: int, seconds: float) -> UpdateResult:
+        """
+        put a giver-receiver pair on cooldown, a running cooldown of the pair is renewed.
+        :param guild_id: id of the guild the cooldown is applied to.
+        :param giver_id: id of the giver who thanked the receiver.
+        :param receiver_id: id of the receiver who was thanked by the giver.
+        :param seconds: duration of the cooldown
+        :return: update result
+        """
+        now = datetime.datetime.utcnow()
+        return self._cooldowns.update_one({'_id': cooldown_id(guild_id, giver_id, receiver_id)},
+                                          {'$set': {'guild_id': str(guild_id), 'updated': now,
+                                                    'expires': now + datetime.timedelta(seconds=seconds)}},
+                                          upsert=True)
+
+    def cancel(self, guild_id: int, giver_id: int, receiver_id: int) -> DeleteResult:
+        """
+        end the cooldown of a giver-receiver pair early
+        :param guild_id: id of the guild
+        :param giver_id: id of the giver who thanked the receiver.
+        :param receiver_id: id of the receiver who was thanked by the giver.
+        :return: delete result
+        """
+        return self._cooldowns.delete_one({'_id': cooldown_id(guild_id, giver_id, receiver_id)})
@@ -0,0 +1,310 @@
+import datetime
+import heapq
+import threading
+from collections import defaultdict
+from typing import List, Dict, Tuple, Optional, Iterator
+
+from pymongo.results import DeleteResult
+
+from core.model.member import KarmaMember, Member
+from core.service.mongo_service import day_of
+from core.service.storage import KarmaStorage, ChannelStorage, BlacklistStorage
+from util.config import settings
+
+
+def _leaderboard_key(item: Tuple[str, int]):
+    # karma descending, ties ordered by id like the mongodb leaderboards
+    return -item[1], item[0]
+
+
+class MemoryKarmaStore:
+    # karma and blacklist of all guilds held in dicts, shared by the memory services of one bot.
+    # nothing is persisted, it is meant for small single guild deployments, tests and benchmarks.
+    def __init__(self):
+        self.lock = threading.RLock()
+        # (guild_id, member_id, channel_id, message_id, created_date) -> karma document
+        self.documents = {}
+        self.messages = defaultdict(set)  # message_id -> keys of its karma documents
+        self.members = defaultdict(set)  # (guild_id, member_id) -> keys of the karma documents of the member
+        self.totals = defaultdict(dict)  # (guild_id, channel_id) -> member_id -> karma, channel_id '' for the guild
+        self.channels = defaultdict(dict)  # guild_id -> channel_id -> karma
+        # guild_id -> day -> (channel_id, member_id) -> karma
+        self.daily = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
+        self.blacklist = defaultdict(set)  # guild_id -> blacklisted member ids
+
+    def add(self, document: dict) -> None:
+        """
+        add a karma document and its karma to the totals, has to be called while holding the lock
+        :param document: karma document
+        :return: None
+        """
+        key = (document['guild_id'], document['member_id'], document['channel_id'], document['message_id'],
+               document['created_date'])
+        self.documents[key] = document
+        self.messages[document['message_id']].add(key)
+        self.members[(document['guild_id'], document['member_id'])].add(key)
+        self.inc(document, document['karma'])
+
+    def remove(self, key: tuple) -> dict:
+        """
+        remove a karma document and its karma from the totals, has to be called while holding the lock
+        :param key: key of the karma document
+        :return: the removed document
+        """
+        document = self.documents.pop(key)
+        self._discard(self.messages, document['message_id'], key)
+        self._discard(self.members, (document['guild_id'], document['member_id']), key)
+        self.inc(document, -document['karma'])
+        return document
+
+    @staticmethod
+    def _discard(index: dict, index_key, key: tuple) -> None:
+        keys = index[index_key]
+        keys.discard(key)
+        if len(keys) == 0:
+            del index[index_key]
+
+    def inc(self, document: dict, amount: int) -> None:
+        """
+        change the totals, channel totals and daily bucket of a karma document, empty entries are removed
+        :param document: karma document
+        :param amount: karma to add, negative to remove karma
+        :return: None
+        """
+        guild_id, member_id, channel_id = document['guild_id'], document['member_id'], document['channel_id']
+        for totals_key in [(guild_id, ''), (guild_id, channel_id)]:
+            self._inc_entry(self.totals, totals_key, member_id, amount)
+        self._inc_entry(self.channels, guild_id, channel_id, amount)
+        self._inc_entry(self.daily[guild_id], day_of(document['created_date']), (channel_id, member_id), amount)
+
+    @staticmethod
+    def _inc_entry(index: dict, index_key, key, amount: int) -> None:
+        entries = index[index_key]
+        karma = entries.get(key, 0) + amount
+        if karma > 0:
+            entries[key] = karma
+            return
+        entries.pop(key, None)
+        if len(entries) == 0:
+            del index[index_key]
+
+    def rebuild(self, guild_id: str = None) -> None:
+        """
+        recompute the totals, channel totals and daily buckets from the documents,
+        has to be called while holding the lock
+        :param guild_id: optional guild to recompute, all guilds if None
+        :return: None
+        """
+        for totals_key in [key for key in self.totals if guild_id is None or key[0] == guild_id]:
+            del self.totals[totals_key]
+        for index in [self.channels, self.daily]:
+            for index_key in [key for key in index if guild_id is None or key == guild_id]:
+                del index[index_key]
+        for document in self.documents.values():
+            if guild_id is None or document['guild_id'] == guild_id:
+                self.inc(document, document['karma'])
+
+    def recent(self, guild_id: str, time_span: int) -> Iterator[Tuple[Tuple[str, str], int]]:
+        """
+        the daily buckets of the last days of a guild, has to be called while holding the lock
+        :param guild_id: guild of the buckets
+        :param time_span: amount of days including today
+        :return: iterator of (channel_id, member_id) and karma
+        """
+        since = day_of(datetime.datetime.utcnow()) - datetime.timedelta(days=time_span - 1)
+        for day, buckets in self.daily.get(guild_id, {}).items():
+            if day >= since:
+                yield from buckets.items()
+
+
+class MemoryKarmaMemberService(KarmaStorage):
+    # KarmaStorage in memory, totals are dicts and leaderboards are read with heaps
+    def __init__(self, store: MemoryKarmaStore, channel_cache=None):
+        self._store = store
+        self.channel_cache = channel_cache
+
+    def upsert_karma_member(self, member: KarmaMember) -> None:
+        with self._store.lock:
+            key = (member.guild_id, member.member_id, member.channel_id, member.message_id, member.created_date)
+            document = self._store.documents.get(key)
+            if document is not None:
+                self._store.remove(key)
+                self._store.add(dict(document, karma=document['karma'] + 1))
+            else:
+                self._store.add(dict(vars(member), karma=1))
+        self._karma_changed(member.guild_id)
+
+    def delete_single_karma(self, member: KarmaMember) -> DeleteResult:
+        with self._store.lock:
+            key = next((key for key in self._store.messages.get(member.message_id, ())
+                        if key[:3] == (member.guild_id, member.member_id, member.channel_id)), None)
+            if key is not None:
+                self._store.remove(key)
+        if key is not None:
+            self._karma_changed(member.guild_id)
+        return DeleteResult({'n': 0 if key is None else 1}, acknowledged=True)
+
+    def delete_message_karma(self, guild_id: str, message_id: str) -> List[str]:
+        with self._store.lock:
+            keys = [key for key in self._store.messages.get(message_id, ()) if key[0] == guild_id]
+            member_ids = [self._store.remove(key)['member_id'] for key in keys]
+        if len(member_ids) != 0:
+            self._karma_changed(guild_id)
+        return list(dict.fromkeys(member_ids))
+
+    def delete_all_karma(self, member: KarmaMember) -> DeleteResult:
+        with self._store.lock:
+            keys = list(self._store.members.get((member.guild_id, member.member_id), ()))
+            for key in keys:
+                self._store.remove(key)
+        self._karma_changed(member.guild_id)
+        return DeleteResult({'n': len(keys)}, acknowledged=True)
+
+    def rebuild_karma_totals(self, guild_id: str = None) -> int:
+        # the totals, channel totals and daily buckets are rebuilt together from the documents
+        with self._store.lock:
+            self._store.rebuild(guild_id)
+            return sum(len(members) for (totals_guild_id, _), members in self._store.totals.items()
+                       if guild_id is None or totals_guild_id == guild_id)
+
+    def rebuild_daily_karma(self, guild_id: str = None) -> int:
+        with self._store.lock:
+            self._store.rebuild(guild_id)
+            return sum(len(buckets) for daily_guild_id, days in self._store.daily.items()
+                       if guild_id is None or daily_guild_id == guild_id for buckets in days.values())
+
+    def stream_karma(self, guild_id: str, batch_size: int = 1000) -> Iterator[dict]:
+        with self._store.lock:
+            documents = [dict(document) for document in self._store.documents.values()
+                         if document['guild_id'] == guild_id]
+        return iter(documents)
+
+    def import_karma(self, documents: List[dict]) -> int:
+        with self._store.lock:
+            for document in documents:
+                key = (document['guild_id'], document['member_id'], document['channel_id'], document['message_id'],
+                       document['created_date'])
+                if key in self._store.documents:
+                    self._store.remove(key)
+                self._store.add(dict(document))
+        for guild_id in {document['guild_id'] for document in documents}:
+            self._karma_changed(guild_id)
+        return len(documents)
+
+    def aggregate_member_by_karma(self, member: KarmaMember) -> Optional[int]:
+        with self._store.lock:
+            return self._store.totals.get((member.guild_id, ''), {}).get(member.member_id)
+
+    def aggregate_members_by_karma(self, guild_id: str, member_ids: List[str]) -> Dict[str, int]:
+        with self._store.lock:
+            totals = self._store.totals.get((guild_id, ''), {})
+            return {str(member_id): totals.get(str(member_id), 0) for member_id in member_ids}
+
+    def aggregate_member_by_channels(self, member: KarmaMember) -> Iterator[dict]:
+        with self._store.lock:
+            karma = [(channel_id, self._store.totals[(member.guild_id, channel_id)][member.member_id])
+                     for channel_id in self._store.channels.get(member.guild_id, {})
+                     if member.member_id in self._store.totals.get((member.guild_id, channel_id), {})]
+        return iter([dict(_id=dict(member_id=member.member_id, channel_id=channel_id), karma=channel_karma)
+                     for channel_id, channel_karma in heapq.nsmallest(settings().profile_channels, karma,
+                                                                      key=_leaderboard_key)])
+
+    def aggregate_top_karma_members(self, guild_id: str, channel_id: str = '', time_span: int = 0) -> Iterator[dict]:
+        limit = settings().leaderboard
+        with self._store.lock:
+            if time_span == 0:
+                karma = list(self._store.totals.get((guild_id, channel_id), {}).items())
+            else:
+                members = defaultdict(int)
+                for (bucket_channel_id, member_id), bucket_karma in self._store.recent(guild_id, time_span):
+                    if channel_id == '' or bucket_channel_id == channel_id:
+                        members[member_id] += bucket_karma
+                karma = list(members.items())
+        return iter(self._leaderboard(heapq.nsmallest(limit, karma, key=_leaderboard_key), channel_id))
+
+    def aggregate_karma_page(self, guild_id: str, channel_id: str = '', after: Tuple[int, str] = None,
+                             size: int = 10) -> Iterator[dict]:
+        with self._store.lock:
+            karma = self._store.totals.get((guild_id, channel_id), {}).items()
+            if after is not None:
+                start = _leaderboard_key((after[1], after[0]))
+                karma = [item for item in karma if _leaderboard_key(item) > start]
+            page = heapq.nsmallest(size, karma, key=_leaderboard_key)
+        return iter(self._leaderboard(page, channel_id))
+
+    @staticmethod
+    def _leaderboard(karma: List[Tuple[str, int]], channel_id: str) -> List[dict]:
+        if channel_id == '':
+            return [dict(_id=dict(member_id=member_id), karma=member_karma) for member_id, member_karma in karma]
+        return [dict(_id=dict(member_id=member_id, channel_id=channel_id), karma=member_karma)
+                for member_id, member_karma in karma]
+
+    def member_rank(self, member: KarmaMember) -> Optional[Tuple[int, int]]:
+        with self._store.lock:
+            totals = self._store.totals.get((member.guild_id, member.channel_id), {})
+            karma = totals.get(member.member_id)
+            if karma is None:
+                return None
+            return sum(1 for other in totals.values() if other > karma) + 1, karma
+
+    def find_message(self, message_id: str) -> Optional[dict]:
+        with self._store.lock:
+            for key in self._store.messages.get(message_id, ()):
+                return dict(self._store.documents[key])
+        return None
+
+
+class MemoryKarmaChannelService(ChannelStorage):
+    # ChannelStorage in memory, reads the channel totals of the MemoryKarmaStore
+    def __init__(self, store: MemoryKarmaStore, channel_cache=None):
+        self._store = store
+        self.channel_cache = channel_cache
+
+    def _aggregate_top_karma_channels(self, guild_id: str, time_span: int) -> Iterator[dict]:
+        with self._store.lock:
+            if time_span == 0:
+                karma = list(self._store.channels.get(guild_id, {}).items())
+            else:
+                channels = defaultdict(int)
+                for (channel_id, _), bucket_karma in self._store.recent(guild_id, time_span):
+                    channels[channel_id] += bucket_karma
+                karma = list(channels.items())
+        return iter([dict(_id=dict(channel_id=channel_id), karma=channel_karma) for channel_id, channel_karma
+                     in heapq.nsmallest(settings().leaderboard, karma, key=_leaderboard_key)])
+
+
+class MemoryBlockerService(BlacklistStorage):
+    # BlacklistStorage in memory, a set of member ids per guild
+    def __init__(self, store: MemoryKarmaStore):
+        self._store = store
+
+    def is_loaded(self, guild_id: str) -> bool:
+        return True
+
+    def blacklist(self, member: Member) -> None:
+        with self._store.lock:
+            self._store.blacklist[member.guild_id].add(member.member_id)
+
+    def whitelist(self, member: Member) -> None:
+        with self._store.lock:
+            self._store.blacklist.get(member.guild_id, set()).discard(member.member_id)
+
+    def find_member(self, member: Member) -> Optional[dict]:
+        with self._store.lock:
+            if member.member_id in self._store.blacklist.get(member.guild_id, ()):
+                return vars(member)
+        return None
+
+    def find_all_blacklisted(self, guild_id: str) -> List[dict]:
+        with self._store.lock:
+            return [dict(member_id=member_id) for member_id in self._store.blacklist.get(guild_id, ())]
+
+    def stream_blacklist(self, guild_id: str, batch_size: int = 1000) -> Iterator[dict]:
+        return iter([dict(guild_id=guild_id, member_id=member['member_id'])
+                     for member in self.find_all_blacklisted(guild_id)])
+
+    def import_blacklist(self, documents: List[dict]) -> int:
+        with self._store.lock:
+            for document in documents:
+                self._store.blacklist[document['guild_id']].add(document['member_id'])
+        return len(documents)
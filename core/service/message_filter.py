@@ -0,0 +1,88 @@
+import hashlib
+import logging
+import math
+import threading
+
+from core.metrics import metrics
+
+log = logging.getLogger(__name__)
+
+
+class KarmaMessageFilter:
+    # counting bloom filter of the ids of messages that gave out karma.
+    # a negative answer is certain, so reaction and delete events on other messages don't need a query.
+    # counters instead of bits allow removing the karma of a message again.
+    def __init__(self, capacity: int = 1000000, error_rate: float = 0.01):
+        self.capacity = max(capacity, 1)
+        self.error_rate = error_rate
+        self.size = int(math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, int(round(self.size / self.capacity * math.log(2))))
+        self._counters = bytearray(self.size)
+        self._lock = threading.Lock()
+        # until the filter is seeded from the database every message might be a karma message
+        self.ready = False
+        self.metrics = metrics('message_filter')
+
+    def _positions(self, message_id: str):
+        digest = hashlib.blake2b(str(message_id).encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hash_count)]
+
+    def add(self, message_id: str) -> None:
+        """
+        add one karma of the message to the filter
+        :param message_id: id of the karma message
+        :return: None
+        """
+        with self._lock:
+            for position in self._positions(message_id):
+                # saturated counters stay, they can't be decremented correctly anymore
+                if self._counters[position] < 255:
+                    self._counters[position] += 1
+
+    def remove(self, message_id: str) -> None:
+        """
+        remove one karma of the message from the filter
+        :param message_id: id of the karma message
+        :return: None
+        """
+        with self._lock:
+            positions = self._positions(message_id)
+            # never decrement for messages that aren't part of the filter, that would corrupt other messages
+            if any(self._counters[position] == 0 for position in positions):
+                return
+            for position in positions:
+                if self._counters[position] < 255:
+                    self._counters[position] -= 1
+
+    def might_contain(self, message_id: str) -> bool:
+        """
+        check if the message might have given out karma
+        :param message_id: id of the message
+        :return: False if the message certainly didn't give out karma
+        """
+        if not self.ready:
+            return True
+        if all(self._counters[position] > 0 for position in self._positions(message_id)):
+            return True
+        self.metrics.incr('misses')
+        return False
+
+    def seed(self, karma_collection, batch_size: int = 10000) -> int:
+        """
+        fill the filter with the message ids of all karma documents, afterwards it answers lookups.
+        :param karma_collection: collection of the karma documents
+        :param batch_size: documents fetched per round trip
+        :return: amount of karma documents added
+        """
+        added = 0
+        for doc in karma_collection.find(filter={}, projection=dict(message_id=True, _id=False),
+                                         batch_size=batch_size):
+            self.add(doc['message_id'])
+            added += 1
+        if added > self.capacity:
+            log.warning(f'Karma message filter holds {added} messages but was sized for {self.capacity}, '
+                        f'raise database message_filter capacity to keep the false positive rate low')
+        self.ready = True
+        log.info(f'Seeded karma message filter with {added} karma documents')
+        return added
@@ -1,34 +1,172 @@
 import datetime
 import logging
+import threading
+from collections import defaultdict
+from typing import List, Dict, Set, Tuple, Optional, FrozenSet
 
+from pymongo import UpdateOne, ReplaceOne, ReturnDocument
 from pymongo.results import UpdateResult, DeleteResult
 
 from core.model.member import KarmaMember, Member
-from util.config import profile, config
+from core.service.storage import KarmaStorage, ChannelStorage, BlacklistStorage
+from util.config import settings
 
 log = logging.getLogger(__name__)
 
+totals_collection_name = 'karma_totals'
+daily_collection_name = 'karma_daily'
 
-class KarmaMemberService:
 
-    def __init__(self, ds_collection):
+def day_of(date: datetime.datetime) -> datetime.datetime:
+    """
+    the utc day a date belongs to, used as key of the daily karma buckets
+    :param date: utc datetime
+    :return: datetime at midnight of the same day
+    """
+    return datetime.datetime(date.year, date.month, date.day)
+
+
+def karma_match(guild_id: str, member_id: str = '', channel_id: str = '', time_span: int = 0) -> dict:
+    """
+    build the $match stage filter for karma documents, fields are ordered like the compound indexes.
+    :param guild_id: guild of the karma documents
+    :param member_id: optional member to filter on
+    :param channel_id: optional channel to filter on
+    :param time_span: optional amount of days, only karma of the last time_span days matches
+    :return: filter document
+    """
+    match = dict(guild_id=guild_id)
+    if member_id != '':
+        match['member_id'] = member_id
+    if channel_id != '':
+        match['channel_id'] = channel_id
+    if time_span != 0:
+        match['created_date'] = {"$gt": datetime.datetime.utcnow() - datetime.timedelta(days=time_span)}
+    return match
+
+
+def karma_pipeline(match: dict, group_by: List[str], limit: int = 0) -> list:
+    """
+    build an aggregation pipeline summing up karma, the $match runs first so it can use the indexes
+    and there is no $unwind, since karma is a plain number on every document.
+    :param match: filter of the $match stage, see karma_match
+    :param group_by: fields to group the karma by, they become the fields of the _id document
+    :param limit: if set, sort descending by karma and only keep the top documents
+    :return: aggregation pipeline
+    """
+    pipeline = [{"$match": match},
+                {"$group": {"_id": {field: f'${field}' for field in group_by},
+                            "karma": {"$sum": "$karma"}}}]
+    if limit > 0:
+        pipeline += [{"$sort": {"karma": -1}}, {"$limit": limit}]
+    return pipeline
+
+
+def daily_match(guild_id: str, channel_id: str = '', time_span: int = 1) -> dict:
+    """
+    build the filter for the daily karma buckets of the last time_span days, today included.
+    :param guild_id: guild of the buckets
+    :param channel_id: optional channel to filter on
+    :param time_span: amount of days
+    :return: filter document
+    """
+    match = dict(guild_id=guild_id)
+    if channel_id != '':
+        match['channel_id'] = channel_id
+    match['day'] = {"$gte": day_of(datetime.datetime.utcnow()) - datetime.timedelta(days=time_span - 1)}
+    return match
+
+
+def totals_pipeline(match: dict, id_fields: List[str], limit: int) -> list:
+    """
+    build a pipeline reading pre-aggregated karma totals through the (guild_id, channel_id, karma, member_id) index.
+    the documents are shaped like the results of karma_pipeline, so callers don't care where karma comes from.
+    :param match: filter on the totals collection
+    :param id_fields: fields which become the fields of the _id document
+    :param limit: amount of documents with the highest karma to return
+    :return: aggregation pipeline
+    """
+    return [{"$match": match}, {"$sort": {"karma": -1, "member_id": 1}}, {"$limit": limit},
+            {"$project": {"_id": {field: f'${field}' for field in id_fields}, "karma": "$karma"}}]
+
+
+def after_match(match: dict, after: Tuple[int, str]) -> dict:
+    """
+    restrict a totals filter to the members ranked after a leaderboard position, used for keyset pagination.
+    :param match: filter on the totals collection
+    :param after: karma and member_id of the last member of the previous page
+    :return: filter of the members after the position
+    """
+    karma, member_id = after
+    return dict(match, **{"$or": [{"karma": {"$lt": karma}}, {"karma": karma, "member_id": {"$gt": member_id}}]})
+
+
+class KarmaMemberService(KarmaStorage):
+    # KarmaStorage on mongodb, karma documents with pre-aggregated totals and daily buckets
+
+    def __init__(self, ds_collection, totals_collection=None, daily_collection=None, write_buffer=None,
+                 message_filter=None, retention=None, channel_cache=None):
         # karma database service class, perform operations on the configured mongodb.
         self._karma = ds_collection
+        # karma totals per member (channel_id '') and per member and channel, maintained on every karma change
+        self._totals = ds_collection.database[totals_collection_name] if totals_collection is None \
+            else totals_collection
+        # karma per guild, channel, member and day, used for the leaderboards of the last x days
+        self._daily = ds_collection.database[daily_collection_name] if daily_collection is None \
+            else daily_collection
+        # optional KarmaWriteBuffer, karma gains are then written behind in batches
+        self.write_buffer = write_buffer
+        # optional KarmaMessageFilter, lookups of messages that never gave out karma skip the database
+        self.message_filter = message_filter
+        # optional KarmaRetention, compacts karma older than the retention period in the background
+        self.retention = retention
+        # optional KarmaChannelCache, every karma change of a guild invalidates its cached top channels
+        self.channel_cache = channel_cache
         self._increase_karma = {"$inc": {'karma': 1}}
 
+    def flush(self) -> int:
+        """
+        write the pending karma gains of the write buffer, if there is one.
+        :return: amount of karma documents written
+        """
+        if self.write_buffer is None:
+            return 0
+        return self.write_buffer.flush()
+
+    def _read_through(self, guild_id: str, member_id: str = '') -> None:
+        """
+        flush the write buffer before a read of the guild or member, so pending karma is part of the result.
+        :param guild_id: guild which is read
+        :param member_id: optional member which is read
+        :return: None
+        """
+        if self.write_buffer is not None and self.write_buffer.touches(guild_id, member_id):
+            self.write_buffer.flush()
+
     # update or insert karma member if not exist on first karma
     # check on inc if inc or dec query should be applied.
     def upsert_karma_member(self, member: KarmaMember) -> UpdateResult:
         """
         update a karma member, upsert is used in case there is no karma member to update yet.
         :param member: karma member created and to be inserted/updated in the connected mongodb.
-        :return: update result
+        :return: update result, None if the gain was buffered
         """
+        if self.message_filter is not None:
+            self.message_filter.add(member.message_id)
+        if self.write_buffer is not None:
+            if self.write_buffer.add(member):
+                self.write_buffer.flush()
+            self._karma_changed(member.guild_id)
+            return None
+
         member_dict = vars(member)
         logging.info('channel_query: {}'.format(member_dict))
+        result = self._karma.update_one(filter=member_dict, update=self._increase_karma,
+                                        upsert=True)
+        self._inc_totals(member, 1, member.created_date)
+        self._karma_changed(member.guild_id)
         # return update result
-        return self._karma.update_one(filter=member_dict, update=self._increase_karma,
-                                      upsert=True)
+        return result
 
     def delete_single_karma(self, member: KarmaMember) -> DeleteResult:
         """
@@ -36,9 +174,81 @@ class KarmaMemberService:
         :param member: karma member to remove
         :return: delete result
         """
+        if self.write_buffer is not None and self.write_buffer.cancel(member):
+            self._forget_message(member.message_id)
+            self._karma_changed(member.guild_id)
+            return DeleteResult({'n': 1}, acknowledged=True)
+
+        # the deleted document is needed to know which daily bucket to decrement
+        # karma tagged by a compaction batch is already being folded into its summary
+        deleted = self._karma.find_one_and_delete(filter=dict(guild_id=member.guild_id, member_id=member.member_id,
+                                                              channel_id=member.channel_id,
+                                                              message_id=member.message_id,
+                                                              compaction={"$exists": False}))
+        if deleted is not None:
+            self._forget_message(member.message_id)
+            self._inc_totals(member, -deleted['karma'], deleted['created_date'])
+            self._totals.delete_many(filter=dict(guild_id=member.guild_id, member_id=member.member_id,
+                                                 karma={"$lte": 0}))
+            self._karma_changed(member.guild_id)
         # return delete result
-        return self._karma.delete_one(filter=dict(guild_id=member.guild_id, member_id=member.member_id,
-                                                  channel_id=member.channel_id, message_id=member.message_id))
+        return DeleteResult({'n': 0 if deleted is None else 1}, acknowledged=True)
+
+    def delete_message_karma(self, guild_id: str, message_id: str) -> List[str]:
+        """
+        delete the karma of every member that gained karma through a message.
+        :param guild_id: guild of the message
+        :param message_id: id of the message whose karma is removed
+        :return: ids of the members whose karma was removed
+        """
+        deleted = []
+        if self.write_buffer is not None:
+            deleted = self.write_buffer.cancel_message(guild_id, message_id)
+
+        # only the documents this call deleted itself decrement the totals and daily buckets,
+        # a concurrent removal of the same message may have deleted some of them in between
+        documents = []
+        for document in self._karma.find(filter=dict(guild_id=guild_id, message_id=message_id,
+                                                     compaction={"$exists": False}), projection=['_id']):
+            document = self._karma.find_one_and_delete(filter=dict(_id=document['_id'],
+                                                                   compaction={"$exists": False}))
+            if document is not None:
+                documents.append(document)
+        if len(documents) != 0:
+            self._dec_totals(guild_id, documents)
+            deleted += documents
+
+        for document in deleted:
+            self._forget_message(message_id)
+        if len(deleted) != 0:
+            self._karma_changed(guild_id)
+        return list(dict.fromkeys(document['member_id'] for document in deleted))
+
+    def _dec_totals(self, guild_id: str, documents: List[dict]) -> None:
+        """
+        decrement the totals and daily buckets of deleted karma documents with one bulk write per collection.
+        :param guild_id: guild of the documents
+        :param documents: deleted karma documents
+        :return: None
+        """
+        totals_dec, daily_dec = defaultdict(int), defaultdict(int)
+        for document in documents:
+            member_id, channel_id = document['member_id'], document['channel_id']
+            totals_dec[(member_id, '')] += document['karma']
+            totals_dec[(member_id, channel_id)] += document['karma']
+            daily_dec[(member_id, channel_id, day_of(document['created_date']))] += document['karma']
+        self._totals.bulk_write([
+            UpdateOne(filter=dict(guild_id=guild_id, member_id=member_id, channel_id=channel_id),
+                      update={"$inc": {'karma': -amount}}, upsert=True)
+            for (member_id, channel_id), amount in totals_dec.items()], ordered=False)
+        self._daily.bulk_write([
+            UpdateOne(filter=dict(guild_id=guild_id, channel_id=channel_id, member_id=member_id, day=day),
+                      update={"$inc": {'karma': -amount}})
+            for (member_id, channel_id, day), amount in daily_dec.items()], ordered=False)
+        # empty totals and buckets are removed, so they don't show up in any leaderboard
+        member_ids = list({member_id for member_id, _ in totals_dec})
+        self._totals.delete_many(filter=dict(guild_id=guild_id, member_id={"$in": member_ids}, karma={"$lte": 0}))
+        self._daily.delete_many(filter=dict(guild_id=guild_id, member_id={"$in": member_ids}, karma={"$lte": 0}))
 
     def delete_all_karma(self, member: KarmaMember) -> DeleteResult:
         """
@@ -46,37 +256,215 @@ class KarmaMemberService:
         :param member: which karma is to be completely removed.
         :return: delete result
         """
+        if self.write_buffer is not None:
+            self.write_buffer.discard_member(member.guild_id, member.member_id)
+        self._totals.delete_many(filter=dict(guild_id=member.guild_id, member_id=member.member_id))
+        self._daily.delete_many(filter=dict(guild_id=member.guild_id, member_id=member.member_id))
+        result = self._karma.delete_many(filter=dict(guild_id=member.guild_id, member_id=member.member_id))
+        self._karma_changed(member.guild_id)
         # return delete result of deletion
-        return self._karma.delete_many(filter=dict(guild_id=member.guild_id, member_id=member.member_id))
+        return result
+
+    def _forget_message(self, message_id: str) -> None:
+        """
+        remove a single karma of the message from the message filter, if there is one.
+        :param message_id: id of the message whose karma was removed
+        :return: None
+        """
+        if self.message_filter is not None:
+            self.message_filter.remove(message_id)
+
+    def seed_message_filter(self) -> int:
+        """
+        fill the message filter with the message ids of all karma documents, if there is a filter.
+        :return: amount of karma documents added to the filter
+        """
+        # on_ready is dispatched again on reconnects, the filter is only seeded once
+        if self.message_filter is None or self.message_filter.ready:
+            return 0
+        self.flush()
+        return self.message_filter.seed(self._karma)
 
-    # aggregate overall karma of a member
+    def _inc_totals(self, member: KarmaMember, amount: int, created_date: datetime.datetime) -> None:
+        """
+        increment the guild total, the channel total and the daily bucket of the member.
+        :param member: karma member whose totals change
+        :param amount: karma to add, negative to remove karma
+        :param created_date: date of the karma, decides the daily bucket
+        :return: None
+        """
+        self._totals.bulk_write([
+            UpdateOne(filter=dict(guild_id=member.guild_id, member_id=member.member_id, channel_id=channel_id),
+                      update={"$inc": {'karma': amount}}, upsert=True)
+            for channel_id in ['', member.channel_id]], ordered=False)
+        bucket = dict(guild_id=member.guild_id, channel_id=member.channel_id, member_id=member.member_id,
+                      day=day_of(created_date))
+        if amount > 0:
+            self._daily.update_one(filter=bucket, update={"$inc": {'karma': amount}}, upsert=True)
+            return
+        # empty buckets are removed, so they don't show up in any leaderboard
+        bucket = self._daily.find_one_and_update(filter=bucket, update={"$inc": {'karma': amount}},
+                                                 return_document=ReturnDocument.AFTER)
+        if bucket is not None and bucket['karma'] <= 0:
+            self._daily.delete_one(filter=dict(_id=bucket['_id']))
+
+    def rebuild_karma_totals(self, guild_id: str = None) -> int:
+        """
+        recompute the karma totals collection from the karma documents, used to initialise the totals
+        of existing karma.
+        :param guild_id: optional guild whose totals are recomputed, all guilds if None
+        :return: amount of totals documents written
+        """
+        match = {} if guild_id is None else dict(guild_id=guild_id)
+        pipeline = [{"$match": match},
+                    {"$group": {"_id": {"guild_id": "$guild_id", "member_id": "$member_id",
+                                        "channel_id": "$channel_id"},
+                                "karma": {"$sum": "$karma"}}}]
+        self.flush()
+        guild_totals = defaultdict(int)
+        self._totals.delete_many(filter=match)
+        batch = []
+        written = 0
+        for doc in self._karma.aggregate(pipeline, allowDiskUse=True):
+            guild_totals[(doc['_id']['guild_id'], doc['_id']['member_id'])] += doc['karma']
+            batch.append(dict(doc['_id'], karma=doc['karma']))
+            if len(batch) == 1000:
+                written += len(self._totals.insert_many(batch).inserted_ids)
+                batch = []
+        batch += [dict(guild_id=guild_id, member_id=member_id, channel_id='', karma=karma)
+                  for (guild_id, member_id), karma in guild_totals.items()]
+        if len(batch) > 0:
+            written += len(self._totals.insert_many(batch).inserted_ids)
+        log.info(f'Rebuilt karma totals with {written} documents')
+        return written
+
+    def rebuild_daily_karma(self, guild_id: str = None) -> int:
+        """
+        recompute the daily karma buckets from the karma documents, used to initialise the buckets
+        of existing karma.
+        :param guild_id: optional guild whose buckets are recomputed, all guilds if None
+        :return: amount of daily buckets written
+        """
+        match = {} if guild_id is None else dict(guild_id=guild_id)
+        pipeline = [{"$match": match},
+                    {"$group": {"_id": {"guild_id": "$guild_id", "channel_id": "$channel_id",
+                                        "member_id": "$member_id", "year": {"$year": "$created_date"},
+                                        "month": {"$month": "$created_date"},
+                                        "day": {"$dayOfMonth": "$created_date"}},
+                                "karma": {"$sum": "$karma"}}}]
+        self.flush()
+        self._daily.delete_many(filter=match)
+        batch = []
+        written = 0
+        for doc in self._karma.aggregate(pipeline, allowDiskUse=True):
+            key = doc['_id']
+            batch.append(dict(guild_id=key['guild_id'], channel_id=key['channel_id'], member_id=key['member_id'],
+                              day=datetime.datetime(key['year'], key['month'], key['day']), karma=doc['karma']))
+            if len(batch) == 1000:
+                written += len(self._daily.insert_many(batch).inserted_ids)
+                batch = []
+        if len(batch) > 0:
+            written += len(self._daily.insert_many(batch).inserted_ids)
+        log.info(f'Rebuilt daily karma with {written} documents')
+        return written
+
+    def stream_karma(self, guild_id: str, batch_size: int = 1000):
+        """
+        all karma documents of a guild, read from the database batch_size documents at a time.
+        :param guild_id: guild whose karma is read
+        :param batch_size: documents fetched per round trip
+        :return: database cursor of the karma documents without _id
+        """
+        self.flush()
+        return self._karma.find(filter=dict(guild_id=guild_id), projection=dict(_id=False), batch_size=batch_size)
+
+    def import_karma(self, documents: List[dict]) -> int:
+        """
+        write a batch of exported karma documents with one ordered bulk_write, importing the same
+        documents again replaces them. the totals of the guilds have to be rebuilt afterwards.
+        :param documents: karma documents
+        :return: amount of documents written
+        """
+        if len(documents) == 0:
+            return 0
+        result = self._karma.bulk_write([
+            ReplaceOne(filter={key: document[key] for key in ['guild_id', 'member_id', 'channel_id', 'message_id',
+                                                              'created_date']},
+                       replacement=document, upsert=True)
+            for document in documents], ordered=True)
+        if self.message_filter is not None:
+            for document in documents:
+                self.message_filter.add(document['message_id'])
+        for guild_id in {document['guild_id'] for document in documents}:
+            self._karma_changed(guild_id)
+        return result.upserted_count + result.matched_count
+
+    # get overall karma of a member
     def aggregate_member_by_karma(self, member: KarmaMember):
         """
-        aggregate karma in mongodb by member in a guild
-        :param member: with whom to aggregate the collections
+        get the karma of a member in a guild from the pre-aggregated totals
+        :param member: whose karma to look up
         :return: karma of member
         """
-        pipeline = [{"$unwind": "$karma"}, {"$match": dict(member_id=member.member_id, guild_id=member.guild_id)},
-                    {"$group": {"_id": {"member_id": "$member_id"}, "karma": {"$sum": "$karma"}}}]
-        doc_cursor = self._karma.aggregate(pipeline)
-        for doc in doc_cursor:
-            # return global karma of member
-            return doc['karma']
+        self._read_through(member.guild_id, member.member_id)
+        doc = self._totals.find_one(filter=dict(guild_id=member.guild_id, member_id=member.member_id,
+                                                channel_id=''))
+        # return global karma of member
+        return None if doc is None else doc['karma']
+
+    def aggregate_members_by_karma(self, guild_id: str, member_ids: List[str]) -> Dict[str, int]:
+        """
+        get the karma of several members of a guild with a single query on the pre-aggregated totals
+        :param guild_id: guild of the members
+        :param member_ids: ids of the members whose karma to look up
+        :return: member id to karma, members without karma have 0
+        """
+        member_ids = [str(member_id) for member_id in member_ids]
+        if self.write_buffer is not None and any(self.write_buffer.touches(guild_id, member_id)
+                                                 for member_id in member_ids):
+            self.write_buffer.flush()
+        karma = dict.fromkeys(member_ids, 0)
+        for doc in self._totals.find(filter=dict(guild_id=guild_id, member_id={"$in": member_ids}, channel_id=''),
+                                     projection=dict(member_id=True, karma=True)):
+            karma[doc['member_id']] = doc['karma']
+        return karma
 
     def aggregate_member_by_channels(self, member: KarmaMember):
         """
-        aggregate karma by channels in a guild from a single member
-        :param member: the member whose karma to aggregate by channels.
+        get the karma by channels in a guild from a single member
+        :param member: the member whose karma to get by channels.
         :return: database cursor which contains the results (channel id's and their karma)
         """
-        pipeline = [{"$unwind": "$karma"}, {"$match": dict(member_id=member.member_id, guild_id=member.guild_id)},
-                    {"$group": {"_id": {"member_id": "$member_id", "channel_id": "$channel_id"},
-                                "karma": {"$sum": "$karma"}}},
-                    {"$sort": {"karma": -1}}, {"$limit": int(profile()['channels'])}]
-        doc_cursor = self._karma.aggregate(pipeline)
+        self._read_through(member.guild_id, member.member_id)
+        pipeline = totals_pipeline(dict(guild_id=member.guild_id, member_id=member.member_id,
+                                        channel_id={"$gt": ''}),
+                                   ['member_id', 'channel_id'], settings().profile_channels)
+        doc_cursor = self._totals.aggregate(pipeline)
         # return cursor containing documents generated through the pipeline
         return doc_cursor
 
+    def aggregate_member_profile(self, member: KarmaMember, channels: int = -1) -> dict:
+        """
+        get the total karma and the top channels of a member in a single round trip,
+        using a $facet over the pre-aggregated totals of the member.
+        :param member: the member whose profile to get
+        :param channels: amount of top channels, defaults to the configured profile channels
+        :return: dict with the total karma (0 without karma) and the channel documents like
+        aggregate_member_by_channels returns them
+        """
+        if channels < 0:
+            channels = settings().profile_channels
+        self._read_through(member.guild_id, member.member_id)
+        facets = {"total": [{"$match": dict(channel_id='')}, {"$project": {"_id": 0, "karma": 1}}]}
+        # $limit has to be positive, without channels the facet is left out
+        if channels > 0:
+            facets["channels"] = totals_pipeline(dict(channel_id={"$gt": ''}), ['member_id', 'channel_id'], channels)
+        pipeline = [{"$match": dict(guild_id=member.guild_id, member_id=member.member_id)}, {"$facet": facets}]
+        for doc in self._totals.aggregate(pipeline):
+            return dict(karma=doc['total'][0]['karma'] if len(doc['total']) > 0 else 0,
+                        channels=doc.get('channels', []))
+        return dict(karma=0, channels=[])
+
     def aggregate_top_karma_members(self, guild_id: str, channel_id: str = '', time_span: int = 0):
         """
         aggregate top karma members of a guild, optionally with a channel_id or time_span
@@ -85,49 +473,53 @@ class KarmaMemberService:
         :param time_span: time span to filter out the results
         :return: database cursor containing member information and karma
         """
-        if channel_id == '':
-            if time_span == 0:
-                pipeline = [{"$unwind": "$karma"}, {"$match": dict(guild_id=guild_id)},
-                            {"$group": {"_id": {"member_id": "$member_id"},
-                                        "karma": {"$sum": "$karma"}}},
-                            {"$sort": {"karma": -1}}, {"$limit": int(config['leaderboard'])}]
-                doc_cursor = self._karma.aggregate(pipeline)
-                # return cursor containing documents generated through the pipeline
-                return doc_cursor
-            else:
-                pipeline = [{"$unwind": "$karma"},
-                            {"$match": {"guild_id": guild_id,
-                                        "created_date":
-                                            {"$gt": datetime.datetime.utcnow() -
-                                                    datetime.timedelta(days=time_span)}}},
-                            {"$group": {"_id": {"member_id": "$member_id"},
-                                        "karma": {"$sum": "$karma"}}},
-                            {"$sort": {"karma": -1}}, {"$limit": int(config['leaderboard'])}]
-                doc_cursor = self._karma.aggregate(pipeline)
-                # return cursor containing documents generated through the pipeline
-                return doc_cursor
-        else:
-            if time_span == 0:
-                pipeline = [{"$unwind": "$karma"}, {"$match": dict(guild_id=guild_id, channel_id=channel_id)},
-                            {"$group": {"_id": {"member_id": "$member_id", "channel_id": "$channel_id"},
-                                        "karma": {"$sum": "$karma"}}},
-                            {"$sort": {"karma": -1}}, {"$limit": int(config['leaderboard'])}]
-                doc_cursor = self._karma.aggregate(pipeline)
-                # return cursor containing documents generated through the pipeline
-                return doc_cursor
-            else:
-                pipeline = [{"$unwind": "$karma"},
-                            {"$match": {"guild_id": guild_id,
-                                        "channel_id": channel_id,
-                                        "created_date":
-                                            {"$gt": datetime.datetime.utcnow() -
-                                                    datetime.timedelta(days=time_span)}}},
-                            {"$group": {"_id": {"member_id": "$member_id", "channel_id": "$channel_id"},
-                                        "karma": {"$sum": "$karma"}}},
-                            {"$sort": {"karma": -1}}, {"$limit": int(config['leaderboard'])}]
-                doc_cursor = self._karma.aggregate(pipeline)
-                # return cursor containing documents generated through the pipeline
-                return doc_cursor
+        self._read_through(guild_id)
+        group_by = ['member_id'] if channel_id == '' else ['member_id', 'channel_id']
+        if time_span == 0:
+            # indexed sort on the totals, only reads the top documents
+            pipeline = totals_pipeline(dict(guild_id=guild_id, channel_id=channel_id), group_by,
+                                       settings().leaderboard)
+            return self._totals.aggregate(pipeline)
+
+        # sum up at most time_span daily buckets per member
+        pipeline = karma_pipeline(daily_match(guild_id, channel_id, time_span), group_by, settings().leaderboard)
+        doc_cursor = self._daily.aggregate(pipeline)
+        # return cursor containing documents generated through the pipeline
+        return doc_cursor
+
+    def aggregate_karma_page(self, guild_id: str, channel_id: str = '', after: Tuple[int, str] = None,
+                             size: int = 10) -> list:
+        """
+        a page of the all time leaderboard, the page continues after the last member of the previous page,
+        so reading deep pages never reads the earlier ones again.
+        :param guild_id: guild of the leaderboard
+        :param channel_id: optional channel of the leaderboard
+        :param after: karma and member_id of the last member of the previous page, None for the first page
+        :param size: members per page
+        :return: database cursor containing member information and karma
+        """
+        self._read_through(guild_id)
+        match = dict(guild_id=guild_id, channel_id=channel_id)
+        if after is not None:
+            match = after_match(match, after)
+        group_by = ['member_id'] if channel_id == '' else ['member_id', 'channel_id']
+        return self._totals.aggregate(totals_pipeline(match, group_by, size))
+
+    def member_rank(self, member: KarmaMember) -> Optional[Tuple[int, int]]:
+        """
+        the position of a member in the all time leaderboard, counted through the totals index.
+        members with equal karma share the position.
+        :param member: member to rank, with a channel_id for the channel leaderboard
+        :return: position and karma of the member, None if the member has no karma
+        """
+        self._read_through(member.guild_id, member.member_id)
+        total = self._totals.find_one(filter=dict(guild_id=member.guild_id, member_id=member.member_id,
+                                                  channel_id=member.channel_id))
+        if total is None or total['karma'] <= 0:
+            return None
+        above = self._totals.count_documents(filter=dict(guild_id=member.guild_id, channel_id=member.channel_id,
+                                                         karma={"$gt": total['karma']}))
+        return above + 1, total['karma']
 
     def find_message(self, message_id: str):
         """
@@ -135,41 +527,93 @@ class KarmaMemberService:
         :param message_id: id of the message to find
         :return: karma member whose message id is equal to the parameter message id
         """
-        return self._karma.find_one(filter=dict(message_id=message_id))
+        if self.message_filter is not None and not self.message_filter.might_contain(message_id):
+            return None
+        if self.write_buffer is not None:
+            document = self.write_buffer.find_message(message_id)
+            if document is not None:
+                return document
+        document = self._karma.find_one(filter=dict(message_id=message_id))
+        if self.message_filter is not None and self.message_filter.ready:
+            self.message_filter.metrics.incr('hits' if document is not None else 'false_positives')
+        return document
 
 
-class KarmaChannelService:
-    def __init__(self, ds_collection):
+class KarmaChannelService(ChannelStorage):
+    # ChannelStorage on mongodb, reads the totals and daily buckets maintained by the KarmaMemberService
+    def __init__(self, ds_collection, totals_collection=None, daily_collection=None, write_buffer=None,
+                 channel_cache=None):
         self._karma = ds_collection
+        self._totals = ds_collection.database[totals_collection_name] if totals_collection is None \
+            else totals_collection
+        self._daily = ds_collection.database[daily_collection_name] if daily_collection is None \
+            else daily_collection
+        self.write_buffer = write_buffer
+        # optional KarmaChannelCache shared with the KarmaMemberService, which invalidates it on karma changes
+        self.channel_cache = channel_cache
 
-    def aggregate_top_karma_channels(self, guild_id: str, time_span: int = 0):
-        # TODO has to be used in a cog
+    def _aggregate_top_karma_channels(self, guild_id: str, time_span: int):
+        if self.write_buffer is not None and self.write_buffer.touches(guild_id):
+            self.write_buffer.flush()
         if time_span == 0:
-            pipeline = [{"$unwind": "$karma"}, {"$match": dict(guild_id=guild_id)},
-                        {"$group": {"_id": {"channel_id": "$channel_id"},
-                                    "karma": {"$sum": "$karma"}}},
-                        {"$sort": {"karma": -1}}, {"$limit": int(config['leaderboard'])}]
-            doc_cursor = self._karma.aggregate(pipeline)
-            # return cursor containing documents generated through the pipeline
-            return doc_cursor
-        else:
-            pipeline = [{"$unwind": "$karma"},
-                        {"$match": {"guild_id": guild_id,
-                                    "created_date":
-                                        {"$gt": datetime.datetime.utcnow() -
-                                                datetime.timedelta(days=time_span)}}},
-                        {"$group": {"_id": {"channel_id": "$channel_id"},
-                                    "karma": {"$sum": "$karma"}}},
-                        {"$sort": {"karma": -1}}, {"$limit": int(config['leaderboard'])}]
-            doc_cursor = self._karma.aggregate(pipeline)
-            # return cursor containing documents generated through the pipeline
-            return doc_cursor
-
-
-class BlockerService:
+            # sum the per channel totals instead of every karma document of the guild
+            pipeline = karma_pipeline(dict(guild_id=guild_id, channel_id={"$gt": ''}), ['channel_id'],
+                                      settings().leaderboard)
+            return self._totals.aggregate(pipeline)
+        pipeline = karma_pipeline(daily_match(guild_id, time_span=time_span), ['channel_id'],
+                                  settings().leaderboard)
+        return self._daily.aggregate(pipeline)
+
+
+class BlockerService(BlacklistStorage):
+    # BlacklistStorage on mongodb, the blacklist of each guild is cached in memory
 
     def __init__(self, ds_collection):
         self._blacklist = ds_collection
+        # guild id -> frozenset of blacklisted member ids, loaded on first use of a guild and written through.
+        # writes replace the set of the guild instead of changing it, so lookups never need the lock
+        self._cache: Dict[str, FrozenSet[str]] = {}
+        # serializes writes and loads, lookups in cached guilds don't wait for it
+        self._lock = threading.Lock()
+
+    def _guild_blacklist(self, guild_id: str) -> FrozenSet[str]:
+        """
+        the cached blacklist of a guild, loaded from the database on first use.
+        :param guild_id: id of the guild
+        :return: set of blacklisted member ids
+        """
+        blacklisted = self._cache.get(guild_id)
+        if blacklisted is not None:
+            return blacklisted
+        with self._lock:
+            # a write or another load may have cached the guild while waiting for the lock
+            blacklisted = self._cache.get(guild_id)
+            if blacklisted is None:
+                blacklisted = frozenset(doc['member_id'] for doc in
+                                        self._blacklist.find(filter=dict(guild_id=guild_id),
+                                                             projection=dict(member_id=True)))
+                self._cache[guild_id] = blacklisted
+            return blacklisted
+
+    def _update_cache(self, guild_id: str, added: Set[str] = frozenset(), removed: Set[str] = frozenset()) -> None:
+        """
+        write blacklist changes through to the cache of a guild, has to be called while holding the lock.
+        :param guild_id: id of the guild
+        :param added: member ids that were blacklisted
+        :param removed: member ids that were whitelisted
+        :return: None
+        """
+        blacklisted = self._cache.get(guild_id)
+        if blacklisted is not None:
+            self._cache[guild_id] = (blacklisted | added) - removed
+
+    def is_loaded(self, guild_id: str) -> bool:
+        """
+        check if the blacklist of the guild is cached, lookups don't need the database then.
+        :param guild_id: id of the guild
+        :return: True if the blacklist of the guild is cached
+        """
+        return guild_id in self._cache
 
     def blacklist(self, member: Member) -> UpdateResult:
         """
@@ -178,8 +622,11 @@ class BlockerService:
         :return: update result
         """
         member_dict = vars(member)
+        with self._lock:
+            result = self._blacklist.update_one(filter=member_dict, update={'$set': member_dict}, upsert=True)
+            self._update_cache(member.guild_id, added={member.member_id})
         # returns an update result
-        return self._blacklist.update_one(filter=member_dict, update={'$set': member_dict}, upsert=True)
+        return result
 
     def whitelist(self, member: Member) -> DeleteResult:
         """
@@ -187,8 +634,11 @@ class BlockerService:
         :param member: member to whitelist to allow them to give out karma once again.
         :return: delete result
         """
+        with self._lock:
+            result = self._blacklist.delete_one(filter=vars(member))
+            self._update_cache(member.guild_id, removed={member.member_id})
         # returns a delete result
-        return self._blacklist.delete_one(filter=vars(member))
+        return result
 
     def find_member(self, member: Member):
         """
@@ -196,12 +646,45 @@ class BlockerService:
         :param member: member to check if is inside the blacklist
         :return: the member if he exists or None
         """
-        return self._blacklist.find_one(filter=vars(member))
+        if member.member_id in self._guild_blacklist(member.guild_id):
+            return vars(member)
+        return None
+
+    def stream_blacklist(self, guild_id: str, batch_size: int = 1000):
+        """
+        all blacklist documents of a guild, read from the database batch_size documents at a time.
+        :param guild_id: guild whose blacklist is read
+        :param batch_size: documents fetched per round trip
+        :return: database cursor of the blacklist documents without _id
+        """
+        return self._blacklist.find(filter=dict(guild_id=guild_id), projection=dict(_id=False),
+                                    batch_size=batch_size)
+
+    def import_blacklist(self, documents: List[dict]) -> int:
+        """
+        write a batch of exported blacklist documents with one ordered bulk_write
+        :param documents: blacklist documents
+        :return: amount of documents written
+        """
+        if len(documents) == 0:
+            return 0
+        # the lock is only taken for the cache, blacklist commands don't wait for the whole batch
+        result = self._blacklist.bulk_write([
+            UpdateOne(filter=dict(guild_id=document['guild_id'], member_id=document['member_id']),
+                      update={'$set': document}, upsert=True)
+            for document in documents], ordered=True)
+        added = defaultdict(set)
+        for document in documents:
+            added[document['guild_id']].add(document['member_id'])
+        with self._lock:
+            for guild_id, member_ids in added.items():
+                self._update_cache(guild_id, added=member_ids)
+        return result.upserted_count + result.matched_count
 
     def find_all_blacklisted(self, guild_id):
         """
-        returns a cursor of all blacklisted members found in the guild
+        returns all blacklisted members found in the guild
         :param guild_id: id of the guild whose blacklist is to be retrieved
-        :return: database cursor with members
+        :return: list of documents with the member ids
         """
-        return self._blacklist.find(filter=dict(guild_id=guild_id), projection=dict(member_id=True))
+        return [dict(member_id=member_id) for member_id in self._guild_blacklist(guild_id)]
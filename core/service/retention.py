@@ -0,0 +1,129 @@
+import datetime
+import logging
+import time
+from collections import defaultdict
+from typing import Tuple, Optional
+
+import bson
+from pymongo import UpdateOne
+
+from core.metrics import metrics
+from core.service.mongo_service import day_of
+
+log = logging.getLogger(__name__)
+
+
+class KarmaRetention:
+    # folds karma documents older than the retention period into one summary document per
+    # guild, member, channel and day. summaries live in the karma collection with an empty message id and
+    # the day as created date, so the totals, the daily buckets and their rebuilds keep the same answers.
+    # karma of compacted messages can't be removed by deleting the message anymore, this already holds
+    # once a batch has tagged them.
+    def __init__(self, karma, days: int = 90, batch_size: int = 1000, batches: int = 10,
+                 interval: float = 3600, message_filter=None):
+        self._karma = karma
+        self.days = days
+        self.batch_size = batch_size
+        self.batches = batches  # batches per run, bounds the work of one run
+        self.interval = interval  # seconds between two runs
+        # optional KarmaMessageFilter, compacted messages no longer count as karma messages
+        self.message_filter = message_filter
+        self.metrics = metrics('retention')
+
+    def cutoff(self) -> datetime.datetime:
+        """
+        karma created before the cutoff is compacted, whole days are compacted at once.
+        :return: start of the oldest day that is kept
+        """
+        return day_of(datetime.datetime.utcnow()) - datetime.timedelta(days=self.days)
+
+    def claim_batch(self, cutoff: datetime.datetime) -> Optional[bson.ObjectId]:
+        """
+        tag up to batch_size karma documents created before the cutoff with a new batch id.
+        tagged documents can't be removed anymore, so the batch folds exactly the karma it deletes.
+        :param cutoff: karma created before is compacted
+        :return: id of the batch, None if there is nothing to compact
+        """
+        ids = [document['_id'] for document in
+               self._karma.find(filter=dict(created_date={"$lt": cutoff}, message_id={"$ne": ''},
+                                            compaction={"$exists": False}),
+                                projection=['_id'], limit=self.batch_size)]
+        if len(ids) == 0:
+            return None
+        batch_id = bson.ObjectId()
+        self._karma.update_many(filter=dict(_id={"$in": ids}, compaction={"$exists": False}),
+                                update={"$set": {'compaction': batch_id}})
+        return batch_id
+
+    def compact_batch(self, batch_id: bson.ObjectId) -> Tuple[int, int, int]:
+        """
+        fold the karma documents of a batch into their summaries and delete them.
+        every step can be repeated, a batch interrupted at any point is finished by the next run.
+        :param batch_id: id of the batch the documents are tagged with
+        :return: amount of karma documents compacted, documents reclaimed and bytes reclaimed
+        """
+        documents = list(self._karma.find(filter=dict(compaction=batch_id)))
+        if len(documents) == 0:
+            self._karma.update_many(filter=dict(compactions=batch_id), update={"$pull": {'compactions': batch_id}})
+            return 0, 0, 0
+        summaries = defaultdict(int)
+        for document in documents:
+            summaries[(document['guild_id'], document['member_id'], document['channel_id'],
+                       day_of(document['created_date']))] += document['karma']
+        # a summary records the batches folded into it, so a repeated batch doesn't add its karma twice
+        keys = [dict(guild_id=guild_id, member_id=member_id, channel_id=channel_id, message_id='', created_date=day)
+                for guild_id, member_id, channel_id, day in summaries]
+        result = self._karma.bulk_write([UpdateOne(filter=summary, update={"$setOnInsert": {'karma': 0}}, upsert=True)
+                                         for summary in keys], ordered=False)
+        self._karma.bulk_write([UpdateOne(filter=dict(summary, compactions={"$ne": batch_id}),
+                                          update={"$inc": {'karma': karma}, "$addToSet": {'compactions': batch_id}})
+                                for summary, karma in zip(keys, summaries.values())], ordered=False)
+        deleted = self._karma.delete_many(filter=dict(compaction=batch_id))
+        if deleted.deleted_count != len(documents):
+            # only removing all karma of a member deletes tagged documents, its summaries are gone as well
+            log.error(f'Compaction batch {batch_id} deleted {deleted.deleted_count} of {len(documents)} '
+                      f'karma documents')
+            self.metrics.incr('mismatched_batches')
+        self._karma.update_many(filter=dict(compactions=batch_id), update={"$pull": {'compactions': batch_id}})
+        if self.message_filter is not None:
+            for document in documents:
+                self.message_filter.remove(document['message_id'])
+
+        # summaries that already existed from an earlier run only grew their karma
+        created = [dict(_id=result.upserted_ids[index], guild_id=guild_id, member_id=member_id,
+                        channel_id=channel_id, message_id='', created_date=day, karma=karma)
+                   for index, ((guild_id, member_id, channel_id, day), karma) in enumerate(summaries.items())
+                   if index in result.upserted_ids]
+        reclaimed = sum(len(bson.encode(document)) for document in documents) \
+            - sum(len(bson.encode(document)) for document in created)
+        return len(documents), deleted.deleted_count - len(created), reclaimed
+
+    def compact(self) -> Tuple[int, int]:
+        """
+        compact karma older than the retention period in at most batches batches,
+        the next run continues where this one stopped.
+        :return: amount of karma documents and bytes reclaimed
+        """
+        start = time.perf_counter()
+        cutoff = self.cutoff()
+        compacted, removed, reclaimed = 0, 0, 0
+        # batches of an interrupted run are finished first
+        batch_ids = self._karma.distinct('compaction', filter=dict(compaction={"$exists": True}))
+        for _ in range(self.batches):
+            batch_id = batch_ids.pop() if len(batch_ids) > 0 else self.claim_batch(cutoff)
+            if batch_id is None:
+                break
+            batch_compacted, batch_removed, batch_reclaimed = self.compact_batch(batch_id)
+            compacted += batch_compacted
+            removed += batch_removed
+            reclaimed += batch_reclaimed
+
+        self.metrics.incr('runs')
+        self.metrics.incr('documents_compacted', compacted)
+        self.metrics.incr('documents_reclaimed', removed)
+        self.metrics.incr('bytes_reclaimed', reclaimed)
+        self.metrics.observe('run_seconds', time.perf_counter() - start)
+        if compacted > 0:
+            log.info(f'Compacted {compacted} karma documents older than {cutoff:%Y-%m-%d}, '
+                     f'reclaimed {removed} documents and {reclaimed} bytes')
+        return removed, reclaimed
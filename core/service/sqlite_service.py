@@ -0,0 +1,350 @@
+import datetime
+import logging
+import sqlite3
+import threading
+from typing import List, Dict, Tuple, Optional, Iterator
+
+from pymongo.results import DeleteResult
+
+from core.model.member import KarmaMember, Member
+from core.service.mongo_service import day_of
+from core.service.storage import KarmaStorage, ChannelStorage, BlacklistStorage
+from util.config import settings
+
+log = logging.getLogger(__name__)
+
+# tables and indexes, the totals and daily buckets are maintained on every karma change like on mongodb
+schema = '''
+CREATE TABLE IF NOT EXISTS karma (guild_id TEXT NOT NULL, member_id TEXT NOT NULL, channel_id TEXT NOT NULL,
+                                  message_id TEXT NOT NULL, created_date TEXT NOT NULL, karma INTEGER NOT NULL,
+                                  PRIMARY KEY (guild_id, member_id, channel_id, message_id, created_date));
+CREATE INDEX IF NOT EXISTS karma_message ON karma (message_id);
+CREATE TABLE IF NOT EXISTS karma_totals (guild_id TEXT NOT NULL, member_id TEXT NOT NULL, channel_id TEXT NOT NULL,
+                                         karma INTEGER NOT NULL, PRIMARY KEY (guild_id, member_id, channel_id));
+CREATE INDEX IF NOT EXISTS karma_totals_guild_channel_karma_member
+    ON karma_totals (guild_id, channel_id, karma DESC, member_id);
+CREATE TABLE IF NOT EXISTS karma_daily (guild_id TEXT NOT NULL, channel_id TEXT NOT NULL, member_id TEXT NOT NULL,
+                                        day TEXT NOT NULL, karma INTEGER NOT NULL,
+                                        PRIMARY KEY (guild_id, channel_id, member_id, day));
+CREATE INDEX IF NOT EXISTS karma_daily_guild_day ON karma_daily (guild_id, day);
+CREATE TABLE IF NOT EXISTS blacklist (guild_id TEXT NOT NULL, member_id TEXT NOT NULL,
+                                      PRIMARY KEY (guild_id, member_id));
+'''
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """
+    open the database file and create the tables and indexes that are missing
+    :param path: path of the database file, :memory: for a database in memory
+    :return: connection shared by the sqlite services
+    """
+    # the services are called from the database executor threads, they serialise their access with a lock.
+    # writes run in transactions committed by the connection context manager
+    connection = sqlite3.connect(path, check_same_thread=False)
+    connection.row_factory = sqlite3.Row
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.executescript(schema)
+    log.info(f'Opened sqlite database {path}')
+    return connection
+
+
+def since(time_span: int) -> str:
+    """
+    the first day of a time span
+    :param time_span: amount of days including today
+    :return: day in the format of the day column
+    """
+    return (day_of(datetime.datetime.utcnow()) - datetime.timedelta(days=time_span - 1)).isoformat()
+
+
+def _document(row: sqlite3.Row) -> dict:
+    document = dict(row)
+    document['created_date'] = datetime.datetime.fromisoformat(document['created_date'])
+    return document
+
+
+def _leaderboard(rows: List[sqlite3.Row], channel_id: str) -> List[dict]:
+    if channel_id == '':
+        return [dict(_id=dict(member_id=row['member_id']), karma=row['karma']) for row in rows]
+    return [dict(_id=dict(member_id=row['member_id'], channel_id=channel_id), karma=row['karma']) for row in rows]
+
+
+class SqliteKarmaMemberService(KarmaStorage):
+    # KarmaStorage on sqlite, for deployments without mongodb
+    def __init__(self, connection: sqlite3.Connection, lock: threading.RLock, channel_cache=None):
+        self._connection = connection
+        self._lock = lock  # shared by all services of the connection
+        self.channel_cache = channel_cache
+
+    def _inc_totals(self, documents: List[dict], sign: int) -> None:
+        """
+        change the totals and daily buckets of karma documents, empty rows are removed.
+        has to be called inside a transaction
+        :param documents: karma documents
+        :param sign: 1 to add the karma of the documents, -1 to remove it
+        :return: None
+        """
+        cursor = self._connection.cursor()
+        for document in documents:
+            amount = sign * document['karma']
+            day = day_of(document['created_date']).isoformat()
+            for channel_id in ['', document['channel_id']]:
+                cursor.execute('INSERT INTO karma_totals VALUES (?, ?, ?, ?) ON CONFLICT (guild_id, member_id, '
+                               'channel_id) DO UPDATE SET karma = karma + excluded.karma',
+                               (document['guild_id'], document['member_id'], channel_id, amount))
+                if sign < 0:
+                    cursor.execute('DELETE FROM karma_totals WHERE guild_id = ? AND member_id = ? AND '
+                                   'channel_id = ? AND karma <= 0',
+                                   (document['guild_id'], document['member_id'], channel_id))
+            cursor.execute('INSERT INTO karma_daily VALUES (?, ?, ?, ?, ?) ON CONFLICT (guild_id, channel_id, '
+                           'member_id, day) DO UPDATE SET karma = karma + excluded.karma',
+                           (document['guild_id'], document['channel_id'], document['member_id'], day, amount))
+            if sign < 0:
+                cursor.execute('DELETE FROM karma_daily WHERE guild_id = ? AND channel_id = ? AND member_id = ? '
+                               'AND day = ? AND karma <= 0',
+                               (document['guild_id'], document['channel_id'], document['member_id'], day))
+
+    def _delete(self, where: str, parameters: tuple) -> List[dict]:
+        """
+        delete karma documents and their karma from the totals
+        :param where: condition of the documents to delete
+        :param parameters: parameters of the condition
+        :return: the deleted documents
+        """
+        with self._lock, self._connection:
+            documents = [_document(row) for row in
+                         self._connection.execute(f'SELECT * FROM karma WHERE {where}', parameters)]
+            if len(documents) != 0:
+                self._connection.execute(f'DELETE FROM karma WHERE {where}', parameters)
+                self._inc_totals(documents, -1)
+        return documents
+
+    def upsert_karma_member(self, member: KarmaMember) -> None:
+        document = dict(vars(member), karma=1)
+        with self._lock, self._connection:
+            self._connection.execute('INSERT INTO karma VALUES (?, ?, ?, ?, ?, 1) ON CONFLICT (guild_id, member_id, '
+                                     'channel_id, message_id, created_date) DO UPDATE SET karma = karma + 1',
+                                     (member.guild_id, member.member_id, member.channel_id, member.message_id,
+                                      member.created_date.isoformat()))
+            self._inc_totals([document], 1)
+        self._karma_changed(member.guild_id)
+
+    def delete_single_karma(self, member: KarmaMember) -> DeleteResult:
+        deleted = self._delete('rowid = (SELECT rowid FROM karma WHERE message_id = ? AND guild_id = ? AND '
+                               'member_id = ? AND channel_id = ? LIMIT 1)',
+                               (member.message_id, member.guild_id, member.member_id, member.channel_id))
+        if len(deleted) != 0:
+            self._karma_changed(member.guild_id)
+        return DeleteResult({'n': len(deleted)}, acknowledged=True)
+
+    def delete_message_karma(self, guild_id: str, message_id: str) -> List[str]:
+        deleted = self._delete('message_id = ? AND guild_id = ?', (message_id, guild_id))
+        if len(deleted) != 0:
+            self._karma_changed(guild_id)
+        return list(dict.fromkeys(document['member_id'] for document in deleted))
+
+    def delete_all_karma(self, member: KarmaMember) -> DeleteResult:
+        with self._lock, self._connection:
+            for table in ['karma_totals', 'karma_daily']:
+                self._connection.execute(f'DELETE FROM {table} WHERE guild_id = ? AND member_id = ?',
+                                         (member.guild_id, member.member_id))
+            deleted = self._connection.execute('DELETE FROM karma WHERE guild_id = ? AND member_id = ?',
+                                               (member.guild_id, member.member_id)).rowcount
+        self._karma_changed(member.guild_id)
+        return DeleteResult({'n': deleted}, acknowledged=True)
+
+    def _rebuild(self, table: str, select: str, guild_id: str = None) -> int:
+        """
+        replace the rows of a pre-aggregated table by rows computed from the karma table
+        :param table: karma_totals or karma_daily
+        :param select: query computing the rows, {where} is replaced by the guild filter
+        :param guild_id: optional guild whose rows are rebuilt, all guilds if None
+        :return: amount of rows written
+        """
+        where = '' if guild_id is None else 'WHERE guild_id = :guild_id'
+        parameters = dict(guild_id=guild_id)
+        with self._lock, self._connection:
+            self._connection.execute(f'DELETE FROM {table} {where}', parameters)
+            written = self._connection.execute(f'INSERT INTO {table} {select.format(where=where)}',
+                                               parameters).rowcount
+        log.info(f'Rebuilt {table} with {written} rows')
+        return written
+
+    def rebuild_karma_totals(self, guild_id: str = None) -> int:
+        return self._rebuild('karma_totals', 'SELECT guild_id, member_id, channel_id, SUM(karma) FROM karma {where} '
+                                             'GROUP BY guild_id, member_id, channel_id '
+                                             'UNION ALL SELECT guild_id, member_id, \'\', SUM(karma) FROM karma '
+                                             '{where} GROUP BY guild_id, member_id', guild_id)
+
+    def rebuild_daily_karma(self, guild_id: str = None) -> int:
+        return self._rebuild('karma_daily', 'SELECT guild_id, channel_id, member_id, '
+                                            'substr(created_date, 1, 10) || \'T00:00:00\', SUM(karma) FROM karma '
+                                            '{where} GROUP BY guild_id, channel_id, member_id, '
+                                            'substr(created_date, 1, 10)', guild_id)
+
+    def stream_karma(self, guild_id: str, batch_size: int = 1000) -> Iterator[dict]:
+        rowid = 0
+        while True:
+            # keyset batches, the lock isn't held while the caller processes a batch
+            with self._lock:
+                rows = self._connection.execute('SELECT rowid, * FROM karma WHERE guild_id = ? AND rowid > ? '
+                                                'ORDER BY rowid LIMIT ?', (guild_id, rowid, batch_size)).fetchall()
+            if len(rows) == 0:
+                return
+            rowid = rows[-1]['rowid']
+            for row in rows:
+                document = _document(row)
+                del document['rowid']
+                yield document
+
+    def import_karma(self, documents: List[dict]) -> int:
+        with self._lock, self._connection:
+            for document in documents:
+                key = (document['guild_id'], document['member_id'], document['channel_id'], document['message_id'],
+                       document['created_date'].isoformat())
+                # a replaced document gives up its karma first
+                for row in self._connection.execute('SELECT * FROM karma WHERE guild_id = ? AND member_id = ? AND '
+                                                    'channel_id = ? AND message_id = ? AND created_date = ?', key):
+                    self._inc_totals([_document(row)], -1)
+                self._connection.execute('INSERT OR REPLACE INTO karma VALUES (?, ?, ?, ?, ?, ?)',
+                                         key + (document['karma'],))
+                self._inc_totals([document], 1)
+        for guild_id in {document['guild_id'] for document in documents}:
+            self._karma_changed(guild_id)
+        return len(documents)
+
+    def aggregate_member_by_karma(self, member: KarmaMember) -> Optional[int]:
+        with self._lock:
+            row = self._connection.execute('SELECT karma FROM karma_totals WHERE guild_id = ? AND member_id = ? AND '
+                                           'channel_id = \'\'', (member.guild_id, member.member_id)).fetchone()
+        return None if row is None else row['karma']
+
+    def aggregate_members_by_karma(self, guild_id: str, member_ids: List[str]) -> Dict[str, int]:
+        member_ids = [str(member_id) for member_id in member_ids]
+        karma = dict.fromkeys(member_ids, 0)
+        if len(member_ids) == 0:
+            return karma
+        with self._lock:
+            for row in self._connection.execute(f'SELECT member_id, karma FROM karma_totals WHERE guild_id = ? AND '
+                                                f'channel_id = \'\' AND member_id IN '
+                                                f'({", ".join("?" * len(member_ids))})', [guild_id] + member_ids):
+                karma[row['member_id']] = row['karma']
+        return karma
+
+    def aggregate_member_by_channels(self, member: KarmaMember) -> Iterator[dict]:
+        with self._lock:
+            rows = self._connection.execute('SELECT channel_id, karma FROM karma_totals WHERE guild_id = ? AND '
+                                            'member_id = ? AND channel_id > \'\' ORDER BY karma DESC, channel_id '
+                                            'LIMIT ?', (member.guild_id, member.member_id,
+                                                        settings().profile_channels)).fetchall()
+        return iter([dict(_id=dict(member_id=member.member_id, channel_id=row['channel_id']), karma=row['karma'])
+                     for row in rows])
+
+    def aggregate_top_karma_members(self, guild_id: str, channel_id: str = '', time_span: int = 0) -> Iterator[dict]:
+        limit = settings().leaderboard
+        with self._lock:
+            if time_span == 0:
+                rows = self._connection.execute('SELECT member_id, karma FROM karma_totals WHERE guild_id = ? AND '
+                                                'channel_id = ? ORDER BY karma DESC, member_id LIMIT ?',
+                                                (guild_id, channel_id, limit)).fetchall()
+            else:
+                channel_filter = '' if channel_id == '' else 'AND channel_id = :channel_id'
+                rows = self._connection.execute(f'SELECT member_id, SUM(karma) AS karma FROM karma_daily WHERE '
+                                                f'guild_id = :guild_id AND day >= :since {channel_filter} '
+                                                f'GROUP BY member_id ORDER BY karma DESC, member_id LIMIT :limit',
+                                                dict(guild_id=guild_id, since=since(time_span),
+                                                     channel_id=channel_id, limit=limit)).fetchall()
+        return iter(_leaderboard(rows, channel_id))
+
+    def aggregate_karma_page(self, guild_id: str, channel_id: str = '', after: Tuple[int, str] = None,
+                             size: int = 10) -> Iterator[dict]:
+        with self._lock:
+            if after is None:
+                rows = self._connection.execute('SELECT member_id, karma FROM karma_totals WHERE guild_id = ? AND '
+                                                'channel_id = ? ORDER BY karma DESC, member_id LIMIT ?',
+                                                (guild_id, channel_id, size)).fetchall()
+            else:
+                rows = self._connection.execute('SELECT member_id, karma FROM karma_totals WHERE guild_id = ? AND '
+                                                'channel_id = ? AND (karma < ? OR (karma = ? AND member_id > ?)) '
+                                                'ORDER BY karma DESC, member_id LIMIT ?',
+                                                (guild_id, channel_id, after[0], after[0], after[1],
+                                                 size)).fetchall()
+        return iter(_leaderboard(rows, channel_id))
+
+    def member_rank(self, member: KarmaMember) -> Optional[Tuple[int, int]]:
+        with self._lock:
+            row = self._connection.execute('SELECT karma FROM karma_totals WHERE guild_id = ? AND member_id = ? AND '
+                                           'channel_id = ?',
+                                           (member.guild_id, member.member_id, member.channel_id)).fetchone()
+            if row is None or row['karma'] <= 0:
+                return None
+            above = self._connection.execute('SELECT COUNT(*) FROM karma_totals WHERE guild_id = ? AND '
+                                             'channel_id = ? AND karma > ?',
+                                             (member.guild_id, member.channel_id, row['karma'])).fetchone()[0]
+        return above + 1, row['karma']
+
+    def find_message(self, message_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._connection.execute('SELECT * FROM karma WHERE message_id = ? LIMIT 1',
+                                           (message_id,)).fetchone()
+        return None if row is None else _document(row)
+
+
+class SqliteKarmaChannelService(ChannelStorage):
+    # ChannelStorage on sqlite, reads the totals and daily buckets maintained by the SqliteKarmaMemberService
+    def __init__(self, connection: sqlite3.Connection, lock: threading.RLock, channel_cache=None):
+        self._connection = connection
+        self._lock = lock
+        self.channel_cache = channel_cache
+
+    def _aggregate_top_karma_channels(self, guild_id: str, time_span: int) -> Iterator[dict]:
+        with self._lock:
+            if time_span == 0:
+                rows = self._connection.execute('SELECT channel_id, SUM(karma) AS karma FROM karma_totals WHERE '
+                                                'guild_id = ? AND channel_id > \'\' GROUP BY channel_id '
+                                                'ORDER BY karma DESC, channel_id LIMIT ?',
+                                                (guild_id, settings().leaderboard)).fetchall()
+            else:
+                rows = self._connection.execute('SELECT channel_id, SUM(karma) AS karma FROM karma_daily WHERE '
+                                                'guild_id = ? AND day >= ? GROUP BY channel_id '
+                                                'ORDER BY karma DESC, channel_id LIMIT ?',
+                                                (guild_id, since(time_span), settings().leaderboard)).fetchall()
+        return iter([dict(_id=dict(channel_id=row['channel_id']), karma=row['karma']) for row in rows])
+
+
+class SqliteBlockerService(BlacklistStorage):
+    # BlacklistStorage on sqlite, lookups use the primary key of the blacklist table
+    def __init__(self, connection: sqlite3.Connection, lock: threading.RLock):
+        self._connection = connection
+        self._lock = lock
+
+    def blacklist(self, member: Member) -> None:
+        with self._lock, self._connection:
+            self._connection.execute('INSERT OR IGNORE INTO blacklist VALUES (?, ?)',
+                                     (member.guild_id, member.member_id))
+
+    def whitelist(self, member: Member) -> None:
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM blacklist WHERE guild_id = ? AND member_id = ?',
+                                     (member.guild_id, member.member_id))
+
+    def find_member(self, member: Member) -> Optional[dict]:
+        with self._lock:
+            row = self._connection.execute('SELECT 1 FROM blacklist WHERE guild_id = ? AND member_id = ?',
+                                           (member.guild_id, member.member_id)).fetchone()
+        return None if row is None else vars(member)
+
+    def find_all_blacklisted(self, guild_id: str) -> List[dict]:
+        with self._lock:
+            return [dict(member_id=row['member_id']) for row in
+                    self._connection.execute('SELECT member_id FROM blacklist WHERE guild_id = ?', (guild_id,))]
+
+    def stream_blacklist(self, guild_id: str, batch_size: int = 1000) -> Iterator[dict]:
+        return iter([dict(guild_id=guild_id, member_id=member['member_id'])
+                     for member in self.find_all_blacklisted(guild_id)])
+
+    def import_blacklist(self, documents: List[dict]) -> int:
+        with self._lock, self._connection:
+            self._connection.executemany('INSERT OR IGNORE INTO blacklist VALUES (?, ?)',
+                                         [(document['guild_id'], document['member_id']) for document in documents])
+        return len(documents)
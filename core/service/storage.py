@@ -0,0 +1,285 @@
+import time
+from abc import ABC, abstractmethod
+from typing import List, Dict, Tuple, Optional, Iterator
+
+from pymongo.results import DeleteResult
+
+from core.model.member import KarmaMember, Member
+
+
+class KarmaStorage(ABC):
+    # storage of the karma of members, implemented by every storage engine.
+    # leaderboards are lists of documents shaped like {'_id': {'member_id': ..., 'channel_id': ...}, 'karma': ...},
+    # sorted by karma descending and member_id ascending.
+
+    # optional components, only engines that support them set them
+    write_buffer = None  # KarmaWriteBuffer
+    message_filter = None  # KarmaMessageFilter
+    retention = None  # KarmaRetention
+    channel_cache = None  # KarmaChannelCache, invalidated on every karma change
+
+    def flush(self) -> int:
+        """
+        write pending karma gains, engines without write buffer have nothing pending.
+        :return: amount of karma documents written
+        """
+        return 0
+
+    def seed_message_filter(self) -> int:
+        """
+        fill the message filter with the message ids of all karma, engines without filter have nothing to seed.
+        :return: amount of karma documents added to the filter
+        """
+        return 0
+
+    def _karma_changed(self, guild_id: str) -> None:
+        """
+        invalidate what is cached about the karma of a guild, called after every karma change.
+        :param guild_id: guild whose karma changed
+        :return: None
+        """
+        if self.channel_cache is not None:
+            self.channel_cache.invalidate(guild_id)
+
+    @abstractmethod
+    def upsert_karma_member(self, member: KarmaMember):
+        """
+        add a karma of the member gained through a message
+        :param member: karma member who gained karma
+        :return: engine specific result, not used by callers
+        """
+
+    @abstractmethod
+    def delete_single_karma(self, member: KarmaMember) -> DeleteResult:
+        """
+        remove the karma a member gained through a single message
+        :param member: karma member to remove
+        :return: delete result
+        """
+
+    @abstractmethod
+    def delete_message_karma(self, guild_id: str, message_id: str) -> List[str]:
+        """
+        remove the karma of every member that gained karma through a message
+        :param guild_id: guild of the message
+        :param message_id: id of the message whose karma is removed
+        :return: ids of the members whose karma was removed
+        """
+
+    @abstractmethod
+    def delete_all_karma(self, member: KarmaMember) -> DeleteResult:
+        """
+        remove all karma of a single member, regardless of channel.
+        :param member: which karma is to be completely removed.
+        :return: delete result
+        """
+
+    @abstractmethod
+    def rebuild_karma_totals(self, guild_id: str = None) -> int:
+        """
+        recompute the karma totals from the karma documents
+        :param guild_id: optional guild whose totals are recomputed, all guilds if None
+        :return: amount of totals written
+        """
+
+    @abstractmethod
+    def rebuild_daily_karma(self, guild_id: str = None) -> int:
+        """
+        recompute the daily karma buckets from the karma documents
+        :param guild_id: optional guild whose buckets are recomputed, all guilds if None
+        :return: amount of daily buckets written
+        """
+
+    @abstractmethod
+    def stream_karma(self, guild_id: str, batch_size: int = 1000) -> Iterator[dict]:
+        """
+        all karma documents of a guild, read batch_size documents at a time.
+        :param guild_id: guild whose karma is read
+        :param batch_size: documents read at once
+        :return: iterator of the karma documents without _id
+        """
+
+    @abstractmethod
+    def import_karma(self, documents: List[dict]) -> int:
+        """
+        write a batch of exported karma documents, importing the same documents again replaces them.
+        the totals of the guilds have to be rebuilt afterwards.
+        :param documents: karma documents
+        :return: amount of documents written
+        """
+
+    @abstractmethod
+    def aggregate_member_by_karma(self, member: KarmaMember) -> Optional[int]:
+        """
+        get the karma of a member in a guild
+        :param member: whose karma to look up
+        :return: karma of member, None without karma
+        """
+
+    @abstractmethod
+    def aggregate_members_by_karma(self, guild_id: str, member_ids: List[str]) -> Dict[str, int]:
+        """
+        get the karma of several members of a guild
+        :param guild_id: guild of the members
+        :param member_ids: ids of the members whose karma to look up
+        :return: member id to karma, members without karma have 0
+        """
+
+    @abstractmethod
+    def aggregate_member_by_channels(self, member: KarmaMember) -> Iterator[dict]:
+        """
+        get the karma by channels in a guild from a single member, limited to the configured profile channels
+        :param member: the member whose karma to get by channels.
+        :return: channel documents with member_id and channel_id
+        """
+
+    def aggregate_member_profile(self, member: KarmaMember, channels: int = -1) -> dict:
+        """
+        get the total karma and the top channels of a member
+        :param member: the member whose profile to get
+        :param channels: amount of top channels, defaults to the configured profile channels
+        :return: dict with the total karma (0 without karma) and the channel documents
+        """
+        karma = self.aggregate_member_by_karma(member)
+        top_channels = list(self.aggregate_member_by_channels(member)) if channels != 0 else []
+        return dict(karma=0 if karma is None else karma,
+                    channels=top_channels if channels < 0 else top_channels[:channels])
+
+    @abstractmethod
+    def aggregate_top_karma_members(self, guild_id: str, channel_id: str = '', time_span: int = 0) -> Iterator[dict]:
+        """
+        aggregate the configured amount of top karma members of a guild, optionally of a channel or the last days
+        :param guild_id: guild to aggregate top members for
+        :param channel_id: channel to filter out the results
+        :param time_span: time span in days, 0 for all time
+        :return: leaderboard documents
+        """
+
+    @abstractmethod
+    def aggregate_karma_page(self, guild_id: str, channel_id: str = '', after: Tuple[int, str] = None,
+                             size: int = 10) -> Iterator[dict]:
+        """
+        a page of the all time leaderboard that continues after the last member of the previous page
+        :param guild_id: guild of the leaderboard
+        :param channel_id: optional channel of the leaderboard
+        :param after: karma and member_id of the last member of the previous page, None for the first page
+        :param size: members per page
+        :return: leaderboard documents
+        """
+
+    @abstractmethod
+    def member_rank(self, member: KarmaMember) -> Optional[Tuple[int, int]]:
+        """
+        the position of a member in the all time leaderboard, members with equal karma share the position.
+        :param member: member to rank, with a channel_id for the channel leaderboard
+        :return: position and karma of the member, None if the member has no karma
+        """
+
+    @abstractmethod
+    def find_message(self, message_id: str) -> Optional[dict]:
+        """
+        find a karma document of a message
+        :param message_id: id of the message to find
+        :return: karma document of the message or None
+        """
+
+
+class ChannelStorage(ABC):
+    # storage of the karma of channels, implemented by every storage engine
+    channel_cache = None  # optional KarmaChannelCache
+
+    def aggregate_top_karma_channels(self, guild_id: str, time_span: int = 0) -> list:
+        """
+        aggregate the channels of a guild in which members gained the most karma, optionally of the last days
+        :param guild_id: guild to aggregate top channels for
+        :param time_span: time span in days, 0 for all time
+        :return: list containing channel information and karma
+        """
+        if self.channel_cache is not None:
+            channels = self.channel_cache.get(guild_id, time_span)
+            if channels is not None:
+                return channels
+        return self.refresh_top_karma_channels(guild_id, time_span)
+
+    def refresh_top_karma_channels(self, guild_id: str, time_span: int = 0) -> list:
+        """
+        aggregate the top channels of a guild without looking at the cache and cache the result
+        :param guild_id: guild to aggregate top channels for
+        :param time_span: time span in days, 0 for all time
+        :return: list containing channel information and karma
+        """
+        started = time.monotonic()
+        channels = list(self._aggregate_top_karma_channels(guild_id, time_span))
+        if self.channel_cache is not None:
+            self.channel_cache.put(guild_id, time_span, channels, started)
+        return channels
+
+    @abstractmethod
+    def _aggregate_top_karma_channels(self, guild_id: str, time_span: int) -> Iterator[dict]:
+        """
+        group the karma of the guild by channel, limited to the configured leaderboard size
+        :param guild_id: guild to aggregate top channels for
+        :param time_span: time span in days, 0 for all time
+        :return: documents shaped like {'_id': {'channel_id': ...}, 'karma': ...}
+        """
+
+
+class BlacklistStorage(ABC):
+    # storage of the members that are blacklisted from giving karma, implemented by every storage engine
+
+    def is_loaded(self, guild_id: str) -> bool:
+        """
+        check if lookups in the blacklist of the guild are answered from memory
+        :param guild_id: id of the guild
+        :return: True if find_member doesn't need the database
+        """
+        return False
+
+    @abstractmethod
+    def blacklist(self, member: Member):
+        """
+        blacklist a member, no matter if it is already blacklisted or not.
+        :param member: member to blacklist from giving out karma.
+        :return: engine specific result, not used by callers
+        """
+
+    @abstractmethod
+    def whitelist(self, member: Member):
+        """
+        whitelist a member, no matter if it isn't blacklisted anymore or not.
+        :param member: member to whitelist to allow them to give out karma once again.
+        :return: engine specific result, not used by callers
+        """
+
+    @abstractmethod
+    def find_member(self, member: Member) -> Optional[dict]:
+        """
+        looks for a member inside the blacklist
+        :param member: member to check if is inside the blacklist
+        :return: the member if he exists or None
+        """
+
+    @abstractmethod
+    def find_all_blacklisted(self, guild_id: str) -> List[dict]:
+        """
+        returns all blacklisted members found in the guild
+        :param guild_id: id of the guild whose blacklist is to be retrieved
+        :return: list of documents with the member ids
+        """
+
+    @abstractmethod
+    def stream_blacklist(self, guild_id: str, batch_size: int = 1000) -> Iterator[dict]:
+        """
+        all blacklist documents of a guild, read batch_size documents at a time.
+        :param guild_id: guild whose blacklist is read
+        :param batch_size: documents read at once
+        :return: iterator of the blacklist documents without _id
+        """
+
+    @abstractmethod
+    def import_blacklist(self, documents: List[dict]) -> int:
+        """
+        write a batch of exported blacklist documents
+        :param documents: blacklist documents
+        :return: amount of documents written
+        """
@@ -0,0 +1,144 @@
+import csv
+import datetime
+import json
+import logging
+from typing import Dict, Iterator, TextIO, Callable, Optional, Tuple
+
+from core.service.mongo_service import KarmaMemberService, BlockerService
+
+log = logging.getLogger(__name__)
+
+file_formats = ['ndjson', 'csv']
+# columns of the csv format, karma and blacklist documents share one file
+csv_fields = ['collection', 'guild_id', 'member_id', 'channel_id', 'message_id', 'created_date', 'karma']
+# fields of the documents of each collection
+collection_fields = {
+    'karma': ['guild_id', 'member_id', 'channel_id', 'message_id', 'created_date', 'karma'],
+    'blacklist': ['guild_id', 'member_id'],
+}
+
+
+def encode(collection: str, document: dict) -> dict:
+    """
+    convert a document into a record of the export, dates become iso strings
+    :param collection: collection of the document
+    :param document: karma or blacklist document
+    :return: record with the collection name
+    """
+    record = dict(collection=collection)
+    for field in collection_fields[collection]:
+        value = document[field]
+        record[field] = value.isoformat() if isinstance(value, datetime.datetime) else value
+    return record
+
+
+def decode(record: dict, guild_id: str = None) -> Tuple[str, dict]:
+    """
+    convert a record of an export back into a document
+    :param record: record with the collection name
+    :param guild_id: optional guild the document is moved to
+    :return: collection and document
+    """
+    collection = record['collection']
+    if collection not in collection_fields:
+        raise ValueError(f'Unknown collection {collection}')
+    document = {field: str(record[field]) for field in collection_fields[collection]}
+    if guild_id is not None:
+        document['guild_id'] = guild_id
+    if collection == 'karma':
+        document['created_date'] = datetime.datetime.fromisoformat(document['created_date'])
+        document['karma'] = int(document['karma'])
+    return collection, document
+
+
+def read_records(stream: TextIO, file_format: str) -> Iterator[dict]:
+    """
+    read the records of an export one at a time
+    :param stream: text stream of the export
+    :param file_format: ndjson or csv
+    :return: iterator of the records
+    """
+    if file_format == 'csv':
+        return csv.DictReader(stream)
+    return (json.loads(line) for line in stream if line.strip() != '')
+
+
+class TransferService:
+    # export and import of the karma and blacklist of a guild. documents are streamed in batches,
+    # so memory stays constant no matter how many documents a guild has.
+    def __init__(self, karma_service: KarmaMemberService, blocker_service: BlockerService, batch_size: int = 1000):
+        self._karma_service = karma_service
+        self._blocker_service = blocker_service
+        self.batch_size = batch_size
+
+    def export_guild(self, guild_id: str, stream: TextIO, file_format: str = 'ndjson') -> Dict[str, int]:
+        """
+        write the karma and blacklist documents of a guild to the stream
+        :param guild_id: guild to export
+        :param stream: text stream the export is written to
+        :param file_format: ndjson or csv
+        :return: collection name to amount of exported documents
+        """
+        if file_format not in file_formats:
+            raise ValueError(f'Unknown file format {file_format}')
+        writer = None
+        if file_format == 'csv':
+            writer = csv.DictWriter(stream, fieldnames=csv_fields, restval='', lineterminator='\n')
+            writer.writeheader()
+        counts = dict(karma=0, blacklist=0)
+        cursors = dict(karma=self._karma_service.stream_karma(guild_id, self.batch_size),
+                       blacklist=self._blocker_service.stream_blacklist(guild_id, self.batch_size))
+        for collection, cursor in cursors.items():
+            for document in cursor:
+                record = encode(collection, document)
+                if writer is not None:
+                    writer.writerow(record)
+                else:
+                    stream.write(json.dumps(record) + '\n')
+                counts[collection] += 1
+        log.info(f'Exported {counts["karma"]} karma and {counts["blacklist"]} blacklist documents '
+                 f'of guild {guild_id}')
+        return counts
+
+    def import_guild(self, stream: TextIO, file_format: str = 'ndjson', guild_id: str = None,
+                     progress: Optional[Callable[[Dict[str, int]], None]] = None) -> Dict[str, int]:
+        """
+        write the documents of an export in ordered batches of batch_size documents and
+        rebuild the karma totals of the imported guilds afterwards.
+        :param stream: text stream of the export
+        :param file_format: ndjson or csv
+        :param guild_id: optional guild all documents are moved to, the guild ids of the export are kept if None
+        :param progress: called with the amounts of imported documents after every batch
+        :return: collection name to amount of imported documents
+        """
+        if file_format not in file_formats:
+            raise ValueError(f'Unknown file format {file_format}')
+        imports = dict(karma=self._karma_service.import_karma, blacklist=self._blocker_service.import_blacklist)
+        batches = dict(karma=[], blacklist=[])
+        counts = dict(karma=0, blacklist=0)
+        guild_ids = set()
+
+        def write(collection: str) -> None:
+            counts[collection] += imports[collection](batches[collection])
+            batches[collection] = []
+            if progress is not None:
+                progress(dict(counts))
+
+        try:
+            for record in read_records(stream, file_format):
+                collection, document = decode(record, guild_id)
+                guild_ids.add(document['guild_id'])
+                batches[collection].append(document)
+                if len(batches[collection]) >= self.batch_size:
+                    write(collection)
+            for collection in batches:
+                if len(batches[collection]) > 0:
+                    write(collection)
+        finally:
+            # the totals and daily buckets are derived from the karma, including what a failed import wrote
+            if counts['karma'] > 0:
+                for imported_guild_id in guild_ids:
+                    self._karma_service.rebuild_karma_totals(imported_guild_id)
+                    self._karma_service.rebuild_daily_karma(imported_guild_id)
+        log.info(f'Imported {counts["karma"]} karma and {counts["blacklist"]} blacklist documents')
+        return counts
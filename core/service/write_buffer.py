@@ -0,0 +1,254 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+from typing import List
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from core.metrics import metrics
+from core.model.member import KarmaMember
+from core.service.mongo_service import day_of
+
+log = logging.getLogger(__name__)
+
+
+class KarmaWriteBuffer:
+    # write-behind buffer for karma gains, coalesces them in memory and writes them with a single
+    # bulk_write per collection once max_operations are pending or the flush interval passed.
+    def __init__(self, karma, totals, daily, max_operations: int = 100, interval: float = 0.5):
+        self._karma = karma
+        self._totals = totals
+        self._daily = daily
+        self.max_operations = max_operations
+        self.interval = interval  # seconds between two periodic flushes
+        # flushing holds the lock, so readers waiting for a flush see the written karma afterwards
+        self._lock = threading.RLock()
+        self._documents = {}  # (guild_id, member_id, channel_id, message_id) -> karma document
+        self._totals_inc = defaultdict(int)  # (guild_id, member_id, channel_id) -> karma
+        self._daily_inc = defaultdict(int)  # (guild_id, channel_id, member_id, day) -> karma
+        self._oldest = None  # time of the oldest pending gain
+        self._unconfirmed = set()  # keys of pending gains a failed flush might have written to karma
+        self.metrics = metrics('write_buffer')
+
+    def __len__(self):
+        return len(self._documents)
+
+    def _inc(self, document: dict, amount: int) -> None:
+        guild_id, member_id, channel_id = document['guild_id'], document['member_id'], document['channel_id']
+        self._totals_inc[(guild_id, member_id, '')] += amount
+        self._totals_inc[(guild_id, member_id, channel_id)] += amount
+        self._daily_inc[(guild_id, channel_id, member_id, day_of(document['created_date']))] += amount
+
+    def add(self, member: KarmaMember) -> bool:
+        """
+        buffer a karma gain of the member
+        :param member: karma member who gained karma
+        :return: True if the buffer is full and has to be flushed
+        """
+        document = dict(vars(member), karma=1)
+        with self._lock:
+            key = (member.guild_id, member.member_id, member.channel_id, member.message_id)
+            if key in self._documents:
+                # the same karma can only be given once, like the upsert on the karma collection
+                return False
+            self._documents[key] = document
+            self._inc(document, 1)
+            if self._oldest is None:
+                self._oldest = time.perf_counter()
+            self.metrics.incr('buffered')
+            return len(self._documents) >= self.max_operations
+
+    def cancel(self, member: KarmaMember) -> bool:
+        """
+        remove a pending karma gain, a gain and its removal never reach the database.
+        :param member: karma member whose karma is removed
+        :return: True if the gain was still pending
+        """
+        with self._lock:
+            key = (member.guild_id, member.member_id, member.channel_id, member.message_id)
+            document = self._documents.pop(key, None)
+            if document is None:
+                return False
+            self._discard_unconfirmed([key])
+            self._inc(document, -1)
+            self.metrics.incr('coalesced')
+            return True
+
+    def cancel_message(self, guild_id: str, message_id: str) -> List[dict]:
+        """
+        remove every pending karma gain of a message
+        :param guild_id: guild of the message
+        :param message_id: id of the message whose karma is removed
+        :return: the pending karma documents that were removed
+        """
+        with self._lock:
+            keys = [key for key in self._documents if key[0] == guild_id and key[3] == message_id]
+            documents = [self._documents.pop(key) for key in keys]
+            self._discard_unconfirmed(keys)
+            for document in documents:
+                self._inc(document, -1)
+            self.metrics.incr('coalesced', len(documents))
+            return documents
+
+    def discard_member(self, guild_id: str, member_id: str) -> None:
+        """
+        drop every pending gain of a member, used when all karma of the member is removed.
+        :param guild_id: guild of the member
+        :param member_id: id of the member
+        :return: None
+        """
+        with self._lock:
+            # every karma document, total and bucket of the member is deleted by the caller,
+            # so increments left by a failed flush are dropped as well
+            for key in [key for key in self._documents if key[0] == guild_id and key[1] == member_id]:
+                del self._documents[key]
+                self._unconfirmed.discard(key)
+            for key in [key for key in self._totals_inc if key[0] == guild_id and key[1] == member_id]:
+                del self._totals_inc[key]
+            for key in [key for key in self._daily_inc if key[0] == guild_id and key[2] == member_id]:
+                del self._daily_inc[key]
+
+    def touches(self, guild_id: str, member_id: str = '') -> bool:
+        """
+        check if there are pending gains in a guild, or of a single member of the guild,
+        this includes increments of a failed flush whose documents are already written.
+        :param guild_id: guild to check
+        :param member_id: optional member to check
+        :return: True if a read on the guild or member has to flush first
+        """
+        with self._lock:
+            return any(key[0] == guild_id and (member_id == '' or key[1] == member_id) for key in self._documents) \
+                or any(amount != 0 and key[0] == guild_id and (member_id == '' or key[1] == member_id)
+                       for key, amount in self._totals_inc.items()) \
+                or any(amount != 0 and key[0] == guild_id and (member_id == '' or key[2] == member_id)
+                       for key, amount in self._daily_inc.items())
+
+    def find_message(self, message_id: str):
+        """
+        find a pending karma document by message id
+        :param message_id: id of the message
+        :return: the pending karma document or None
+        """
+        with self._lock:
+            for document in self._documents.values():
+                if document['message_id'] == message_id:
+                    return document
+        return None
+
+    def _merge(self, documents: dict, totals_inc: dict, daily_inc: dict, oldest: float) -> None:
+        """
+        put the unwritten part of a failed flush back into the buffer, so the next flush writes it.
+        :param documents: karma documents that were not written
+        :param totals_inc: totals increments that were not written
+        :param daily_inc: daily increments that were not written
+        :param oldest: time of the oldest gain of the failed flush
+        :return: None
+        """
+        self._documents.update(documents)
+        for key, amount in totals_inc.items():
+            self._totals_inc[key] += amount
+        for key, amount in daily_inc.items():
+            self._daily_inc[key] += amount
+        if self._oldest is None or oldest < self._oldest:
+            self._oldest = oldest
+
+    @staticmethod
+    def _failed_operations(error: Exception, keys: list) -> list:
+        """
+        the keys of the operations a failed bulk_write did not apply
+        :param error: error raised by bulk_write
+        :param keys: key of each operation of the bulk_write, in order
+        :return: keys of the operations to retry
+        """
+        # an unordered bulk_write applies every operation without a write error,
+        # any other error leaves it open what was applied, so everything is retried
+        if isinstance(error, BulkWriteError):
+            return [keys[write_error['index']] for write_error in error.details.get('writeErrors', [])]
+        return keys
+
+    def _discard_unconfirmed(self, keys: list) -> None:
+        """
+        delete documents of a failed flush which might have been written, before their pending gain is removed.
+        their totals were never incremented, so only the documents are deleted.
+        :param keys: keys of the removed pending gains
+        :return: None
+        """
+        keys = [key for key in keys if key in self._unconfirmed]
+        if len(keys) == 0:
+            return
+        self._karma.delete_many({"$or": [dict(guild_id=guild_id, member_id=member_id, channel_id=channel_id,
+                                              message_id=message_id)
+                                         for guild_id, member_id, channel_id, message_id in keys]})
+        self._unconfirmed.difference_update(keys)
+
+    def flush(self) -> int:
+        """
+        write all pending gains with one bulk_write per collection.
+        whatever a failed flush did not write stays in the buffer and is written by the next flush.
+        :return: amount of karma documents written
+        """
+        with self._lock:
+            if len(self._documents) == 0 and not self._has_increments():
+                return 0
+            documents, totals_inc, daily_inc = self._documents, self._totals_inc, self._daily_inc
+            oldest = self._oldest if self._oldest is not None else time.perf_counter()
+            self._documents, self._totals_inc, self._daily_inc = {}, defaultdict(int), defaultdict(int)
+            self._oldest = None
+
+            start = time.perf_counter()
+            # each stage is only done once, a failed stage and the ones after it are retried by the next flush
+            stage = 'karma'
+            try:
+                if len(documents) > 0:
+                    # upserts instead of inserts, so writing a document of a failed flush again doesn't duplicate it
+                    self._karma.bulk_write([UpdateOne(filter=dict(guild_id=document['guild_id'],
+                                                                  member_id=document['member_id'],
+                                                                  channel_id=document['channel_id'],
+                                                                  message_id=document['message_id']),
+                                                      update={"$setOnInsert": document}, upsert=True)
+                                            for document in documents.values()], ordered=False)
+                self._unconfirmed.difference_update(documents.keys())
+                stage = 'totals'
+                totals_keys = [key for key, amount in totals_inc.items() if amount != 0]
+                if len(totals_keys) > 0:
+                    self._totals.bulk_write([
+                        UpdateOne(filter=dict(guild_id=guild_id, member_id=member_id, channel_id=channel_id),
+                                  update={"$inc": {'karma': totals_inc[(guild_id, member_id, channel_id)]}},
+                                  upsert=True)
+                        for guild_id, member_id, channel_id in totals_keys], ordered=False)
+                stage = 'daily'
+                daily_keys = [key for key, amount in daily_inc.items() if amount != 0]
+                if len(daily_keys) > 0:
+                    self._daily.bulk_write([
+                        UpdateOne(filter=dict(guild_id=guild_id, channel_id=channel_id, member_id=member_id, day=day),
+                                  update={"$inc": {'karma': daily_inc[(guild_id, channel_id, member_id, day)]}},
+                                  upsert=True)
+                        for guild_id, channel_id, member_id, day in daily_keys], ordered=False)
+            except Exception as e:
+                self.metrics.incr('failed_flushes')
+                log.error(f'Flushing {len(documents)} buffered karma gains failed while writing {stage}, '
+                          f'retrying with the next flush: {e}')
+                if stage == 'karma':
+                    # some documents might be written already, a removal before the retry has to delete them
+                    self._unconfirmed.update(documents.keys())
+                    self._merge(documents, totals_inc, daily_inc, oldest)
+                elif stage == 'totals':
+                    self._merge({}, {key: totals_inc[key] for key in self._failed_operations(e, totals_keys)},
+                                daily_inc, oldest)
+                else:
+                    self._merge({}, {}, {key: daily_inc[key] for key in self._failed_operations(e, daily_keys)},
+                                oldest)
+                raise
+
+            self.metrics.incr('flushes')
+            self.metrics.observe('flush_size', len(documents))
+            self.metrics.observe('flush_seconds', time.perf_counter() - start)
+            self.metrics.observe('pending_seconds', time.perf_counter() - oldest)
+            log.debug(f'Flushed {len(documents)} buffered karma gains')
+            return len(documents)
+
+    def _has_increments(self) -> bool:
+        return any(amount != 0 for amount in self._totals_inc.values()) or \
+            any(amount != 0 for amount in self._daily_inc.values())
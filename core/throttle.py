@@ -0,0 +1,132 @@
+import time
+from typing import Dict, Tuple, List
+
+from core.metrics import metrics
+
+
+class TokenBucket:
+    # tokens refill continuously at rate per second up to burst, every karma event takes one
+    __slots__ = ['tokens', 'updated']
+
+    def __init__(self, burst: float, now: float):
+        self.tokens = burst
+        self.updated = now
+
+    def refill(self, rate: float, burst: float, now: float) -> float:
+        """
+        add the tokens that refilled since the last update
+        :param rate: tokens per second
+        :param burst: maximum amount of tokens
+        :param now: time.monotonic()
+        :return: tokens available now
+        """
+        self.tokens = min(burst, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        return self.tokens
+
+
+class KarmaThrottle:
+    # per guild and per giver token buckets, checked before a karma message causes any database or discord work.
+    # a rate of 0 disables the bucket. buckets that refilled completely are pruned, they equal a new bucket.
+    def __init__(self, prune_interval: float = 60):
+        self.prune_interval = prune_interval
+        self._guilds: Dict[int, TokenBucket] = {}
+        self._givers: Dict[Tuple[int, int], TokenBucket] = {}
+        # guild_id -> (time of the last notice, events dropped since then)
+        self._notices: Dict[int, Tuple[float, int]] = {}
+        self._pruned = time.monotonic()
+        self.metrics = metrics('throttle')
+
+    def allow(self, guild_id: int, giver_id: int, guild_rate: float, guild_burst: float, giver_rate: float,
+              giver_burst: float) -> bool:
+        """
+        take a token from the bucket of the guild and of the giver, if both have one.
+        :param guild_id: id of the guild of the karma message
+        :param giver_id: id of the author of the karma message
+        :param guild_rate: karma messages per second a guild refills
+        :param guild_burst: karma messages a guild can send at once
+        :param giver_rate: karma messages per second a giver refills
+        :param giver_burst: karma messages a giver can send at once
+        :return: True if the karma message can be processed, False if it has to be dropped
+        """
+        now = time.monotonic()
+        if now - self._pruned > self.prune_interval:
+            self.prune(guild_rate, guild_burst, giver_rate, giver_burst, now)
+        buckets = []  # (scope, bucket)
+        if guild_rate > 0:
+            buckets.append(('guild', self._bucket(self._guilds, guild_id, guild_rate, guild_burst, now)))
+        if giver_rate > 0:
+            buckets.append(('giver', self._bucket(self._givers, (guild_id, giver_id), giver_rate, giver_burst, now)))
+        # a dropped event doesn't take a token from the other bucket
+        for scope, bucket in buckets:
+            if bucket.tokens < 1:
+                self.metrics.incr(f'{scope}_throttled')
+                self._drop(guild_id)
+                return False
+        for _, bucket in buckets:
+            bucket.tokens -= 1
+        self.metrics.incr('allowed')
+        return True
+
+    @staticmethod
+    def _bucket(buckets: dict, key, rate: float, burst: float, now: float) -> TokenBucket:
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = TokenBucket(burst, now)
+        else:
+            bucket.refill(rate, burst, now)
+        return bucket
+
+    def _drop(self, guild_id: int) -> None:
+        noticed, dropped = self._notices.get(guild_id, (0, 0))
+        self._notices[guild_id] = (noticed, dropped + 1)
+
+    def notice(self, guild_id: int, interval: float) -> int:
+        """
+        collect the dropped karma messages of a guild for a single notice, at most one notice per interval.
+        :param guild_id: id of the guild
+        :param interval: seconds between two notices of a guild
+        :return: amount of messages dropped since the last notice, 0 if the guild can't be noticed yet
+        """
+        now = time.monotonic()
+        noticed, dropped = self._notices.get(guild_id, (0, 0))
+        if dropped == 0 or (noticed != 0 and now - noticed < interval):
+            return 0
+        self._notices[guild_id] = (now, 0)
+        self.metrics.incr('notices')
+        return dropped
+
+    def due_notices(self, interval: float) -> List[Tuple[int, int]]:
+        """
+        collect the notices of every guild with dropped karma messages that can be noticed again,
+        so drops at the end of a burst are reported without waiting for another drop.
+        :param interval: seconds between two notices of a guild
+        :return: guild_id and amount of messages dropped since its last notice
+        """
+        due = []
+        for guild_id in [guild_id for guild_id, (_, dropped) in self._notices.items() if dropped != 0]:
+            dropped = self.notice(guild_id, interval)
+            if dropped != 0:
+                due.append((guild_id, dropped))
+        return due
+
+    def prune(self, guild_rate: float, guild_burst: float, giver_rate: float, giver_burst: float,
+              now: float = None) -> int:
+        """
+        remove the buckets that refilled completely and old notices without dropped messages
+        :return: amount of buckets removed
+        """
+        now = time.monotonic() if now is None else now
+        self._pruned = now
+        removed = 0
+        for buckets, rate, burst in [(self._guilds, guild_rate, guild_burst), (self._givers, giver_rate, giver_burst)]:
+            # buckets of a disabled scope are never used again
+            full = [key for key, bucket in buckets.items() if rate <= 0 or bucket.refill(rate, burst, now) >= burst]
+            for key in full:
+                del buckets[key]
+            removed += len(full)
+        for guild_id in [guild_id for guild_id, (noticed, dropped) in self._notices.items()
+                         if dropped == 0 and now - noticed > self.prune_interval]:
+            del self._notices[guild_id]
+        self.metrics.set('buckets', len(self._guilds) + len(self._givers))
+        return removed
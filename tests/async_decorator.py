@@ -3,9 +3,11 @@ import asyncio
 
 def async_test(f):
     def wrapper(*args, **kwargs):
-        coro = asyncio.coroutine(f)
-        future = coro(*args, **kwargs)
-        loop = asyncio.get_event_loop()
-        loop.run_until_complete(future)
+        future = f(*args, **kwargs)
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(future)
+        finally:
+            loop.close()
 
     return wrapper
@@ -0,0 +1,38 @@
+import threading
+import unittest
+
+import mongomock
+
+from core.model.member import KarmaMember, Member
+from core.service.async_service import AsyncKarmaMemberService, AsyncBlockerService
+from core.service.mongo_service import KarmaMemberService, BlockerService
+from tests.async_decorator import async_test
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+# Verify that the async services run the blocking calls off the event loop thread
+class AsyncServices(unittest.TestCase):
+
+    def setUp(self):
+        database = mongomock.MongoClient().db
+        self.karma_service = AsyncKarmaMemberService(KarmaMemberService(database.karma))
+        self.blocker_service = AsyncBlockerService(BlockerService(database.blacklist))
+
+    @async_test
+    async def test_karma_service_awaitable(self):
+        await self.karma_service.upsert_karma_member(KarmaMember('1', '1', '1', '1'))
+        assert await self.karma_service.aggregate_member_by_karma(KarmaMember('1', '1')) == 1
+        # cursors are returned as lists that were read on the executor
+        channels = await self.karma_service.aggregate_member_by_channels(KarmaMember('1', '1'))
+        assert isinstance(channels, list) and channels[0]['karma'] == 1
+        assert await self.karma_service.find_message('1') is not None
+
+    @async_test
+    async def test_blocking_call_on_executor_thread(self):
+        event_loop_thread = threading.get_ident()
+        assert await self.blocker_service.run(threading.get_ident) != event_loop_thread
+        await self.blocker_service.blacklist(Member('1', '1'))
+        assert await self.blocker_service.find_member(Member('1', '1')) is not None
+        assert len(await self.blocker_service.find_all_blacklisted('1')) == 1
@@ -1,4 +1,5 @@
 import unittest
+from unittest import mock
 
 import mongomock
 
@@ -35,3 +36,46 @@ class MemberIsWhiteListed(unittest.TestCase):
         assert self.blocker_service.find_member(self.member) is not None
         self.blocker_service.whitelist(self.member)
         assert self.blocker_service.find_member(self.member) is None
+
+
+# Verify that the blacklist cache is loaded lazily and written through
+class BlacklistCache(unittest.TestCase):
+
+    def setUp(self):
+        self.blacklisted = mongomock.MongoClient().db.blacklist
+        self.blacklisted.insert_one(dict(guild_id='1', member_id='1'))
+        self.blocker_service = BlockerService(self.blacklisted)
+
+    def test_cache_loaded_on_first_use(self):
+        assert not self.blocker_service.is_loaded('1')
+        assert self.blocker_service.find_member(Member('1', '1')) is not None
+        assert self.blocker_service.is_loaded('1')
+        # served from the cache without touching the database again
+        self.blacklisted.delete_many({})
+        assert self.blocker_service.find_member(Member('1', '1')) is not None
+
+    def test_cache_written_through(self):
+        self.blocker_service.find_member(Member('1', '1'))
+        self.blocker_service.blacklist(Member('1', '2'))
+        self.blocker_service.whitelist(Member('1', '1'))
+        assert self.blocker_service.find_member(Member('1', '1')) is None
+        assert [doc['member_id'] for doc in self.blocker_service.find_all_blacklisted('1')] == ['2']
+        assert [doc['member_id'] for doc in self.blacklisted.find()] == ['2']
+
+    def test_lookup_does_not_wait_for_writes(self):
+        self.blocker_service.find_member(Member('1', '1'))
+        # a write holds the lock during its database round trip, lookups of cached guilds don't take it
+        with self.blocker_service._lock:
+            assert self.blocker_service.find_member(Member('1', '1')) is not None
+            assert [doc['member_id'] for doc in self.blocker_service.find_all_blacklisted('1')] == ['1']
+
+    def test_import_writes_without_lock(self):
+        self.blocker_service.find_member(Member('1', '1'))
+        bulk_write = self.blacklisted.bulk_write
+
+        def unlocked_bulk_write(*args, **kwargs):
+            assert not self.blocker_service._lock.locked()
+            return bulk_write(*args, **kwargs)
+        with mock.patch.object(self.blacklisted, 'bulk_write', side_effect=unlocked_bulk_write):
+            assert self.blocker_service.import_blacklist([dict(guild_id='1', member_id='3')]) == 1
+        assert self.blocker_service.find_member(Member('1', '3')) is not None
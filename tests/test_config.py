@@ -0,0 +1,98 @@
+import os
+import tempfile
+import unittest
+from copy import deepcopy
+
+import yaml
+
+from core.config_watcher import ConfigWatcher
+from util.config import apply_config, build_settings, config, settings
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+# Verify that the configuration is parsed into a typed snapshot once and replaced as a whole
+class Settings(unittest.TestCase):
+
+    def setUp(self):
+        previous = deepcopy(config)
+        self.addCleanup(apply_config, previous)
+
+    def changed(self, section: str, key: str, value) -> dict:
+        new_config = deepcopy(config)
+        new_config[section][key] = value
+        return new_config
+
+    def test_values_typed(self):
+        snapshot = build_settings(self.changed('karma', 'time_emote', 'False'))
+        assert snapshot.karma.time_emote is False
+        assert isinstance(snapshot.cooldown, int) and isinstance(snapshot.throttle.guild_rate, float)
+        assert build_settings(self.changed('karma', 'time_emote', 'true')).karma.time_emote is True
+        assert build_settings(self.changed('channel', 'log', '12')).log_channel == 12
+
+    def test_invalid_value_keeps_snapshot(self):
+        current = settings()
+        for section, key, value in [('karma', 'emote', 'yes'), ('profile', 'channels', 'five'),
+                                    ('throttle', 'guild_rate', '-1')]:
+            with self.assertRaises(ValueError):
+                apply_config(self.changed(section, key, value))
+            assert settings() is current
+        assert config['karma']['emote'] != 'yes'
+
+    def test_snapshot_swapped(self):
+        current = settings()
+        apply_config(self.changed('karma', 'keywords', 'cheers'))
+        assert settings() is not current and current.karma.keywords != 'cheers'
+        assert settings().karma.matcher.matches('cheers mate')
+        assert config['karma']['keywords'] == 'cheers'
+
+    def test_missing_throttle_disables_limits(self):
+        new_config = deepcopy(config)
+        new_config.pop('throttle', None)
+        limits = build_settings(new_config).throttle
+        assert limits.guild_rate == 0 and limits.giver_rate == 0
+
+
+# Verify that changes of the configuration file are applied and invalid files are ignored
+class Watcher(unittest.TestCase):
+
+    def setUp(self):
+        previous = deepcopy(config)
+        self.addCleanup(apply_config, previous)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'config.yaml')
+        self.write(config, 1000)
+        self.watcher = ConfigWatcher(self.path)
+        self.watcher._mtime = os.stat(self.path).st_mtime
+
+    def write(self, content, mtime: int) -> None:
+        with open(self.path, 'w') as stream:
+            if isinstance(content, str):
+                stream.write(content)
+            else:
+                yaml.safe_dump(content, stream)
+        os.utime(self.path, (mtime, mtime))
+
+    def test_unchanged_file_not_reloaded(self):
+        assert not self.watcher.check()
+
+    def test_changed_file_reloaded(self):
+        new_config = deepcopy(config)
+        new_config['cooldown'] = '42'
+        self.write(new_config, 2000)
+        assert self.watcher.check()
+        assert settings().cooldown == 42
+        assert not self.watcher.check()
+
+    def test_invalid_file_ignored(self):
+        current = settings()
+        self.write('karma: [', 2000)
+        assert not self.watcher.check()
+        new_config = deepcopy(config)
+        new_config['leaderboard'] = 'ten'
+        self.write(new_config, 3000)
+        assert not self.watcher.check()
+        assert settings() is current
+        assert self.watcher.metrics.snapshot()['rejected'] >= 2
@@ -0,0 +1,126 @@
+import datetime
+import unittest
+from unittest import mock
+
+import mongomock
+
+from core.cooldown import KarmaCooldowns, clock_skew
+from core.index import ensure_indexes
+from core.service.async_service import AsyncService
+from core.service.cooldown_store import CooldownStore
+from tests.async_decorator import async_test
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+# Verify that cooldowns expire on lookup and through the sweep without leaving empty maps behind
+class Cooldowns(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 100.0
+        patcher = mock.patch('core.cooldown.time.monotonic', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cooldowns = KarmaCooldowns()
+
+    def test_pair_expires_on_lookup(self):
+        self.cooldowns.put(1, 2, 3, 5)
+        assert self.cooldowns.is_on_cooldown(1, 2, 3)
+        assert not self.cooldowns.is_on_cooldown(1, 3, 2)
+        self.now += 5
+        assert not self.cooldowns.is_on_cooldown(1, 2, 3)
+        assert self.cooldowns._expiries == {}
+
+    def test_sweep_removes_expired_pairs_in_order(self):
+        self.cooldowns.put(1, 2, 3, 5)
+        self.cooldowns.put(1, 2, 4, 10)
+        self.cooldowns.put(2, 2, 3, 20)
+        self.now += 10
+        assert self.cooldowns.sweep() == 2
+        assert len(self.cooldowns) == 1
+        assert list(self.cooldowns._expiries) == [2]
+        assert self.cooldowns.is_on_cooldown(2, 2, 3)
+
+    def test_cancel_and_renew(self):
+        self.cooldowns.put(1, 2, 3, 5)
+        assert self.cooldowns.cancel(1, 2, 3)
+        assert not self.cooldowns.cancel(1, 2, 3)
+        assert not self.cooldowns.is_on_cooldown(1, 2, 3)
+        # the heap entry of the cancelled cooldown must not end the renewed one
+        self.cooldowns.put(1, 2, 3, 5)
+        self.now += 2
+        self.cooldowns.put(1, 2, 3, 5)
+        self.now += 4
+        assert self.cooldowns.sweep() == 0
+        assert self.cooldowns.is_on_cooldown(1, 2, 3)
+        self.now += 1
+        assert self.cooldowns.sweep() == 1
+        assert self.cooldowns._heap == []
+
+
+# Verify that cooldowns in the store are shared by processes and checks only read the store once per guild
+class StoredCooldowns(unittest.TestCase):
+
+    def setUp(self):
+        self.collection = mongomock.MongoClient().db.cooldowns
+        self.store = CooldownStore(self.collection)
+        # two processes sharing the collection
+        self.cooldowns = KarmaCooldowns(store=AsyncService(self.store))
+        self.other = KarmaCooldowns(store=AsyncService(self.store))
+
+    @async_test
+    async def test_cooldown_seen_by_other_process(self):
+        await self.cooldowns.start(1, 2, 3, 30)
+        assert self.collection.count_documents({}) == 1
+        assert await self.other.check(1, 2, 3)
+        # answered from the local cache afterwards
+        with mock.patch.object(self.store, 'find_guilds') as find_guilds:
+            assert await self.other.check(1, 2, 3)
+            assert not await self.other.check(1, 2, 4)
+        find_guilds.assert_not_called()
+        await self.cooldowns.end(1, 2, 3)
+        assert self.collection.count_documents({}) == 0
+        assert not await self.cooldowns.check(1, 2, 3)
+
+    @async_test
+    async def test_guild_loaded_once_and_refreshed(self):
+        assert not await self.other.check(1, 2, 3)
+        await self.cooldowns.start(1, 2, 3, 30)
+        await self.cooldowns.start(5, 2, 3, 30)
+        # the guild is loaded, the new cooldown is seen with the next refresh
+        with mock.patch.object(self.store, 'find_guilds') as find_guilds:
+            assert not await self.other.check(1, 2, 3)
+        find_guilds.assert_not_called()
+        assert await self.other.refresh() == 1
+        assert await self.other.check(1, 2, 3)
+        assert self.other.metrics.counter('store_reads') >= 2
+
+    def test_expired_cooldown_is_not_found(self):
+        self.store.put(1, 2, 3, -1)
+        assert self.store.find_guilds([1]) == []
+        self.store.put(1, 2, 3, 30)
+        [(guild_id, giver_id, receiver_id, expires)] = self.store.find_guilds([1])
+        assert (guild_id, giver_id, receiver_id) == (1, 2, 3)
+        assert expires > datetime.datetime.utcnow()
+
+    @async_test
+    async def test_refresh_reads_only_new_cooldowns(self):
+        await self.cooldowns.start(1, 2, 3, 30)
+        assert await self.other.check(1, 2, 3)
+        assert await self.other.refresh() == 1
+        heap = len(self.other._heap)
+        # the cooldown read again doesn't grow the heap
+        assert await self.other.refresh() == 1
+        assert len(self.other._heap) == heap
+        # cooldowns put before the previous refresh, minus the clock skew, aren't read again
+        put = datetime.datetime.utcnow() - datetime.timedelta(seconds=clock_skew + 1)
+        self.collection.update_one({'_id': '1:2:3'}, {'$set': {'updated': put}})
+        assert await self.other.refresh() == 0
+        await self.cooldowns.start(1, 2, 4, 30)
+        assert await self.other.refresh() == 1
+        assert await self.other.check(1, 2, 4)
+
+    def test_ttl_index_created(self):
+        assert ensure_indexes(self.collection) == []
+        assert self.collection.index_information()['expires']['expireAfterSeconds'] == 0
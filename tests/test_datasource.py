@@ -0,0 +1,31 @@
+import unittest
+from unittest import mock
+
+import mongomock
+
+from core import datasource
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+# Verify that the mongo client is shared, created lazily and configured from the database configuration
+class SharedClient(unittest.TestCase):
+
+    def tearDown(self):
+        datasource.close()
+
+    def test_pool_options(self):
+        options = datasource.client_options(dict(connection=dict(host='mongo', port=27017),
+                                                 pool=dict(max_size=10, connect_timeout=500, compressors='zlib',
+                                                           socket_timeout=None)))
+        assert options == dict(host='mongo', port=27017, maxPoolSize=10, connectTimeoutMS=500, compressors='zlib')
+        assert datasource.client_options(dict(connection=dict(host='mongo'))) == dict(host='mongo')
+
+    @mock.patch('core.datasource.MongoClient', mongomock.MongoClient)
+    def test_client_shared_and_closed(self):
+        datasource.close()
+        assert datasource._client is None
+        assert datasource.karma().database.client is datasource.blacklist().database.client
+        datasource.close()
+        assert datasource._client is None
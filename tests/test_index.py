@@ -0,0 +1,31 @@
+import unittest
+
+import mongomock
+
+from core.index import ensure_indexes, missing_indexes
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+# Verify that the expected indexes are created and missing ones are detected
+class IndexBootstrap(unittest.TestCase):
+
+    def setUp(self):
+        database = mongomock.MongoClient().db
+        self.karma = database.karma
+        self.karma_totals = database.karma_totals
+        self.karma_daily = database.karma_daily
+        self.blacklist = database.blacklist
+
+    def test_indexes_created(self):
+        assert len(missing_indexes(self.karma, self.karma_totals, self.karma_daily, self.blacklist)) == 11
+        assert ensure_indexes(self.karma, self.karma_totals, self.karma_daily, self.blacklist) == []
+        assert missing_indexes(self.karma, self.karma_totals, self.karma_daily, self.blacklist) == []
+        # running it again does not fail on the existing indexes
+        assert ensure_indexes(self.karma, self.karma_totals, self.karma_daily, self.blacklist) == []
+
+    def test_missing_index_detected(self):
+        ensure_indexes(self.karma, self.karma_totals, self.karma_daily, self.blacklist)
+        self.karma.drop_index('message')
+        assert missing_indexes(self.karma, self.karma_totals, self.karma_daily, self.blacklist) == ['karma.message']
@@ -1,4 +1,6 @@
+import datetime
 import unittest
+from copy import deepcopy
 from unittest import mock
 
 import mongomock
@@ -6,7 +8,8 @@ import mongomock
 from cogs.karma.producer import KarmaProducer
 from core.model.member import KarmaMember
 from core.service.mongo_service import KarmaMemberService
-from core.service.validation_service import contains_valid_thanks
+from core.service.validation_service import contains_valid_thanks, ThanksMatcher, thanks_matcher
+from util.config import config, apply_config
 from tests.async_decorator import async_test
 
 if __name__ == '__main__':
@@ -32,6 +35,129 @@ class KarmaChange(unittest.TestCase):
         assert self.karma_service.aggregate_member_by_karma(self.karma_member) is None
 
 
+# Verify that the karma totals follow every karma change and match the karma documents
+class KarmaTotals(unittest.TestCase):
+
+    def setUp(self):
+        database = mongomock.MongoClient().db
+        self.karma_storage = database.karma
+        self.karma_totals = database.karma_totals
+        self.karma_daily = database.karma_daily
+        self.karma_service = KarmaMemberService(self.karma_storage, self.karma_totals, self.karma_daily)
+
+    def test_totals_follow_gain_and_removal(self):
+        for message_id, channel_id in enumerate(['1', '1', '2']):
+            self.karma_service.upsert_karma_member(KarmaMember('1', '1', channel_id, message_id))
+        self.karma_service.upsert_karma_member(KarmaMember('1', '2', '2', 10))
+        assert self.karma_service.aggregate_member_by_karma(KarmaMember('1', '1')) == 3
+        assert [(doc['_id']['channel_id'], doc['karma'])
+                for doc in self.karma_service.aggregate_member_by_channels(KarmaMember('1', '1'))] == \
+            [('1', 2), ('2', 1)]
+        assert sorted((doc['_id']['member_id'], doc['karma'])
+                      for doc in self.karma_service.aggregate_top_karma_members('1', '2')) == [('1', 1), ('2', 1)]
+
+        self.karma_service.delete_single_karma(KarmaMember('1', '1', '2', 2))
+        # deleting twice must not decrement the totals twice
+        self.karma_service.delete_single_karma(KarmaMember('1', '1', '2', 2))
+        assert self.karma_service.aggregate_member_by_karma(KarmaMember('1', '1')) == 2
+        assert [doc['_id']['member_id'] for doc in self.karma_service.aggregate_top_karma_members('1', '2')] == ['2']
+
+        self.karma_service.delete_all_karma(KarmaMember('1', '1'))
+        assert self.karma_service.aggregate_member_by_karma(KarmaMember('1', '1')) is None
+        assert [doc['_id']['member_id'] for doc in self.karma_service.aggregate_top_karma_members('1')] == ['2']
+
+    def test_message_karma_removed_at_once(self):
+        for member_id, channel_id in [('1', '1'), ('2', '1')]:
+            self.karma_service.upsert_karma_member(KarmaMember('1', member_id, channel_id, 7))
+        self.karma_service.upsert_karma_member(KarmaMember('1', '1', '1', 8))
+        self.karma_service.upsert_karma_member(KarmaMember('2', '1', '1', 7))
+        assert sorted(self.karma_service.delete_message_karma('1', '7')) == ['1', '2']
+        assert self.karma_service.delete_message_karma('1', '7') == []
+        assert self.karma_service.aggregate_members_by_karma('1', ['1', '2']) == {'1': 1, '2': 0}
+        assert self.karma_storage.count_documents(dict(message_id='7')) == 1
+        # the totals and daily buckets of the second member are empty and removed
+        assert self.karma_totals.count_documents(dict(guild_id='1', member_id='2')) == 0
+        assert self.karma_daily.count_documents(dict(guild_id='1', member_id='2')) == 0
+
+    def test_concurrent_message_removal_decrements_once(self):
+        for member_id in ['1', '2']:
+            self.karma_service.upsert_karma_member(KarmaMember('1', member_id, '1', 7))
+        self.karma_service.upsert_karma_member(KarmaMember('1', '1', '1', 8))
+        find, removed = self.karma_storage.find, {}
+
+        def find_then_remove(*args, **kwargs):
+            documents = list(find(*args, **kwargs))
+            if 'members' not in removed:
+                # another removal of the message deletes the documents after they were found
+                removed['members'] = []
+                removed['members'] = self.karma_service.delete_message_karma('1', '7')
+            return iter(documents)
+
+        with mock.patch.object(self.karma_storage, 'find', side_effect=find_then_remove):
+            assert self.karma_service.delete_message_karma('1', '7') == []
+        assert sorted(removed['members']) == ['1', '2']
+        assert self.karma_service.aggregate_members_by_karma('1', ['1', '2']) == {'1': 1, '2': 0}
+        assert [(doc['member_id'], doc['karma']) for doc in self.karma_totals.find(dict(guild_id='1'))] == \
+            [('1', 1), ('1', 1)]
+
+    def test_karma_of_several_members(self):
+        for message_id, member_id in enumerate(['1', '1', '2']):
+            self.karma_service.upsert_karma_member(KarmaMember('1', member_id, '1', message_id))
+        self.karma_service.upsert_karma_member(KarmaMember('2', '3', '1', 5))
+        assert self.karma_service.aggregate_members_by_karma('1', ['1', 2, '3']) == {'1': 2, '2': 1, '3': 0}
+
+    def test_profile_in_single_query(self):
+        for message_id, channel_id in enumerate(['1', '1', '2', '3']):
+            self.karma_service.upsert_karma_member(KarmaMember('1', '1', channel_id, message_id))
+        member_profile = self.karma_service.aggregate_member_profile(KarmaMember('1', '1'), channels=2)
+        assert member_profile['karma'] == 4
+        assert [(doc['_id']['channel_id'], doc['karma']) for doc in member_profile['channels']][0] == ('1', 2)
+        assert len(member_profile['channels']) == 2
+        assert self.karma_service.aggregate_member_profile(KarmaMember('1', '1'), channels=0)['channels'] == []
+        assert self.karma_service.aggregate_member_profile(KarmaMember('1', '2')) == dict(karma=0, channels=[])
+
+    def test_totals_rebuilt_from_karma(self):
+        for message_id, channel_id in enumerate(['1', '1', '2']):
+            self.karma_service.upsert_karma_member(KarmaMember('1', '1', channel_id, message_id))
+        expected = list(self.karma_totals.find(projection=dict(_id=False)))
+        assert self.karma_service.rebuild_karma_totals() == 3
+        rebuilt = list(self.karma_totals.find(projection=dict(_id=False)))
+
+        def key(doc):
+            return doc['channel_id']
+
+        assert sorted(rebuilt, key=key) == sorted(expected, key=key)
+
+    def test_daily_buckets_follow_gain_and_removal(self):
+        now = datetime.datetime.utcnow()
+        for message_id, days in enumerate([0, 0, 3, 10]):
+            member = KarmaMember('1', '1', '1', message_id)
+            member.created_date = now - datetime.timedelta(days=days)
+            self.karma_service.upsert_karma_member(member)
+        assert self.karma_daily.count_documents({}) == 3
+
+        def top_karma(time_span):
+            return [doc['karma'] for doc in self.karma_service.aggregate_top_karma_members('1', '1', time_span)]
+
+        assert top_karma(1) == [2]
+        assert top_karma(4) == [3]
+        assert top_karma(30) == [4]
+
+        self.karma_service.delete_single_karma(KarmaMember('1', '1', '1', 3))
+        assert top_karma(30) == [3]
+        # the empty bucket of the removed karma is gone
+        assert self.karma_daily.count_documents({}) == 2
+
+        expected = list(self.karma_daily.find(projection=dict(_id=False)))
+        assert self.karma_service.rebuild_daily_karma() == 2
+        rebuilt = list(self.karma_daily.find(projection=dict(_id=False)))
+
+        def key(doc):
+            return doc['day']
+
+        assert sorted(rebuilt, key=key) == sorted(expected, key=key)
+
+
 # Verify that karma messages are identified correctly
 class KarmaGiving(unittest.TestCase):
     karma_producer = KarmaProducer(mock.MagicMock(), mock.MagicMock(), mock.MagicMock())
@@ -52,4 +178,32 @@ class KarmaGiving(unittest.TestCase):
         assert await contains_valid_thanks(self.dummy_correct_message_content)
         assert await contains_valid_thanks(self.dummy_correct_message_content_2)
         assert await contains_valid_thanks(self.dummy_correct_message_content_3)
-        assert await contains_valid_thanks(self.dummy_correct_message_content_4)
\ No newline at end of file
+        assert await contains_valid_thanks(self.dummy_correct_message_content_4)
+
+    @async_test
+    async def test_exclusions_apply_per_keyword(self):
+        assert await contains_valid_thanks('"thanks" was not meant for you, ty though')
+        assert await contains_valid_thanks('> quoted reply\nthanks for that')
+        assert not await contains_valid_thanks('thanks for nothing\n> thanks obama')
+        assert not await contains_valid_thanks('shifty tyrant')
+
+
+# Verify that the keyword matcher is only rebuilt on configuration changes
+class KeywordMatcher(unittest.TestCase):
+
+    def test_matcher_rebuilt_on_keyword_change(self):
+        previous = deepcopy(config)
+        matcher = thanks_matcher()
+        assert thanks_matcher() is matcher
+        try:
+            new_config = deepcopy(config)
+            new_config['karma']['keywords'] = 'cheers'
+            apply_config(new_config)
+            assert thanks_matcher() is not matcher
+            assert thanks_matcher().matches('cheers mate')
+            assert not thanks_matcher().matches('thanks mate')
+        finally:
+            apply_config(previous)
+
+    def test_empty_keywords_never_match(self):
+        assert not ThanksMatcher('').matches('thanks')
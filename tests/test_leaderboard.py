@@ -0,0 +1,125 @@
+import time
+import unittest
+from unittest import mock
+
+import mongomock
+
+from cogs.karma.leaderboard import KarmaLeaderboard
+from core.model.member import KarmaMember
+from core.service.async_service import AsyncKarmaMemberService, AsyncKarmaChannelService
+from core.service.channel_cache import KarmaChannelCache
+from core.service.mongo_service import KarmaMemberService, KarmaChannelService
+from tests.async_decorator import async_test
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+# Verify that leaderboard pages continue after the previous page and ranks are counted correctly
+class LeaderboardPages(unittest.TestCase):
+
+    def setUp(self):
+        database = mongomock.MongoClient().db
+        self.karma_service = KarmaMemberService(database.karma)
+        # member i has i karma, members 3 and 4 share their karma to test the tie break
+        message_id = 0
+        for member_id, karma in [('1', 1), ('2', 2), ('3', 4), ('4', 4), ('5', 5), ('6', 6), ('7', 7)]:
+            for _ in range(karma):
+                self.karma_service.upsert_karma_member(KarmaMember('1', member_id, '1', message_id))
+                message_id += 1
+        self.karma_leaderboard = KarmaLeaderboard(mock.MagicMock(), AsyncKarmaMemberService(self.karma_service),
+                                                  mock.MagicMock())
+
+    def test_pages_continue_after_previous_page(self):
+        members = []
+        after = None
+        while True:
+            page = list(self.karma_service.aggregate_karma_page('1', after=after, size=3))
+            if len(page) == 0:
+                break
+            members += [doc['_id']['member_id'] for doc in page]
+            after = (page[-1]['karma'], page[-1]['_id']['member_id'])
+        assert members == ['7', '6', '5', '3', '4', '2', '1']
+        assert [doc['_id'] for doc in self.karma_service.aggregate_karma_page('1', '1', size=1)] == \
+            [dict(member_id='7', channel_id='1')]
+
+    def test_rank_counts_members_above(self):
+        assert self.karma_service.member_rank(KarmaMember('1', '7')) == (1, 7)
+        assert self.karma_service.member_rank(KarmaMember('1', '4')) == (4, 4)
+        assert self.karma_service.member_rank(KarmaMember('1', '3')) == (4, 4)
+        assert self.karma_service.member_rank(KarmaMember('1', '1', '1')) == (7, 1)
+        assert self.karma_service.member_rank(KarmaMember('1', '8')) is None
+
+    @async_test
+    async def test_page_reads_start_at_known_page(self):
+        pages = [await self.karma_leaderboard.leaderboard_page('1', '', page, 2) for page in [1, 2, 3, 4]]
+        assert [[doc['_id']['member_id'] for doc in page] for page in pages] == \
+               [['7', '6'], ['5', '3'], ['4', '2'], ['1']]
+        with mock.patch.object(self.karma_service, 'aggregate_karma_page',
+                               wraps=self.karma_service.aggregate_karma_page) as aggregate_karma_page:
+            await self.karma_leaderboard.leaderboard_page('1', '', 4, 2)
+        # page 4 starts after the last member of page 3, which is known from before
+        aggregate_karma_page.assert_called_once_with('1', '', (2, '2'), 2)
+
+    @async_test
+    async def test_unknown_page_not_read(self):
+        with mock.patch.object(self.karma_service, 'aggregate_karma_page',
+                               wraps=self.karma_service.aggregate_karma_page) as aggregate_karma_page:
+            assert await self.karma_leaderboard.leaderboard_page('1', '', 3, 2) is None
+            aggregate_karma_page.assert_not_called()
+        assert self.karma_leaderboard.reachable_page('1', '', 3, 2) == 1
+        await self.karma_leaderboard.leaderboard_page('1', '', 1, 2)
+        assert self.karma_leaderboard.reachable_page('1', '', 3, 2) == 2
+        # past the last page there is no start to continue from
+        assert await self.karma_leaderboard.leaderboard_page('1', '', 5, 2) is None
+
+
+# Verify that the top channels are cached until karma of the guild changes
+class ChannelLeaderboard(unittest.TestCase):
+
+    def setUp(self):
+        database = mongomock.MongoClient().db
+        self.channel_cache = KarmaChannelCache(ttl=60)
+        self.karma_service = KarmaMemberService(database.karma, channel_cache=self.channel_cache)
+        self.channel_service = KarmaChannelService(database.karma, channel_cache=self.channel_cache)
+        for message_id, channel_id in enumerate(['1', '1', '2']):
+            self.karma_service.upsert_karma_member(KarmaMember('1', '1', channel_id, message_id))
+
+    def top_channels(self, time_span=0):
+        return [(doc['_id']['channel_id'], doc['karma'])
+                for doc in self.channel_service.aggregate_top_karma_channels('1', time_span)]
+
+    def test_cached_until_karma_changes(self):
+        assert self.top_channels() == [('1', 2), ('2', 1)]
+        with mock.patch.object(self.channel_service, '_aggregate_top_karma_channels') as aggregate:
+            assert self.top_channels() == [('1', 2), ('2', 1)]
+        aggregate.assert_not_called()
+
+        self.karma_service.upsert_karma_member(KarmaMember('1', '2', '2', 3))
+        self.karma_service.upsert_karma_member(KarmaMember('1', '2', '2', 4))
+        assert self.top_channels() == [('2', 3), ('1', 2)]
+        self.karma_service.delete_message_karma('1', '4')
+        assert sorted(self.top_channels(7)) == [('1', 2), ('2', 2)]
+        # other guilds keep their cached channels
+        self.karma_service.upsert_karma_member(KarmaMember('2', '1', '1', 5))
+        assert self.channel_cache.get('1', 7) is not None
+
+    def test_expired_channels_aggregated_again(self):
+        self.channel_cache.ttl = 0
+        self.top_channels()
+        assert self.channel_cache.get('1', 0) is None
+
+    def test_aggregation_overtaken_by_change_not_cached(self):
+        started = time.monotonic()
+        self.channel_cache.put('3', 0, [], started)
+        assert self.channel_cache.get('3', 0) == []
+        # karma changed while the aggregation was running
+        self.channel_cache.invalidate('3')
+        self.channel_cache.put('3', 0, [], started)
+        assert self.channel_cache.get('3', 0) is None
+
+    @async_test
+    async def test_async_cached_without_executor(self):
+        channel_service = AsyncKarmaChannelService(self.channel_service, service_executor=None)
+        self.top_channels()
+        assert [doc['karma'] for doc in await channel_service.aggregate_top_karma_channels('1')] == [2, 1]
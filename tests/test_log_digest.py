@@ -0,0 +1,67 @@
+import asyncio
+import unittest
+from dataclasses import replace
+from unittest import mock
+
+from core.log_digest import KarmaLogDigest, digest_messages
+from tests.async_decorator import async_test
+from util.config import Settings, settings
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+# Verify that log lines are batched into as few messages as discord allows and flushed on close
+class LogDigest(unittest.TestCase):
+
+    def setUp(self):
+        self.channel = mock.MagicMock()
+        self.channel.send = mock.AsyncMock()
+        bot = mock.MagicMock()
+        bot.get_channel.return_value = self.channel
+        self.log_digest = KarmaLogDigest(bot)
+        patcher = mock.patch('core.log_digest.settings', side_effect=lambda: self.settings)
+        patcher.start()
+        self.settings: Settings = replace(settings(), log_channel=1)
+        self.addCleanup(patcher.stop)
+
+    def sent(self) -> list:
+        return [call.args[0] for call in self.channel.send.call_args_list]
+
+    def test_lines_joined_up_to_limit(self):
+        assert digest_messages(['a' * 10, 'b' * 10, 'c' * 10], limit=21) == ['a' * 10 + '\n' + 'b' * 10, 'c' * 10]
+        assert digest_messages(['a' * 30], limit=20) == ['a' * 17 + '...']
+        assert digest_messages([]) == []
+
+    @async_test
+    async def test_lines_sent_as_one_message(self):
+        for member in range(3):
+            self.log_digest.add(f'member {member} earned karma')
+        self.channel.send.assert_not_called()
+        assert await self.log_digest.flush() == 1
+        assert self.sent() == ['member 0 earned karma\nmember 1 earned karma\nmember 2 earned karma']
+        assert await self.log_digest.flush() == 0
+
+    @async_test
+    async def test_full_buffer_flushed_right_away(self):
+        for _ in range(25):
+            self.log_digest.add('x' * 99)
+        # one flush was scheduled by the add that reached the threshold, it sends every buffered line
+        await asyncio.sleep(0)
+        assert len(self.log_digest) == 0
+        assert len(self.sent()) == 2 and all(len(content) <= 2000 for content in self.sent())
+
+    @async_test
+    async def test_close_sends_buffered_lines(self):
+        await self.log_digest.start()
+        self.log_digest.add('karma was removed')
+        await self.log_digest.close()
+        assert self.sent() == ['karma was removed']
+
+    @async_test
+    async def test_lines_dropped_without_log_channel(self):
+        self.settings = replace(self.settings, log_channel=None)
+        self.log_digest.add('karma was removed')
+        assert await self.log_digest.flush() == 0
+        assert len(self.log_digest) == 0
+        self.channel.send.assert_not_called()
@@ -0,0 +1,49 @@
+import unittest
+
+import mongomock
+
+from core.model.member import KarmaMember
+from core.service.message_filter import KarmaMessageFilter
+from core.service.mongo_service import KarmaMemberService
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+# Verify that the message filter rules out messages that never gave out karma
+class MessageFilter(unittest.TestCase):
+
+    def setUp(self):
+        self.karma = mongomock.MongoClient().db.karma
+        self.message_filter = KarmaMessageFilter(capacity=1000, error_rate=0.01)
+        self.karma_service = KarmaMemberService(self.karma, message_filter=self.message_filter)
+
+    def test_everything_possible_before_seeding(self):
+        assert self.message_filter.might_contain('1')
+
+    def test_seeded_from_collection(self):
+        self.karma.insert_one(dict(guild_id='1', member_id='1', channel_id='1', message_id='1', karma=1))
+        assert self.karma_service.seed_message_filter() == 1
+        assert self.message_filter.might_contain('1')
+        assert self.karma_service.find_message('1') is not None
+        assert self.karma_service.find_message('2') is None
+        snapshot = self.message_filter.metrics.snapshot()
+        assert snapshot['hits'] >= 1 and snapshot['misses'] >= 1
+
+    def test_updated_on_gain_and_removal(self):
+        self.karma_service.seed_message_filter()
+        self.karma_service.upsert_karma_member(KarmaMember('1', '1', '1', '5'))
+        self.karma_service.upsert_karma_member(KarmaMember('1', '2', '1', '5'))
+        assert self.message_filter.might_contain('5')
+        self.karma_service.delete_single_karma(KarmaMember('1', '1', '1', '5'))
+        # the second member still has karma from the message
+        assert self.message_filter.might_contain('5')
+        self.karma_service.delete_single_karma(KarmaMember('1', '2', '1', '5'))
+        assert not self.message_filter.might_contain('5')
+
+    def test_false_positive_rate(self):
+        for message_id in range(1000):
+            self.message_filter.add(str(message_id))
+        self.message_filter.ready = True
+        false_positives = sum(self.message_filter.might_contain(str(message_id)) for message_id in range(1000, 11000))
+        assert false_positives < 300
@@ -0,0 +1,72 @@
+import time
+import unittest
+from unittest import mock
+
+from core.outbound import OutboundQueue
+from tests.async_decorator import async_test
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+def message(message_id: int, channel_id: int = 1):
+    discord_message = mock.MagicMock()
+    discord_message.id = message_id
+    discord_message.channel.id = channel_id
+    discord_message.add_reaction = mock.AsyncMock()
+    discord_message.channel.send = mock.AsyncMock()
+    return discord_message
+
+
+# Verify that reactions and replies are sent in order per channel, deduplicated and paced
+class Outbound(unittest.TestCase):
+
+    def setUp(self):
+        self.outbound = OutboundQueue(routes={'reaction': (1000, 10), 'message': (1000, 10)})
+
+    @async_test
+    async def test_reactions_deduplicated(self):
+        karma_message = message(1)
+        for _ in range(3):
+            self.outbound.add_reaction(karma_message, 'a')
+        self.outbound.add_reaction(karma_message, 'b')
+        assert len(self.outbound) == 2
+        await self.outbound.join()
+        assert [call.args[0] for call in karma_message.add_reaction.call_args_list] == ['a', 'b']
+        # once sent, the reaction can be queued again
+        self.outbound.add_reaction(karma_message, 'a')
+        assert len(self.outbound) == 1
+        await self.outbound.close()
+
+    @async_test
+    async def test_actions_of_a_channel_keep_order(self):
+        karma_message = message(1)
+        self.outbound.send(karma_message.channel, 'first')
+        self.outbound.add_reaction(karma_message, 'a')
+        self.outbound.send(karma_message.channel, 'second')
+        await self.outbound.close()
+        assert [call.args[0] for call in karma_message.channel.send.call_args_list] == ['first', 'second']
+        snapshot = self.outbound.metrics.snapshot()
+        assert snapshot['depth'] == 0
+        assert snapshot['message_latency_ms_count'] >= 2
+
+    @async_test
+    async def test_failed_action_keeps_worker_running(self):
+        karma_message = message(1)
+        karma_message.add_reaction.side_effect = RuntimeError('missing permissions')
+        self.outbound.add_reaction(karma_message, 'a')
+        self.outbound.send(karma_message.channel, 'after')
+        await self.outbound.close()
+        karma_message.channel.send.assert_called_once_with('after')
+
+    @async_test
+    async def test_reactions_paced_per_channel(self):
+        outbound = OutboundQueue(routes={'reaction': (20, 1), 'message': (1000, 10)})
+        start = time.monotonic()
+        for message_id in range(3):
+            outbound.add_reaction(message(message_id), 'a')
+        # another channel has its own bucket
+        outbound.add_reaction(message(4, channel_id=2), 'a')
+        await outbound.close()
+        # the first reaction uses the burst, the other two wait 50ms each
+        assert time.monotonic() - start >= 0.09
@@ -0,0 +1,79 @@
+import datetime
+import unittest
+
+import mongomock
+
+from core.model.member import KarmaMember
+from core.service.mongo_service import KarmaMemberService, KarmaChannelService
+from util.config import config, profile
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+def old_member_pipeline(guild_id, member_id, channels=False):
+    group = {"member_id": "$member_id", "channel_id": "$channel_id"} if channels else {"member_id": "$member_id"}
+    pipeline = [{"$unwind": "$karma"}, {"$match": dict(member_id=member_id, guild_id=guild_id)},
+                {"$group": {"_id": group, "karma": {"$sum": "$karma"}}}]
+    if channels:
+        pipeline += [{"$sort": {"karma": -1}}, {"$limit": int(profile()['channels'])}]
+    return pipeline
+
+
+def old_top_pipeline(guild_id, channel_id='', time_span=0, group=None):
+    match = dict(guild_id=guild_id)
+    if group is None:
+        group = {"member_id": "$member_id"} if channel_id == '' \
+            else {"member_id": "$member_id", "channel_id": "$channel_id"}
+    if channel_id != '':
+        match['channel_id'] = channel_id
+    if time_span != 0:
+        match['created_date'] = {"$gt": datetime.datetime.utcnow() - datetime.timedelta(days=time_span)}
+    return [{"$unwind": "$karma"}, {"$match": match},
+            {"$group": {"_id": group, "karma": {"$sum": "$karma"}}},
+            {"$sort": {"karma": -1}}, {"$limit": int(config['leaderboard'])}]
+
+
+def normalized(documents):
+    return sorted((tuple(sorted(doc['_id'].items())), doc['karma']) for doc in documents)
+
+
+# Verify that the index friendly pipelines return the same results as the previous $unwind pipelines
+class PipelineRegression(unittest.TestCase):
+
+    def setUp(self):
+        self.karma = mongomock.MongoClient().db.karma
+        self.karma_service = KarmaMemberService(self.karma)
+        self.channel_service = KarmaChannelService(self.karma)
+        now = datetime.datetime.utcnow()
+        message_id = 0
+        # distinct karma totals per member so sorting is unambiguous
+        for guild_id in ['1', '2']:
+            for member_id in range(1, 6):
+                for count in range(member_id * 2):
+                    message_id += 1
+                    member = KarmaMember(guild_id, member_id, str(count % 3), message_id)
+                    member.created_date = now - datetime.timedelta(days=count * 2)
+                    self.karma_service.upsert_karma_member(member)
+
+    def test_member_pipelines(self):
+        for member_id in ['1', '3', '5', '9']:
+            member = KarmaMember('1', member_id)
+            old = list(self.karma.aggregate(old_member_pipeline('1', member_id)))
+            assert self.karma_service.aggregate_member_by_karma(member) == (old[0]['karma'] if old else None)
+            assert normalized(self.karma_service.aggregate_member_by_channels(member)) == \
+                normalized(self.karma.aggregate(old_member_pipeline('1', member_id, channels=True)))
+
+    def test_top_member_pipelines(self):
+        for channel_id in ['', '0', '2']:
+            for time_span in [0, 1, 5, 30]:
+                new = self.karma_service.aggregate_top_karma_members('1', channel_id, time_span)
+                old = self.karma.aggregate(old_top_pipeline('1', channel_id, time_span))
+                assert normalized(new) == normalized(old)
+
+    def test_top_channel_pipelines(self):
+        for time_span in [0, 3, 30]:
+            new = self.channel_service.aggregate_top_karma_channels('2', time_span)
+            old = self.karma.aggregate(old_top_pipeline('2', time_span=time_span,
+                                                        group={"channel_id": "$channel_id"}))
+            assert normalized(new) == normalized(old)
@@ -0,0 +1,86 @@
+import datetime
+import unittest
+from unittest import mock
+
+import mongomock
+
+from core.metrics import metrics
+from core.model.member import KarmaMember
+from core.service.mongo_service import KarmaMemberService
+from core.service.retention import KarmaRetention
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+# Verify that compacting old karma keeps every total and leaderboard answer
+class Retention(unittest.TestCase):
+
+    def setUp(self):
+        database = mongomock.MongoClient().db
+        self.karma = database.karma
+        self.karma_totals = database.karma_totals
+        self.karma_daily = database.karma_daily
+        self.retention = KarmaRetention(self.karma, days=30, batch_size=4, batches=2)
+        self.karma_service = KarmaMemberService(self.karma, self.karma_totals, self.karma_daily,
+                                                retention=self.retention)
+        now = datetime.datetime.utcnow()
+        # old karma of two members in two channels, spread over two days, and recent karma
+        for message_id, (member_id, channel_id, days) in enumerate([('1', '1', 40), ('1', '1', 40), ('1', '2', 40),
+                                                                    ('2', '1', 40), ('1', '1', 41), ('2', '1', 41),
+                                                                    ('2', '1', 41), ('1', '1', 2), ('2', '2', 0)]):
+            member = KarmaMember('1', member_id, channel_id, message_id)
+            member.created_date = now - datetime.timedelta(days=days)
+            self.karma_service.upsert_karma_member(member)
+
+    def answers(self):
+        return dict(totals=self.karma_service.aggregate_members_by_karma('1', ['1', '2']),
+                    channels=list(self.karma_service.aggregate_member_by_channels(KarmaMember('1', '1'))),
+                    top=[list(self.karma_service.aggregate_top_karma_members('1', channel_id, time_span))
+                         for channel_id in ['', '1'] for time_span in [0, 7, 60]])
+
+    def test_compaction_keeps_answers(self):
+        expected = self.answers()
+        reclaimed_before = metrics('retention').counter('documents_reclaimed')
+        removed, reclaimed = self.karma_service.retention.compact()
+        # seven old documents are folded into five summaries
+        assert removed == 2
+        assert reclaimed > 0
+        assert metrics('retention').counter('documents_reclaimed') - reclaimed_before == 2
+        assert self.retention.compact() == (0, 0)
+        assert self.karma.count_documents({}) == 7
+        assert self.answers() == expected
+
+        # rebuilding from the compacted karma documents gives the same totals and buckets
+        totals = sorted(self.karma_totals.find(projection=dict(_id=False)), key=lambda doc: sorted(doc.items()))
+        daily = sorted(self.karma_daily.find(projection=dict(_id=False)), key=lambda doc: sorted(doc.items()))
+        self.karma_service.rebuild_karma_totals()
+        self.karma_service.rebuild_daily_karma()
+        assert sorted(self.karma_totals.find(projection=dict(_id=False)), key=lambda doc: sorted(doc.items())) \
+            == totals
+        assert sorted(self.karma_daily.find(projection=dict(_id=False)), key=lambda doc: sorted(doc.items())) == daily
+
+    def test_runs_are_bounded(self):
+        self.retention.batches = 1
+        self.retention.compact()
+        assert self.karma.count_documents(dict(message_id='')) > 0
+        assert self.karma.count_documents(dict(message_id={"$ne": ''}, created_date={"$lt": self.retention.cutoff()})) \
+            == 3
+
+    def test_interrupted_batch_counted_once(self):
+        expected = self.answers()
+        with mock.patch.object(self.karma, 'delete_many', side_effect=RuntimeError('connection lost')), \
+                self.assertRaises(RuntimeError):
+            self.retention.compact()
+        # the next run finishes the batch without folding its karma into the summaries again
+        self.retention.compact()
+        assert self.karma.count_documents(dict(compaction={"$exists": True})) == 0
+        assert self.karma.count_documents(dict(compactions={"$exists": True, "$ne": []})) == 0
+        assert self.answers() == expected
+
+    def test_tagged_karma_not_removed(self):
+        self.retention.claim_batch(self.retention.cutoff())
+        tagged = self.karma.find_one(dict(compaction={"$exists": True}))
+        assert self.karma_service.delete_message_karma('1', tagged['message_id']) == []
+        self.retention.compact()
+        assert self.answers()['totals'] == {'1': 5, '2': 4}
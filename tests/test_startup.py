@@ -0,0 +1,50 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import mongomock
+
+import bot
+from core import datasource
+from core.service.async_service import AsyncKarmaMemberService, AsyncBlockerService, AsyncKarmaChannelService
+from core.service.mongo_service import KarmaMemberService, BlockerService, KarmaChannelService
+from util.constants import cog_map
+
+if __name__ == '__main__':
+    unittest.main()
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# Verify that importing the bot does no I/O and that the cogs only use the injected services
+class Startup(unittest.TestCase):
+
+    def test_import_without_config(self):
+        # a directory without config.yaml and resources, any read or connection on import fails
+        with tempfile.TemporaryDirectory() as directory:
+            result = subprocess.run([sys.executable, '-c',
+                                     'import bot, cogs.karma.producer, cogs.general.settings\n'
+                                     'from core import datasource\n'
+                                     'from util.config import config\n'
+                                     'assert datasource._client is None and config == {}'],
+                                    cwd=directory, env=dict(os.environ, PYTHONPATH=root),
+                                    stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        assert result.returncode == 0, result.stderr.decode()
+
+    def test_create_bot_with_injected_services(self):
+        datasource.close()
+        database = mongomock.MongoClient().db
+        karma_service = AsyncKarmaMemberService(KarmaMemberService(database.karma))
+        blocker_service = AsyncBlockerService(BlockerService(database.blacklist))
+        channel_service = AsyncKarmaChannelService(KarmaChannelService(database.karma))
+        client = bot.create_bot(karma_service, blocker_service, channel_service)
+        assert client.get_cog('KarmaProducer').karma_service is karma_service
+        assert client.get_cog('KarmaProducer').blocker_service is blocker_service
+        assert client.get_cog('KarmaLeaderboard').karma_service is karma_service
+        assert client.get_cog('KarmaLeaderboard').channel_service is channel_service
+        assert cog_map['KarmaProfile'] is client.get_cog('KarmaProfile')
+        assert 'PermissionManager' not in cog_map
+        # nothing touched the shared client
+        assert datasource._client is None
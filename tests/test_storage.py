@@ -0,0 +1,141 @@
+import datetime
+import threading
+import unittest
+
+import mongomock
+
+from core.model.member import KarmaMember, Member
+from core.service.channel_cache import KarmaChannelCache
+from core.service.memory_service import MemoryKarmaStore, MemoryKarmaMemberService, MemoryKarmaChannelService, \
+    MemoryBlockerService
+from core.service.mongo_service import KarmaMemberService, KarmaChannelService, BlockerService
+from core.service.sqlite_service import connect, SqliteKarmaMemberService, SqliteKarmaChannelService, \
+    SqliteBlockerService
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+def mongo_engine():
+    database = mongomock.MongoClient().db
+    channel_cache = KarmaChannelCache(ttl=60)
+    return (KarmaMemberService(database.karma, channel_cache=channel_cache), BlockerService(database.blacklist),
+            KarmaChannelService(database.karma, channel_cache=channel_cache))
+
+
+def memory_engine():
+    store, channel_cache = MemoryKarmaStore(), KarmaChannelCache(ttl=60)
+    return (MemoryKarmaMemberService(store, channel_cache), MemoryBlockerService(store),
+            MemoryKarmaChannelService(store, channel_cache))
+
+
+def sqlite_engine():
+    connection, lock, channel_cache = connect(':memory:'), threading.RLock(), KarmaChannelCache(ttl=60)
+    return (SqliteKarmaMemberService(connection, lock, channel_cache), SqliteBlockerService(connection, lock),
+            SqliteKarmaChannelService(connection, lock, channel_cache))
+
+
+def member_ids(documents) -> list:
+    return [(document['_id']['member_id'], document['karma']) for document in documents]
+
+
+# Behaviour every storage engine has to share, run once per engine by the test cases below
+class StorageBehaviour:
+    engine = None
+
+    def setUp(self):
+        self.karma_service, self.blocker_service, self.channel_service = type(self).engine()
+        # member 1: 3 karma in channel 1 and 1 in channel 2, member 2: 2 karma in channel 1, member 3: 1 karma
+        for message_id, (member_id, channel_id) in enumerate([('1', '1'), ('1', '1'), ('1', '1'), ('1', '2'),
+                                                              ('2', '1'), ('2', '1'), ('3', '2')]):
+            self.karma_service.upsert_karma_member(KarmaMember('1', member_id, channel_id, message_id))
+        # a second member gaining karma through message 6
+        self.karma_service.upsert_karma_member(KarmaMember('1', '4', '2', 6))
+        self.karma_service.upsert_karma_member(KarmaMember('2', '1', '1', 10))
+
+    def test_totals_follow_gains_and_removals(self):
+        assert self.karma_service.aggregate_member_by_karma(KarmaMember('1', '1')) == 4
+        assert self.karma_service.aggregate_members_by_karma('1', ['1', '2', '5']) == {'1': 4, '2': 2, '5': 0}
+        result = self.karma_service.delete_single_karma(KarmaMember('1', '1', '1', 0))
+        assert result.deleted_count == 1
+        assert self.karma_service.delete_single_karma(KarmaMember('1', '1', '1', 0)).deleted_count == 0
+        assert self.karma_service.aggregate_member_by_karma(KarmaMember('1', '1')) == 3
+        assert self.karma_service.aggregate_member_by_karma(KarmaMember('1', '5')) is None
+
+    def test_message_karma_is_removed(self):
+        assert self.karma_service.find_message('6')['message_id'] == '6'
+        assert sorted(self.karma_service.delete_message_karma('1', '6')) == ['3', '4']
+        assert self.karma_service.find_message('6') is None
+        assert self.karma_service.aggregate_member_by_karma(KarmaMember('1', '3')) is None
+        assert self.karma_service.member_rank(KarmaMember('1', '4')) is None
+
+    def test_all_karma_of_member_is_removed(self):
+        self.karma_service.delete_all_karma(KarmaMember('1', '1'))
+        assert self.karma_service.aggregate_member_by_karma(KarmaMember('1', '1')) is None
+        assert list(self.karma_service.aggregate_member_by_channels(KarmaMember('1', '1'))) == []
+        assert self.karma_service.aggregate_member_by_karma(KarmaMember('2', '1')) == 1
+
+    def test_leaderboards(self):
+        assert member_ids(self.karma_service.aggregate_top_karma_members('1'))[:2] == [('1', 4), ('2', 2)]
+        assert member_ids(self.karma_service.aggregate_top_karma_members('1', '1')) == [('1', 3), ('2', 2)]
+        assert member_ids(self.karma_service.aggregate_top_karma_members('1', time_span=1))[:2] == \
+            [('1', 4), ('2', 2)]
+        assert member_ids(self.karma_service.aggregate_karma_page('1', after=(4, '1'), size=1)) == [('2', 2)]
+        assert self.karma_service.member_rank(KarmaMember('1', '2')) == (2, 2)
+        assert self.karma_service.member_rank(KarmaMember('1', '2', '1')) == (2, 2)
+        assert [(document['_id']['channel_id'], document['karma']) for document in
+                self.karma_service.aggregate_member_by_channels(KarmaMember('1', '1'))] == [('1', 3), ('2', 1)]
+        assert self.karma_service.aggregate_member_profile(KarmaMember('1', '1'), 1)['karma'] == 4
+
+    def test_top_channels(self):
+        channels = [(document['_id']['channel_id'], document['karma'])
+                    for document in self.channel_service.aggregate_top_karma_channels('1')]
+        assert channels == [('1', 5), ('2', 3)]
+        assert self.channel_service.aggregate_top_karma_channels('1', 1) == \
+            self.channel_service.aggregate_top_karma_channels('1')
+        self.karma_service.upsert_karma_member(KarmaMember('1', '1', '3', 20))
+        assert len(self.channel_service.aggregate_top_karma_channels('1')) == 3
+
+    def test_blacklist(self):
+        self.blocker_service.blacklist(Member('1', '5'))
+        self.blocker_service.blacklist(Member('1', '5'))
+        assert self.blocker_service.find_member(Member('1', '5')) is not None
+        assert self.blocker_service.find_member(Member('2', '5')) is None
+        assert self.blocker_service.find_all_blacklisted('1') == [dict(member_id='5')]
+        self.blocker_service.whitelist(Member('1', '5'))
+        assert self.blocker_service.find_member(Member('1', '5')) is None
+
+    def test_stream_and_import_round_trip(self):
+        documents = list(self.karma_service.stream_karma('1', batch_size=3))
+        assert len(documents) == 8
+        karma_service = type(self).engine()[0]
+        # importing twice replaces the documents instead of doubling the karma
+        for _ in range(2):
+            assert karma_service.import_karma(documents) == 8
+        karma_service.rebuild_karma_totals('1')
+        karma_service.rebuild_daily_karma('1')
+        assert karma_service.aggregate_members_by_karma('1', ['1', '2', '3', '4']) == \
+            {'1': 4, '2': 2, '3': 1, '4': 1}
+        assert member_ids(karma_service.aggregate_top_karma_members('1', time_span=1))[:2] == [('1', 4), ('2', 2)]
+
+    def test_old_karma_stays_out_of_recent_leaderboards(self):
+        old = dict(guild_id='3', member_id='1', channel_id='1', message_id='30', karma=5,
+                   created_date=datetime.datetime.utcnow() - datetime.timedelta(days=10))
+        self.karma_service.import_karma([old])
+        self.karma_service.rebuild_karma_totals('3')
+        self.karma_service.rebuild_daily_karma('3')
+        assert member_ids(self.karma_service.aggregate_top_karma_members('3')) == [('1', 5)]
+        assert member_ids(self.karma_service.aggregate_top_karma_members('3', time_span=7)) == []
+        assert member_ids(self.karma_service.aggregate_top_karma_members('3', time_span=11)) == [('1', 5)]
+
+
+class MongoStorage(StorageBehaviour, unittest.TestCase):
+    engine = staticmethod(mongo_engine)
+
+
+class MemoryStorage(StorageBehaviour, unittest.TestCase):
+    engine = staticmethod(memory_engine)
+
+
+class SqliteStorage(StorageBehaviour, unittest.TestCase):
+    engine = staticmethod(sqlite_engine)
@@ -0,0 +1,70 @@
+import unittest
+from unittest import mock
+
+from core.throttle import KarmaThrottle
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+# Verify that karma messages over the guild and giver limits are dropped and noticed once per interval
+class Throttle(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 100.0
+        patcher = mock.patch('core.throttle.time.monotonic', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.throttle = KarmaThrottle()
+
+    def allow(self, guild_id, giver_id, guild_rate=5, guild_burst=4, giver_rate=1, giver_burst=2):
+        return self.throttle.allow(guild_id, giver_id, guild_rate, guild_burst, giver_rate, giver_burst)
+
+    def test_giver_limited_before_guild(self):
+        assert [self.allow(1, 1) for _ in range(3)] == [True, True, False]
+        # the dropped message didn't use a token of the guild
+        assert [self.allow(1, 2) for _ in range(2)] == [True, True]
+        assert not self.allow(1, 3)
+        assert self.allow(2, 1)
+        snapshot = self.throttle.metrics.snapshot()
+        assert snapshot['giver_throttled'] >= 1 and snapshot['guild_throttled'] >= 1
+
+    def test_tokens_refill(self):
+        assert [self.allow(1, 1) for _ in range(3)] == [True, True, False]
+        self.now += 1
+        assert [self.allow(1, 1) for _ in range(2)] == [True, False]
+
+    def test_zero_rate_disables_limit(self):
+        assert all(self.allow(1, 1, guild_rate=0, giver_rate=0) for _ in range(100))
+
+    def test_notice_aggregates_dropped_messages(self):
+        assert self.throttle.notice(1, 30) == 0
+        for _ in range(5):
+            self.allow(1, 1)
+        assert self.throttle.notice(1, 30) == 3
+        self.allow(1, 1)
+        # one notice per interval, the dropped message is counted for the next one
+        assert self.throttle.notice(1, 30) == 0
+        self.now += 30
+        assert self.throttle.notice(1, 30) == 1
+
+    def test_full_buckets_pruned(self):
+        self.allow(1, 1)
+        self.allow(1, 2)
+        self.now += 1
+        self.allow(1, 2)
+        self.allow(1, 2)
+        self.now += 1
+        assert self.throttle.prune(5, 4, 1, 2) == 2
+        assert list(self.throttle._givers) == [(1, 2)]
+
+    def test_due_notices_report_drops_after_burst(self):
+        for _ in range(4):
+            self.allow(1, 1)
+        assert self.throttle.notice(1, 30) == 2
+        # the burst ends with one more drop, no further message triggers a notice
+        self.allow(1, 1)
+        assert self.throttle.due_notices(30) == []
+        self.now += 30
+        assert self.throttle.due_notices(30) == [(1, 1)]
+        assert self.throttle.due_notices(30) == []
@@ -0,0 +1,68 @@
+import io
+import unittest
+
+import mongomock
+
+from core.model.member import KarmaMember, Member
+from core.service.mongo_service import KarmaMemberService, BlockerService
+from core.service.transfer_service import TransferService
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+def transfer_service(database, batch_size=2):
+    return TransferService(KarmaMemberService(database.karma), BlockerService(database.blacklist), batch_size)
+
+
+# Verify that an export imported into another database gives the same karma, blacklist and totals
+class GuildTransfer(unittest.TestCase):
+
+    def setUp(self):
+        self.source = mongomock.MongoClient().source
+        self.target = mongomock.MongoClient().target
+        karma_service = KarmaMemberService(self.source.karma)
+        for message_id, (member_id, channel_id) in enumerate([('1', '1'), ('1', '2'), ('2', '1'), ('3', '1')]):
+            karma_service.upsert_karma_member(KarmaMember('1', member_id, channel_id, message_id))
+        karma_service.upsert_karma_member(KarmaMember('2', '1', '1', 10))
+        blocker_service = BlockerService(self.source.blacklist)
+        blocker_service.blacklist(Member('1', '4'))
+        blocker_service.blacklist(Member('2', '5'))
+
+    def transfer(self, file_format, guild_id=None):
+        stream = io.StringIO()
+        counts = transfer_service(self.source).export_guild('1', stream, file_format)
+        assert counts == dict(karma=4, blacklist=1)
+        stream.seek(0)
+        progress = []
+        counts = transfer_service(self.target).import_guild(stream, file_format, guild_id, progress.append)
+        assert counts == dict(karma=4, blacklist=1)
+        # one progress report per batch of two documents
+        assert progress == [dict(karma=2, blacklist=0), dict(karma=4, blacklist=0), dict(karma=4, blacklist=1)]
+
+    def documents(self, collection, guild_id):
+        return sorted((sorted(doc.items()) for doc in collection.find(dict(guild_id=guild_id), dict(_id=False))))
+
+    def test_ndjson_round_trip(self):
+        self.transfer('ndjson')
+        assert self.documents(self.target.karma, '1') == self.documents(self.source.karma, '1')
+        assert self.documents(self.target.blacklist, '1') == self.documents(self.source.blacklist, '1')
+        assert self.documents(self.target.karma_totals, '1') == self.documents(self.source.karma_totals, '1')
+        assert self.documents(self.target.karma_daily, '1') == self.documents(self.source.karma_daily, '1')
+        assert self.target.karma.count_documents(dict(guild_id='2')) == 0
+
+    def test_csv_round_trip_into_other_guild(self):
+        self.transfer('csv', guild_id='3')
+        karma_service = KarmaMemberService(self.target.karma)
+        assert karma_service.aggregate_members_by_karma('3', ['1', '2', '3']) == {'1': 2, '2': 1, '3': 1}
+        assert BlockerService(self.target.blacklist).find_member(Member('3', '4')) is not None
+
+    def test_import_twice_replaces_documents(self):
+        self.transfer('ndjson')
+        self.transfer('ndjson')
+        assert self.target.karma.count_documents({}) == 4
+        assert KarmaMemberService(self.target.karma).aggregate_member_by_karma(KarmaMember('1', '1')) == 2
+
+    def test_invalid_export_rejected(self):
+        with self.assertRaises(ValueError):
+            transfer_service(self.target).import_guild(io.StringIO('{"collection": "users"}\n'))
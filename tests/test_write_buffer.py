@@ -0,0 +1,111 @@
+import unittest
+from unittest import mock
+
+import mongomock
+from pymongo.errors import AutoReconnect
+
+from core.model.member import KarmaMember
+from core.service.mongo_service import KarmaMemberService
+from core.service.write_buffer import KarmaWriteBuffer
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+# Verify that buffered karma gains are coalesced, flushed and visible to reads
+class WriteBehind(unittest.TestCase):
+
+    def setUp(self):
+        database = mongomock.MongoClient().db
+        self.karma = database.karma
+        self.write_buffer = KarmaWriteBuffer(database.karma, database.karma_totals, database.karma_daily,
+                                             max_operations=3)
+        self.karma_service = KarmaMemberService(database.karma, database.karma_totals, database.karma_daily,
+                                                self.write_buffer)
+
+    def test_gains_flushed_when_full(self):
+        for message_id in range(2):
+            self.karma_service.upsert_karma_member(KarmaMember('1', '1', '1', message_id))
+        assert self.karma.count_documents({}) == 0
+        self.karma_service.upsert_karma_member(KarmaMember('1', '2', '1', 2))
+        assert self.karma.count_documents({}) == 3
+        assert len(self.write_buffer) == 0
+        assert self.write_buffer.metrics.snapshot()['flush_size_max'] == 3
+
+    def test_reads_see_pending_gains(self):
+        self.karma_service.upsert_karma_member(KarmaMember('1', '1', '1', '1'))
+        assert self.karma_service.find_message('1') is not None
+        assert self.karma.count_documents({}) == 0
+        assert self.karma_service.aggregate_member_by_karma(KarmaMember('1', '1')) == 1
+        assert self.karma.count_documents({}) == 1
+
+    def test_gain_and_removal_coalesced(self):
+        self.karma_service.upsert_karma_member(KarmaMember('1', '1', '1', '1'))
+        self.karma_service.upsert_karma_member(KarmaMember('1', '1', '1', '2'))
+        assert self.karma_service.delete_single_karma(KarmaMember('1', '1', '1', '1')).deleted_count == 1
+        assert self.karma_service.flush() == 1
+        assert self.karma_service.aggregate_member_by_karma(KarmaMember('1', '1')) == 1
+        assert self.karma_service.find_message('1') is None
+
+    def test_message_removal_covers_pending_and_written_karma(self):
+        self.karma_service.upsert_karma_member(KarmaMember('1', '1', '1', '1'))
+        self.karma_service.flush()
+        self.karma_service.upsert_karma_member(KarmaMember('1', '2', '1', '1'))
+        assert sorted(self.karma_service.delete_message_karma('1', '1')) == ['1', '2']
+        assert self.karma_service.flush() == 0
+        assert self.karma_service.aggregate_members_by_karma('1', ['1', '2']) == {'1': 0, '2': 0}
+
+    def test_reset_discards_pending_gains(self):
+        self.karma_service.upsert_karma_member(KarmaMember('1', '1', '1', '1'))
+        self.karma_service.delete_all_karma(KarmaMember('1', '1'))
+        assert self.karma_service.flush() == 0
+        assert self.karma_service.aggregate_member_by_karma(KarmaMember('1', '1')) is None
+
+
+# Verify that a failed flush keeps what it didn't write and the next flush writes it exactly once
+class FailedFlush(unittest.TestCase):
+
+    def setUp(self):
+        database = mongomock.MongoClient().db
+        self.karma, self.totals, self.daily = database.karma, database.karma_totals, database.karma_daily
+        self.write_buffer = KarmaWriteBuffer(self.karma, self.totals, self.daily, max_operations=100)
+        self.karma_service = KarmaMemberService(self.karma, self.totals, self.daily, self.write_buffer)
+        for member_id in ['1', '2']:
+            self.karma_service.upsert_karma_member(KarmaMember('1', member_id, '1', '1'))
+
+    def fail(self, collection, write_first: bool = False):
+        bulk_write = collection.bulk_write
+
+        def failing_bulk_write(*args, **kwargs):
+            if write_first:
+                bulk_write(*args, **kwargs)
+            raise AutoReconnect('connection lost')
+        return mock.patch.object(collection, 'bulk_write', side_effect=failing_bulk_write)
+
+    def test_failed_karma_write_kept(self):
+        with self.fail(self.karma), self.assertRaises(AutoReconnect):
+            self.karma_service.flush()
+        assert len(self.write_buffer) == 2
+        assert self.karma_service.flush() == 2
+        assert self.karma.count_documents({}) == 2
+        assert self.karma_service.aggregate_members_by_karma('1', ['1', '2']) == {'1': 1, '2': 1}
+        assert self.write_buffer.metrics.snapshot()['failed_flushes'] == 1
+
+    def test_failed_totals_write_retried_once(self):
+        with self.fail(self.totals), self.assertRaises(AutoReconnect):
+            self.karma_service.flush()
+        assert len(self.write_buffer) == 0 and self.karma.count_documents({}) == 2
+        # the pending increments make reads flush first
+        assert self.karma_service.aggregate_member_by_karma(KarmaMember('1', '1')) == 1
+        assert self.karma.count_documents({}) == 2
+        assert self.totals.find_one(dict(guild_id='1', member_id='2', channel_id=''))['karma'] == 1
+        assert self.daily.count_documents({}) == 2
+
+    def test_removal_after_failed_flush_deletes_written_documents(self):
+        with self.fail(self.karma, write_first=True), self.assertRaises(AutoReconnect):
+            self.karma_service.flush()
+        assert self.karma.count_documents({}) == 2
+        assert self.karma_service.delete_single_karma(KarmaMember('1', '1', '1', '1')).deleted_count == 1
+        assert self.karma_service.flush() == 1
+        assert self.karma_service.aggregate_members_by_karma('1', ['1', '2']) == {'1': 0, '2': 1}
+        assert self.karma.count_documents({}) == 1
@@ -0,0 +1,61 @@
+"""
+export the karma and blacklist of a guild into a file or import such a file, e.g. to move a guild to
+another database or to back it up. uses the database of config.yaml.
+
+    python transfer.py export <guild_id> aura.ndjson
+    python transfer.py import aura.csv --guild <guild_id>
+"""
+import argparse
+import logging
+import sys
+
+from core import datasource
+from core.service.mongo_service import KarmaMemberService, BlockerService
+from core.service.transfer_service import TransferService, file_formats
+from util.config import load_config
+
+
+def file_format_of(path: str, file_format: str) -> str:
+    return file_format if file_format is not None else path.rsplit('.', 1)[-1].lower()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='export or import the karma and blacklist of a guild')
+    parser.add_argument('--batch-size', type=int, default=1000, help='documents per round trip')
+    parser.add_argument('--format', choices=file_formats, help='file format, by default the file extension')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    export_parser = subparsers.add_parser('export', help='export a guild into a file')
+    export_parser.add_argument('guild', help='id of the guild to export')
+    export_parser.add_argument('file', help='file to write, - for stdout')
+    import_parser = subparsers.add_parser('import', help='import an export into the database')
+    import_parser.add_argument('file', help='file to read, - for stdin')
+    import_parser.add_argument('--guild', help='id of the guild the export is moved to, by default the exported one')
+    args = parser.parse_args()
+
+    load_config()
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    transfer_service = TransferService(KarmaMemberService(datasource.karma(), datasource.karma_totals(),
+                                                          datasource.karma_daily()),
+                                       BlockerService(datasource.blacklist()), args.batch_size)
+    file_format = file_format_of(args.file, args.format)
+    if file_format not in file_formats:
+        parser.error(f'unknown format {file_format}, use --format')
+
+    try:
+        if args.command == 'export':
+            with (sys.stdout if args.file == '-' else open(args.file, 'w', encoding='utf-8', newline='')) as stream:
+                counts = transfer_service.export_guild(args.guild, stream, file_format)
+        else:
+            def progress(counts):
+                print(f'imported {counts["karma"]} karma and {counts["blacklist"]} blacklist documents',
+                      file=sys.stderr)
+
+            with (sys.stdin if args.file == '-' else open(args.file, 'r', encoding='utf-8', newline='')) as stream:
+                counts = transfer_service.import_guild(stream, file_format, args.guild, progress)
+    finally:
+        datasource.close()
+    print(f'{args.command}ed {counts["karma"]} karma and {counts["blacklist"]} blacklist documents', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,181 @@
 from copy import deepcopy
+from dataclasses import dataclass, field
+from typing import Optional
 
 import yaml
 
+from util.thanks import ThanksMatcher
 
-def read_config():
-    with open("config.yaml", 'r') as stream:
+
+def read_config(path: str = 'config.yaml'):
+    with open(path, 'r') as stream:
         return yaml.safe_load(stream)
 
 
-config = read_config()
+config = {}  # filled by load_config, modules keep a reference to this dict
+descriptions = {}  # configuration key to ConfigDescription, filled by load_config
+
+
+@dataclass(frozen=True)
+class KarmaSettings:
+    edit: bool
+    emote: bool
+    log: bool
+    message: bool
+    self_delete: bool
+    time_emote: bool
+    time_message: bool
+    keywords: str
+    matcher: ThanksMatcher = field(compare=False, repr=False)
+
+
+@dataclass(frozen=True)
+class BlacklistSettings:
+    contact: str
+    dm: bool
+    emote: bool
+
+
+@dataclass(frozen=True)
+class EmojiSettings:
+    karma_blacklist: str
+    karma_cooldown: str
+    karma_delete: str
+    karma_gain: str
+
+
+@dataclass(frozen=True)
+class ThrottleSettings:
+    giver_burst: float
+    giver_rate: float  # 0 disables the limit
+    guild_burst: float
+    guild_rate: float  # 0 disables the limit
+    notice: float
+
+
+@dataclass(frozen=True)
+class Settings:
+    # typed snapshot of the configuration read by the hot paths, a change of the configuration builds a new
+    # snapshot and swaps it, so a reader never sees half of a change and never parses strings.
+    prefix: str
+    owner: Optional[int]
+    cooldown: int
+    leaderboard: int
+    profile_channels: int
+    log_channel: Optional[int]
+    karma: KarmaSettings
+    blacklist: BlacklistSettings
+    emoji: EmojiSettings
+    throttle: ThrottleSettings
+
+
+_settings: Optional[Settings] = None  # swapped as a whole by apply_config
+
+
+def _bool(section: dict, key: str) -> bool:
+    value = section.get(key)
+    if value is None or isinstance(value, bool):
+        return bool(value)
+    if str(value).strip().lower() not in ['true', 'false']:
+        raise ValueError(f'{key} has to be true or false, not {value}')
+    return str(value).strip().lower() == 'true'
+
+
+def _number(section: dict, key: str, cast=int, default=None):
+    value = section.get(key)
+    if value is None or str(value).strip() == '':
+        if default is None:
+            raise ValueError(f'{key} is missing')
+        return default
+    try:
+        number = cast(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{key} has to be a number, not {value}')
+    if number < 0:
+        raise ValueError(f'{key} can\'t be negative')
+    return number
+
+
+def _optional_id(value) -> Optional[int]:
+    if value is None or str(value).strip() == '':
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{value} is not a discord id')
+
+
+def build_settings(configuration: dict) -> Settings:
+    """
+    parse a configuration into a typed snapshot, every value is checked once here instead of on every use.
+    :param configuration: configuration as read from config.yaml
+    :return: Settings
+    :raises ValueError: if a value has the wrong type
+    """
+    karma_config = configuration['karma']
+    blacklist_config = configuration['blacklist']
+    emoji_config = configuration['emoji']
+    throttle_config = configuration.get('throttle') or {}
+    return Settings(
+        prefix=str(configuration['prefix']),
+        owner=_optional_id(configuration.get('owner')),
+        cooldown=_number(configuration, 'cooldown'),
+        leaderboard=_number(configuration, 'leaderboard'),
+        profile_channels=_number(configuration['profile'], 'channels'),
+        log_channel=_optional_id((configuration.get('channel') or {}).get('log')),
+        karma=KarmaSettings(edit=_bool(karma_config, 'edit'), emote=_bool(karma_config, 'emote'),
+                            log=_bool(karma_config, 'log'), message=_bool(karma_config, 'message'),
+                            self_delete=_bool(karma_config, 'self_delete'),
+                            time_emote=_bool(karma_config, 'time_emote'),
+                            time_message=_bool(karma_config, 'time_message'),
+                            keywords=str(karma_config['keywords']),
+                            matcher=ThanksMatcher(str(karma_config['keywords']))),
+        blacklist=BlacklistSettings(contact=str(blacklist_config.get('contact')), dm=_bool(blacklist_config, 'dm'),
+                                    emote=_bool(blacklist_config, 'emote')),
+        emoji=EmojiSettings(**{key: str(emoji_config[key]) for key in
+                               ['karma_blacklist', 'karma_cooldown', 'karma_delete', 'karma_gain']}),
+        # a configuration without throttle section isn't throttled
+        throttle=ThrottleSettings(giver_burst=_number(throttle_config, 'giver_burst', float, 1.0),
+                                  giver_rate=_number(throttle_config, 'giver_rate', float, 0.0),
+                                  guild_burst=_number(throttle_config, 'guild_burst', float, 1.0),
+                                  guild_rate=_number(throttle_config, 'guild_rate', float, 0.0),
+                                  notice=_number(throttle_config, 'notice', float, 30.0)))
+
+
+def settings() -> Settings:
+    """
+    the current configuration snapshot, read it once per event and use its attributes
+    :return: Settings
+    """
+    return _settings
+
+
+def apply_config(configuration: dict) -> Settings:
+    """
+    make a configuration the current one, nothing changes if it is invalid.
+    :param configuration: the new configuration
+    :return: the new snapshot
+    :raises ValueError: if a value has the wrong type
+    """
+    global _settings
+    snapshot = build_settings(configuration)
+    if configuration is not config:
+        config.clear()
+        config.update(configuration)
+    descriptions.clear()
+    descriptions.update(build_descriptions())
+    _settings = snapshot
+    return snapshot
+
+
+def load_config() -> dict:
+    """
+    read config.yaml into the module level config, nothing is read on import.
+    the dicts are updated in place, so every module importing them sees the loaded values.
+    :return: the loaded configuration
+    """
+    apply_config(read_config())
+    return config
 
 
 def write_config():
@@ -47,11 +214,6 @@ def reaction_emoji():
 
 max_message_length = 500
 
-karma_gain_emoji = reaction_emoji()['karma_gain']  # used to indicate positive karma gain
-karma_delete_emoji = reaction_emoji()['karma_delete']  # used to indicate that karma gain can be reverted by the user
-karma_cooldown_emoji = reaction_emoji()['karma_cooldown']  # used to indicate cooldown periods
-karma_blacklist_emoji = reaction_emoji()['karma_blacklist']  # used to indicate that user is blacklisted
-
 
 class ConfigDescription:
     def __init__(self, description, values=None):
@@ -62,53 +224,75 @@ class ConfigDescription:
         self.description: str = description  # 'which channel aura should log karma gain, removals and other messages'
 
 
-descriptions = deepcopy(config)
-descriptions['blacklist']['emote'] = ConfigDescription('if aura should react with the configured emoji '
-                                                       + 'on blacklisted giver messages')
-descriptions['blacklist']['dm'] = ConfigDescription('if aura should dm the blacklisted member that he is blacklisted'
-                                                    + ', if this is set you have to change blacklist contact')
-descriptions['blacklist']['contact'] = ConfigDescription('who to mention in the blacklist dm to contact for the user'
-                                                         + ' to resolve his blacklist', ['Any String'])
-descriptions['karma']['emote'] = ConfigDescription('if aura should react with the configured emoji on karma gain')
-descriptions['karma']['log'] = ConfigDescription('if aura should log karma gain messages')
-descriptions['karma']['message'] = ConfigDescription('if aura should respond with a mention message'
-                                                     + ' right where the karma gain happened')
-descriptions['karma']['time-emote'] = ConfigDescription('if aura should react with the configured emoji '
-                                                        + 'if the giver-receiver '
-                                                        + ' combination is'
-                                                        + ' on cooldown')
-descriptions['karma']['time-message'] = ConfigDescription('if aura should send a cooldown message in the channel of'
-                                                          + ' the attempted karma message')
-descriptions['karma']['keywords'] = ConfigDescription('the karma keyword list to check messages for',
-                                                      ['thanks,ty,thank you'])
-descriptions['karma']['edit'] = ConfigDescription('whether aura should track message edits for karma gain / deletion'
-                                                  + '\n' + 'currently only supports' +
-                                                  ' messages that were karma messages before but aren\'t'
-                                                  + ' after the edit or'
-                                                  + ' become karma messages after the edit but weren\'t before'
-                                                  )
-descriptions['karma']['self_delete'] = ConfigDescription('if aura should allow the self deletion of karma, also ' +
-                                                         'disables karma deletion emoji')
-descriptions['profile']['channels'] = ConfigDescription('how many top channels to include in profile',
-                                                        ['Any positive number including 0'])
-
-descriptions['roles']['admin'] = ConfigDescription('admin role can change configuration and do all of the'
-                                                   + 'commands', ['Admin'])
-
-descriptions['roles']['moderator'] = ConfigDescription('staff role can do anything but configure the bot',
-                                                       ['Staff'])
-
-descriptions['cooldown'] = ConfigDescription('Cooldown applied to karma thanks message in seconds',
-                                             ['Any positive number including 0'])
-
-descriptions['channel']['log'] = ConfigDescription('which channel to post log messages to',
-                                                   ['Any channel id'])
-
-descriptions['emoji']['karma_gain'] = ConfigDescription('Emoji to show for when a user gives out karma',
-                                                        [':emoji_name:', 'unicode emoji'])
-descriptions['emoji']['karma_delete'] = ConfigDescription('Emoji to show for self deletion of karma',
-                                                          [':emoji_name:', 'unicode emoji'])
-descriptions['emoji']['karma_cooldown'] = ConfigDescription('Emoji to show for active cooldowns on karma giving',
+def build_descriptions() -> dict:
+    """
+    build the descriptions of the configuration keys shown by the config help command
+    :return: configuration key to ConfigDescription
+    """
+    descriptions = deepcopy(config)
+    descriptions['blacklist']['emote'] = ConfigDescription('if aura should react with the configured emoji '
+                                                           + 'on blacklisted giver messages')
+    descriptions['blacklist']['dm'] = ConfigDescription('if aura should dm the blacklisted member that he is '
+                                                        + 'blacklisted, if this is set you have to change '
+                                                        + 'blacklist contact')
+    descriptions['blacklist']['contact'] = ConfigDescription('who to mention in the blacklist dm to contact for the'
+                                                             + ' user to resolve his blacklist', ['Any String'])
+    descriptions['karma']['emote'] = ConfigDescription('if aura should react with the configured emoji on karma gain')
+    descriptions['karma']['log'] = ConfigDescription('if aura should log karma gain messages')
+    descriptions['karma']['message'] = ConfigDescription('if aura should respond with a mention message'
+                                                         + ' right where the karma gain happened')
+    descriptions['karma']['time_emote'] = ConfigDescription('if aura should react with the configured emoji '
+                                                            + 'if the giver-receiver '
+                                                            + ' combination is'
+                                                            + ' on cooldown')
+    descriptions['karma']['time_message'] = ConfigDescription('if aura should send a cooldown message in the channel of'
+                                                              + ' the attempted karma message')
+    descriptions['karma']['keywords'] = ConfigDescription('the karma keyword list to check messages for',
+                                                          ['thanks,ty,thank you'])
+    descriptions['karma']['edit'] = ConfigDescription('whether aura should track message edits for karma gain'
+                                                      + ' / deletion\n' + 'currently only supports' +
+                                                      ' messages that were karma messages before but aren\'t'
+                                                      + ' after the edit or'
+                                                      + ' become karma messages after the edit but weren\'t before'
+                                                      )
+    descriptions['karma']['self_delete'] = ConfigDescription('if aura should allow the self deletion of karma, also ' +
+                                                             'disables karma deletion emoji')
+    descriptions['profile']['channels'] = ConfigDescription('how many top channels to include in profile',
+                                                            ['Any positive number including 0'])
+
+    descriptions['roles']['admin'] = ConfigDescription('admin role can change configuration and do all of the'
+                                                       + 'commands', ['Admin'])
+
+    descriptions['roles']['moderator'] = ConfigDescription('staff role can do anything but configure the bot',
+                                                           ['Staff'])
+
+    descriptions['cooldown'] = ConfigDescription('Cooldown applied to karma thanks message in seconds',
+                                                 ['Any positive number including 0'])
+
+    descriptions['channel']['log'] = ConfigDescription('which channel to post log messages to',
+                                                       ['Any channel id'])
+
+    if 'throttle' in descriptions:
+        descriptions['throttle']['guild_rate'] = ConfigDescription('karma messages per second a guild regains after'
+                                                                   + ' the burst is used up, 0 disables the limit',
+                                                                   ['Any positive number including 0'])
+        descriptions['throttle']['guild_burst'] = ConfigDescription('karma messages a guild can send at once',
+                                                                    ['Any positive number'])
+        descriptions['throttle']['giver_rate'] = ConfigDescription('karma messages per second a member regains after'
+                                                                   + ' the burst is used up, 0 disables the limit',
+                                                                   ['Any positive number including 0'])
+        descriptions['throttle']['giver_burst'] = ConfigDescription('karma messages a member can send at once',
+                                                                    ['Any positive number'])
+        descriptions['throttle']['notice'] = ConfigDescription('seconds between two notices about ignored karma'
+                                                               + ' messages in a guild',
+                                                               ['Any positive number'])
+
+    descriptions['emoji']['karma_gain'] = ConfigDescription('Emoji to show for when a user gives out karma',
                                                             [':emoji_name:', 'unicode emoji'])
-descriptions['emoji']['karma_blacklist'] = ConfigDescription('Emoji to show to blacklisted members',
-                                                             [':emoji_name:', 'unicode emoji'])
+    descriptions['emoji']['karma_delete'] = ConfigDescription('Emoji to show for self deletion of karma',
+                                                              [':emoji_name:', 'unicode emoji'])
+    descriptions['emoji']['karma_cooldown'] = ConfigDescription('Emoji to show for active cooldowns on karma giving',
+                                                                [':emoji_name:', 'unicode emoji'])
+    descriptions['emoji']['karma_blacklist'] = ConfigDescription('Emoji to show to blacklisted members',
+                                                                 [':emoji_name:', 'unicode emoji'])
+    return descriptions
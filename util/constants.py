@@ -2,15 +2,16 @@ from collections import defaultdict
 
 from discord import Color
 
-from util.config import karma_delete_emoji
-
 zero_width_space: str = '\u200b'
 revoke_message = 'If you {}, didn\'t intend to give karma to this person,' + \
-                 ' react to the' + karma_delete_emoji + 'of your original thanks message'
-leaderboard_usage = '{}leaderboard\n{}leaderboard <#channel_mention>' \
-                    '\n{}leaderboard (global) (days) \n' \
-                    '{}leaderboard ' \
-                    '<#channel_mention> (days)'
+                 ' react to the {} of your original thanks message'
+# usage strings contain {prefix}, which is formatted with the configured prefix when they are shown
+leaderboard_usage = '{prefix}leaderboard\n{prefix}leaderboard <#channel_mention>' \
+                    '\n{prefix}leaderboard (global) (days) \n' \
+                    '{prefix}leaderboard ' \
+                    '<#channel_mention> (days)\n' \
+                    '{prefix}leaderboard (global) page <page>\n' \
+                    '{prefix}leaderboard <#channel_mention> page <page>'
 embed_max_columns = 3  # 3 because discord embeds can have three fields in a line
 embed_color = Color.dark_gold()
 bold_field = "**{}**"
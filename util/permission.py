@@ -1,14 +1,23 @@
 import yaml
 
+permission_map = {}  # command name to role name, filled by load_permissions
 
-def load_permissions():
+
+def read_permissions():
     with open("resources/permission.yaml", 'r') as stream:
         return yaml.safe_load(stream)
 
 
+def load_permissions() -> dict:
+    """
+    read resources/permission.yaml into the module level permission_map, nothing is read on import.
+    :return: the loaded permissions
+    """
+    permission_map.clear()
+    permission_map.update(read_permissions())
+    return permission_map
+
+
 def write_permissions():
     with open("resources/permission.yaml", 'w') as stream:
         yaml.safe_dump(permission_map, stream)
-
-
-permission_map = load_permissions()  # command name to role name
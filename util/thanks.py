@@ -0,0 +1,49 @@
+import re
+from typing import List
+
+
+class ThanksMatcher:
+    # matcher for the configured karma keywords, built once per keyword configuration.
+    # all keywords are combined into a single alternation, so a message is scanned once,
+    # the quote and greentext exclusions are resolved on the matched positions instead of separate patterns.
+    def __init__(self, keywords: str):
+        self.keywords = keywords
+        self._thanks: List[str] = [thanks.strip() for thanks in keywords.split(',') if thanks.strip() != '']
+        # longest keywords first, so 'thank you' is preferred over a configured 'thank'
+        alternation = '|'.join(re.escape(thanks) for thanks in sorted(self._thanks, key=len, reverse=True))
+        self._pattern = re.compile(r'\b(?:{})\b'.format(alternation), re.IGNORECASE) if alternation else None
+
+    def matches(self, message: str) -> bool:
+        """
+        check if the message contains at least one keyword that is neither quoted nor greentext.
+        a keyword is invalid as soon as one of its (case sensitive) occurrences is quoted or greentext.
+        :param message: message.content of a discord.Message
+        :return: True if message has a valid keyword, False if not.
+        """
+        if self._pattern is None:
+            return False
+        found = set()
+        excluded = set()
+        for match in self._pattern.finditer(message):
+            thanks = match.group(0)
+            found.add(thanks.lower())
+            if thanks in self._thanks and self._is_excluded(message, match.start(), match.end()):
+                excluded.add(thanks.lower())
+        return len(found - excluded) > 0
+
+    @staticmethod
+    def _is_excluded(message: str, start: int, end: int) -> bool:
+        """
+        check if the keyword between start and end is on a greentext line or enclosed in quotes on its line.
+        :param message: message.content of a discord.Message
+        :param start: start index of the keyword
+        :param end: end index of the keyword
+        :return: True if the keyword occurrence does not count as thanks
+        """
+        line_start = message.rfind('\n', 0, start) + 1
+        line_end = message.find('\n', end)
+        if line_end == -1:
+            line_end = len(message)
+        if message.startswith('> ', line_start):
+            return True
+        return '"' in message[line_start:start] and '"' in message[end:line_end]